@@ -2,6 +2,7 @@
 import os
 import sys
 import subprocess
+import hashlib
 import requests
 import stat
 
@@ -94,6 +95,53 @@ def download_script(script_type, save_path):
         print(f"❌ Download failed: {e}")
         return False
 
+# Hook scripts installed under .git/hooks, keyed by server script name
+INSTALLED_SCRIPTS = {
+    "analyzer": "git_guard_analyzer.py",
+    "indexer": "git_guard_indexer.py",
+}
+
+def file_sha256(path):
+    if not os.path.exists(path): return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def update_scripts():
+    """Compare local hook scripts with the server manifest; fetch only what changed"""
+    hooks_dir = os.path.join(".git", "hooks")
+    try:
+        resp = requests.get(f"{SERVER_URL}/api/v1/scripts/manifest", timeout=5)
+        if resp.status_code != 200:
+            print(f"❌ Server Error: {resp.status_code}")
+            return False
+        manifest = resp.json().get("scripts", {})
+    except Exception as e:
+        print(f"❌ Manifest fetch failed: {e}")
+        return False
+
+    ok = True
+    for script_type, filename in INSTALLED_SCRIPTS.items():
+        entry = manifest.get(script_type)
+        if not entry: continue
+        path = os.path.join(hooks_dir, filename)
+        if file_sha256(path) == entry["sha256"]:
+            print(f"✅ {filename} is up to date.")
+            continue
+        try:
+            # Content-addressed URL: gzip/br encoded and cacheable forever
+            resp = requests.get(f"{SERVER_URL}{entry['url']}", timeout=10)
+            if resp.status_code != 200 or hashlib.sha256(resp.content).hexdigest() != entry["sha256"]:
+                print(f"❌ Failed to fetch {filename} ({resp.status_code})")
+                ok = False
+                continue
+            with open(path, "wb") as f:
+                f.write(resp.content)
+            print(f"⬆️  Updated: {filename}")
+        except Exception as e:
+            print(f"❌ Update failed for {filename}: {e}")
+            ok = False
+    return ok
+
 def install():
     print(f"🔧 Git-Guard Installer v4.0 (Auto-Setup)")
     print(f"   Target Server: {SERVER_URL}")
@@ -108,10 +156,10 @@ def install():
 
     install_dependencies()
 
-    analyzer_path = os.path.join(hooks_dir, "git_guard_analyzer.py")
+    analyzer_path = os.path.join(hooks_dir, INSTALLED_SCRIPTS["analyzer"])
     dl_1 = download_script("analyzer", analyzer_path)
     
-    indexer_path = os.path.join(hooks_dir, "git_guard_indexer.py")
+    indexer_path = os.path.join(hooks_dir, INSTALLED_SCRIPTS["indexer"])
     dl_2 = download_script("indexer", indexer_path)
 
     if not (dl_1 and dl_2):
@@ -151,4 +199,6 @@ def install():
     print("   Your repo is now guarded.")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "update":
+        sys.exit(0 if update_scripts() else 1)
     install()
\ No newline at end of file
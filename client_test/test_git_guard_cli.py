@@ -59,6 +59,27 @@ class TestGitGuardCLI(unittest.TestCase):
         # 3. Check chmod execution (making scripts executable)
         self.assertTrue(mock_chmod.called)
 
+    @patch('git_guard_cli.requests.get')
+    @patch('git_guard_cli.file_sha256')
+    def test_update_scripts_fetches_only_changed(self, mock_hash, mock_get):
+        import hashlib
+        new_code = b"print('v2')"
+        new_hash = hashlib.sha256(new_code).hexdigest()
+        manifest = MagicMock(status_code=200)
+        manifest.json.return_value = {"scripts": {
+            "analyzer": {"sha256": new_hash, "url": f"/api/v1/scripts/analyzer/{new_hash}"},
+            "indexer": {"sha256": "same", "url": "/api/v1/scripts/indexer/same"},
+        }}
+        download = MagicMock(status_code=200, content=new_code)
+        mock_get.side_effect = [manifest, download]
+        mock_hash.side_effect = lambda path: "same" if "indexer" in path else "old"
+
+        with patch('builtins.open', new_callable=mock_open) as mock_file:
+            self.assertTrue(git_guard_cli.update_scripts())
+            mock_file().write.assert_called_once_with(new_code)
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertTrue(mock_get.call_args[0][0].endswith(new_hash))
+
     @patch('git_guard_cli.os.path.exists', return_value=False)
     def test_install_no_git_repo(self, mock_exists):
         # Should return early if .git doesn't exist
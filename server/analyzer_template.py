@@ -2,12 +2,26 @@
 import os
 import sys
 import re
+import json
+import time
+import struct
+import sqlite3
+import hashlib
+import threading
 import requests
 import chromadb
 from typing import List, Dict, Any
 from git import Repo
 from zai import ZhipuAiClient
 import getpass
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import fcntl  # POSIX only: one config agent per repo
+except ImportError:
+    fcntl = None
 
 # ==========================================
 # Config & Environment
@@ -24,6 +38,7 @@ if sys.platform == 'win32':
 SERVER_BASE_URL = "http://localhost:8000"
 CONFIG_URL = f"{SERVER_BASE_URL}/api/v1/config"
 TRACK_URL = f"{SERVER_BASE_URL}/api/v1/track"
+TRACK_BATCH_URL = f"{SERVER_BASE_URL}/api/v1/track/batch"
 
 API_KEY = os.getenv("ZHIPU_API_KEY")
 
@@ -35,6 +50,26 @@ except:
 
 GUARD_DIR = os.path.join(REPO_PATH, ".git_guard")
 DB_PATH = os.path.join(GUARD_DIR, "chroma_db")
+RULES_CACHE_PATH = os.path.join(GUARD_DIR, "rules_cache.json")
+REPORT_OUTBOX_PATH = os.path.join(GUARD_DIR, "report_outbox.ndjson")
+CONFIG_AGENT_LOCK_PATH = os.path.join(GUARD_DIR, "config_agent.lock")
+RAG_CACHE_PATH = os.path.join(GUARD_DIR, "rag_cache.json")
+EMBED_CACHE_PATH = os.path.join(GUARD_DIR, "embedding_cache.db")
+EMBED_MODEL = "embedding-3"
+RESULT_CACHE_PATH = os.path.join(GUARD_DIR, "result_cache.db")
+RERANK_CACHE_TTL_SECONDS = 24 * 3600
+RERANK_CACHE_MAX_ENTRIES = 2000
+LLM_MODEL = "glm-4-air"
+LLM_CACHE_TTL_SECONDS = 6 * 3600
+LLM_CACHE_MAX_ENTRIES = 200
+LLM_CACHE_ENABLED = os.getenv("GIT_GUARD_NO_LLM_CACHE", "").lower() not in ("1", "true", "yes")
+EMBED_BATCH_SIZE = 64  # inputs per embeddings request
+EMBED_QUERY_MAX_CHARS = 3000  # keeps a huge or minified diff within the embedding input limit
+RAG_MAX_WORKERS = 8  # files retrieved/reranked concurrently; each is a few network round-trips
+
+CONFIG_WATCH_SECONDS = 25           # long-poll window of the config agent
+CONFIG_AGENT_FRESH_SECONDS = 90     # agent-synced rules younger than this skip the network
+CONFIG_AGENT_LIFETIME_SECONDS = 8 * 3600  # restarted by the next commit after it exits
 
 EXT_TO_COLLECTION = {
     ".py": "repo_python", ".java": "repo_java", ".js": "repo_js",
@@ -46,18 +81,71 @@ EXT_TO_COLLECTION = {
 # Core Classes: Rerank & Retrieval
 # ==========================================
 
+class ResultCache:
+    """
+    Small JSON results in one SQLite table under .git_guard, expiring after
+    `ttl_seconds` and capped at the `max_entries` most recently stored.
+    """
+    def __init__(self, path: str, table: str, ttl_seconds: float, max_entries: int):
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()  # rerank runs in a thread pool: one connection per thread
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} "
+                         "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        try:
+            row = self._connect().execute(f"SELECT value FROM {self.table} WHERE key = ? AND stored_at >= ?",
+                                          (key, time.time() - self.ttl_seconds)).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception:
+            return None
+
+    def put(self, key: str, value):
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                             (key, json.dumps(value, ensure_ascii=False), time.time()))
+                conn.execute(f"DELETE FROM {self.table} WHERE stored_at < ? OR key IN (SELECT key FROM {self.table} "
+                             "ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                             (time.time() - self.ttl_seconds, self.max_entries))
+        except Exception: pass
+
 class Reranker:
     """Zhipu AI Semantic Reranker"""
     def __init__(self):
         self.url = "https://open.bigmodel.cn/api/paas/v4/rerank"
         self.model = "rerank-3"
         self.api_key = API_KEY
+        # Re-analysing the same diff (aborted or amended commit) skips the HTTPS call
+        self.cache = ResultCache(RESULT_CACHE_PATH, "rerank", RERANK_CACHE_TTL_SECONDS,
+                                 RERANK_CACHE_MAX_ENTRIES) if os.path.isdir(GUARD_DIR) else None
 
     def rerank(self, query: str, documents: List[Dict], top_k: int = 3) -> List[Dict]:
         if not self.api_key or not documents:
             return documents[:top_k]
 
         doc_texts = [doc.get("answer", "")[:2000] for doc in documents]
+        cache_key = ResultCache.make_key(self.model, query[:1000], top_k,
+                                         [[doc.get("id", ""), text] for doc, text in zip(documents, doc_texts)])
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached is not None:
+            return self._apply(documents, cached)
 
         payload = {
             "model": self.model,
@@ -75,31 +163,138 @@ class Reranker:
             response = requests.post(self.url, json=payload, headers=headers, timeout=5)
             if response.status_code == 200:
                 results = response.json().get('results', [])
-                reranked_docs = []
-                for item in results:
-                    original_idx = item['index']
-                    doc = documents[original_idx]
-                    doc['score'] = item['relevance_score']
-                    reranked_docs.append(doc)
+                ranking = [[item['index'], item['relevance_score']] for item in results]
+                reranked_docs = self._apply(documents, ranking)
+                if self.cache: self.cache.put(cache_key, ranking)
                 return reranked_docs
             else:
                 return documents[:top_k]
         except Exception:
             return documents[:top_k]
 
+    def _apply(self, documents: List[Dict], ranking: List[list]) -> List[Dict]:
+        reranked_docs = []
+        for original_idx, score in ranking:
+            doc = documents[original_idx]
+            doc['score'] = score
+            reranked_docs.append(doc)
+        return reranked_docs
+
+# ==========================================
+# Embedding Cache (same file and format in analyzer and indexer)
+# ==========================================
+class EmbeddingCache:
+    """
+    On-disk cache of embeddings keyed by (model, sha256(text)), stored as
+    packed float32 (or float16) in SQLite. Least recently used vectors are
+    evicted once the cache exceeds `max_bytes`.
+    """
+    FORMATS = {"float32": "f", "float16": "e"}
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, dtype: str = "float32"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, text_sha TEXT NOT NULL, "
+                "dtype TEXT NOT NULL, vec BLOB NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (model, text_sha))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_lru ON embeddings (last_used)")
+        return self._conn
+
+    @staticmethod
+    def text_key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Any]:
+        """Cached vector per text, None where missing"""
+        keys = [self.text_key(t) for t in texts]
+        found = {}
+        try:
+            conn = self._connect()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT text_sha, dtype, vec FROM embeddings WHERE model = ? AND text_sha IN ({','.join('?' * len(chunk))})",
+                    [model] + chunk).fetchall()
+                for text_sha, dtype, vec in rows:
+                    fmt = self.FORMATS[dtype]
+                    found[text_sha] = list(struct.unpack(f"<{len(vec) // struct.calcsize(fmt)}{fmt}", vec))
+            if found:
+                with conn:
+                    conn.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND text_sha = ?",
+                                     [(time.time(), model, k) for k in found])
+        except Exception:
+            found = {}  # a broken cache only costs API calls
+        result = [found.get(k) for k in keys]
+        self.hits += sum(1 for v in result if v is not None)
+        self.misses += sum(1 for v in result if v is None)
+        return result
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        fmt = self.FORMATS[self.dtype]
+        rows = [(model, self.text_key(t), self.dtype, struct.pack(f"<{len(v)}{fmt}", *v), time.time())
+                for t, v in zip(texts, vectors) if v]
+        if not rows: return
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO embeddings (model, text_sha, dtype, vec, last_used) "
+                                 "VALUES (?, ?, ?, ?, ?)", rows)
+            self.evict()
+        except Exception: pass
+
+    def evict(self):
+        """Drop least recently used vectors until the cache is within max_bytes"""
+        conn = self._connect()
+        total = conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes: return
+        excess = total - self.max_bytes * 0.9  # leave headroom so eviction isn't run on every put
+        victims, freed = [], 0
+        for rowid, size in conn.execute("SELECT rowid, LENGTH(vec) FROM embeddings ORDER BY last_used"):
+            if freed >= excess: break
+            victims.append((rowid,))
+            freed += size
+        with conn:
+            conn.executemany("DELETE FROM embeddings WHERE rowid = ?", victims)
+
+    def embed(self, model: str, texts: List[str], compute) -> List[List[float]]:
+        """Vectors for texts, calling compute(missing_texts) only for cache misses"""
+        cached = self.get_many(model, texts)
+        missing = [i for i, v in enumerate(cached) if v is None]
+        if missing:
+            computed = compute([texts[i] for i in missing])
+            self.put_many(model, [texts[i] for i in missing], computed)
+            for i, v in zip(missing, computed):
+                cached[i] = v
+        return cached
+
 class ZhipuEmbeddingFunction(chromadb.EmbeddingFunction):
     def __init__(self):
         self.api_key = API_KEY
         self.client = ZhipuAiClient(api_key=self.api_key)
+        # Shared with the indexer; only used once the indexer has created .git_guard
+        self.cache = EmbeddingCache(EMBED_CACHE_PATH) if os.path.isdir(GUARD_DIR) else None
     
     def __call__(self, input: List[str]) -> List[List[float]]:
         if not self.api_key: return [[]] * len(input)
         try:
-            response = self.client.embeddings.create(model="embedding-3", input=input)
-            return [data.embedding for data in response.data]
+            if self.cache is None: return self._embed(input)
+            return self.cache.embed(EMBED_MODEL, input, self._embed)
         except:
             return [[]] * len(input)
 
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(model=EMBED_MODEL, input=texts)
+        return [data.embedding for data in response.data]
+
 class Retrieval:
     def __init__(self):
         if not os.path.exists(DB_PATH):
@@ -109,32 +304,33 @@ class Retrieval:
         self.embedding_function = ZhipuEmbeddingFunction()
         self.vector_distance_max = 2.0
 
+    def _collection(self, collection_name: str):
+        return self.client.get_collection(name=collection_name, embedding_function=self.embedding_function)
+
+    def _hits(self, results, i: int = 0) -> List[Dict]:
+        hits = []
+        if results['ids'] and results['ids'][i]:
+            for j in range(len(results['ids'][i])):
+                dist = results['distances'][i][j]
+                score = 1 - min(dist / self.vector_distance_max, 1.0)
+                hits.append({
+                    "id": results['ids'][i][j],
+                    "answer": results['documents'][i][j],
+                    "metadata": results['metadatas'][i][j],
+                    "score": score,
+                    "source": "vector"
+                })
+        return hits
+
     def vector_retrieve(self, query: str, collection_name: str, top_k: int = 5) -> List[Dict]:
         if not self.client: return []
         try:
-            collection = self.client.get_collection(
-                name=collection_name, 
-                embedding_function=self.embedding_function
-            )
-            results = collection.query(query_texts=[query], n_results=top_k)
-            hits = []
-            if results['ids'] and results['ids'][0]:
-                for i in range(len(results['ids'][0])):
-                    dist = results['distances'][0][i]
-                    score = 1 - min(dist / self.vector_distance_max, 1.0)
-                    hits.append({
-                        "id": results['ids'][0][i],
-                        "answer": results['documents'][0][i],
-                        "metadata": results['metadatas'][0][i],
-                        "score": score,
-                        "source": "vector"
-                    })
-            return hits
+            results = self._collection(collection_name).query(query_texts=[query], n_results=top_k)
+            return self._hits(results)
         except Exception:
             return []
 
-    def hybrid_retrieve(self, query: str, collection_name: str, top_k: int = 5) -> List[Dict]:
-        vector_hits = self.vector_retrieve(query, collection_name, top_k=top_k * 2)
+    def _hybrid_rank(self, query: str, vector_hits: List[Dict], top_k: int) -> List[Dict]:
         keywords = set(query.split())
         for hit in vector_hits:
             code_content = hit["answer"]
@@ -145,11 +341,67 @@ class Retrieval:
         sorted_hits = sorted(vector_hits, key=lambda x: x["score"], reverse=True)[:top_k]
         return sorted_hits
 
+    def hybrid_retrieve(self, query: str, collection_name: str, top_k: int = 5) -> List[Dict]:
+        vector_hits = self.vector_retrieve(query, collection_name, top_k=top_k * 2)
+        return self._hybrid_rank(query, vector_hits, top_k)
+
     def retrieve_code(self, query_diff: str, file_ext: str, top_k: int = 5) -> List[Dict]:
         if file_ext not in EXT_TO_COLLECTION: return []
         col_name = EXT_TO_COLLECTION[file_ext]
         return self.hybrid_retrieve(query_diff, col_name, top_k)
 
+    def _embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        One embedding per text, [] where it could not be computed. A failed
+        batch is retried item by item, so an oversized or rejected diff only
+        costs its own file the retrieval context.
+        """
+        texts = [text[:EMBED_QUERY_MAX_CHARS] for text in texts]
+        embeddings = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            chunk = texts[start:start + EMBED_BATCH_SIZE]
+            try:
+                found = list(self.embedding_function(chunk))
+            except Exception:
+                found = []
+            if len(found) != len(chunk): found = [[]] * len(chunk)
+            if len(chunk) > 1:
+                found = [e if len(e) else self._embed_one(text) for text, e in zip(chunk, found)]
+            embeddings += found
+        return embeddings
+
+    def _embed_one(self, text: str) -> List[float]:
+        try:
+            found = self.embedding_function([text])
+            return found[0] if len(found) else []
+        except Exception:
+            return []
+
+    def retrieve_code_batch(self, queries: List[tuple], top_k: int = 5) -> List[List[Dict]]:
+        """
+        retrieve_code() for many (query_diff, file_ext) pairs: every query is
+        embedded in one batched request, then each collection is searched
+        once with the precomputed query embeddings.
+        """
+        results = [[] for _ in queries]
+        if not self.client: return results
+        wanted = [i for i, (_, ext) in enumerate(queries) if ext in EXT_TO_COLLECTION]
+        embeddings = self._embed_queries([queries[i][0] for i in wanted])
+
+        by_collection: Dict[str, List[tuple]] = {}
+        for i, embedding in zip(wanted, embeddings):
+            if len(embedding):  # empty when the file's query could not be embedded
+                by_collection.setdefault(EXT_TO_COLLECTION[queries[i][1]], []).append((i, embedding))
+        for col_name, items in by_collection.items():
+            try:
+                found = self._collection(col_name).query(
+                    query_embeddings=[embedding for _, embedding in items], n_results=top_k * 2)
+            except Exception:
+                continue
+            for j, (i, _) in enumerate(items):
+                results[i] = self._hybrid_rank(queries[i][0], self._hits(found, j), top_k)
+        return results
+
 # ==========================================
 # Helpers
 # ==========================================
@@ -174,67 +426,338 @@ def get_console_input(prompt_text):
             with open('/dev/tty', 'r', encoding='utf-8') as f: return f.readline().strip()
     except: return input().strip()
 
+def load_rules_cache():
+    try:
+        with open(RULES_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if isinstance(cached.get("etag"), str) and isinstance(cached.get("config"), dict):
+            return cached
+    except Exception: pass
+    return None
+
+def save_rules_cache(etag, config, from_agent=False):
+    # Only cache inside an initialized .git_guard (created by the indexer)
+    if not isinstance(etag, str) or not os.path.isdir(GUARD_DIR): return
+    try:
+        tmp_path = f"{RULES_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"etag": etag, "config": config, "agent_synced_at": time.time() if from_agent else None},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, RULES_CACHE_PATH)
+    except Exception: pass
+
 def fetch_dynamic_rules():
+    """Fetch team rules, revalidating the local copy with If-None-Match"""
+    cached = load_rules_cache()
+    if cached and time.time() - (cached.get("agent_synced_at") or 0) < CONFIG_AGENT_FRESH_SECONDS:
+        return cached["config"]  # kept current by the config agent, no round-trip
+    headers = {"If-None-Match": cached["etag"]} if cached else {}
     try:
-        resp = requests.get(CONFIG_URL, timeout=1.5)
-        if resp.status_code == 200: return resp.json()
+        resp = requests.get(CONFIG_URL, headers=headers, timeout=1.5)
+        if resp.status_code == 304 and cached:
+            start_config_agent()
+            return cached["config"]
+        if resp.status_code == 200:
+            config = resp.json()
+            save_rules_cache(resp.headers.get("ETag"), config)
+            start_config_agent()
+            return config
     except: pass
     return {"template_format": "Standard", "custom_rules": "None"}
 
+# ==========================================
+# Config Agent: Long-poll the Server, Keep rules_cache.json Fresh
+# ==========================================
+def _lock_config_agent():
+    """Open and exclusively lock the agent lock file; None if another agent holds it"""
+    if fcntl is None or not os.path.isdir(GUARD_DIR): return None
+    f = open(CONFIG_AGENT_LOCK_PATH, 'a+')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return f
+    except OSError:
+        f.close()
+        return None
+
+def start_config_agent():
+    """Spawn a detached config agent for this repo unless one is already running"""
+    probe = _lock_config_agent()
+    if probe is None: return
+    probe.close()  # the agent takes the lock itself; losing that race just makes it exit
+    try:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--config-agent"], cwd=REPO_PATH,
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True)
+    except Exception: pass
+
+def run_config_agent():
+    lock = _lock_config_agent()
+    if lock is None: return
+    backoff = 1
+    stop_at = time.time() + CONFIG_AGENT_LIFETIME_SECONDS
+    with lock:
+        while time.time() < stop_at and os.path.isdir(GUARD_DIR):
+            cached = load_rules_cache()
+            headers = {"If-None-Match": cached["etag"]} if cached else {}
+            try:
+                resp = requests.get(CONFIG_URL, params={"wait": CONFIG_WATCH_SECONDS}, headers=headers,
+                                    timeout=CONFIG_WATCH_SECONDS + 10)
+                if resp.status_code == 304 and cached:
+                    save_rules_cache(cached["etag"], cached["config"], from_agent=True)
+                elif resp.status_code == 200:
+                    save_rules_cache(resp.headers.get("ETag"), resp.json(), from_agent=True)
+                else:
+                    raise RuntimeError(f"HTTP {resp.status_code}")
+                backoff = 1
+            except Exception:
+                # Server unreachable: commits fall back to their own revalidation
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+def queue_report(payload):
+    """Keep an undelivered report in the local outbox for the next upload"""
+    if not os.path.isdir(GUARD_DIR): return
+    try:
+        with open(REPORT_OUTBOX_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    except Exception: pass
+
+def flush_report_outbox():
+    """Upload queued reports in one NDJSON batch; keep them if the upload fails"""
+    if not os.path.exists(REPORT_OUTBOX_PATH): return
+    sending_path = REPORT_OUTBOX_PATH + ".sending"
+    try:
+        os.replace(REPORT_OUTBOX_PATH, sending_path)
+        with open(sending_path, 'rb') as f:
+            resp = requests.post(
+                TRACK_BATCH_URL, data=f, timeout=10,
+                headers={"Content-Type": "application/x-ndjson"}
+            )
+        if resp.status_code == 200:
+            # Rejected lines are malformed and would never succeed; drop them too.
+            # Lines from resume_from_line on were not processed (rate limit) and stay queued.
+            resume = resp.json().get("resume_from_line")
+            if not resume:
+                os.remove(sending_path)
+                return
+            with open(sending_path, 'rb') as f:
+                remaining = f.read().split(b"\n")[resume - 1:]
+            with open(sending_path, 'wb') as f:
+                f.write(b"\n".join(remaining))
+    except Exception: pass
+    # Put the undelivered reports back in front of anything queued meanwhile
+    try:
+        with open(sending_path, 'r', encoding='utf-8') as f:
+            pending = f.read()
+        if os.path.exists(REPORT_OUTBOX_PATH):
+            with open(REPORT_OUTBOX_PATH, 'r', encoding='utf-8') as f:
+                pending += f.read()
+        with open(REPORT_OUTBOX_PATH, 'w', encoding='utf-8') as f:
+            f.write(pending)
+        os.remove(sending_path)
+    except Exception: pass
+
 def report_to_cloud(msg, risk, summary):
     try:
-        try:
-            user = getpass.getuser()
-        except Exception:
-            user = os.getenv("USERNAME") or os.getenv("USER") or "Unknown"
+        user = getpass.getuser()
+    except Exception:
+        user = os.getenv("USERNAME") or os.getenv("USER") or "Unknown"
+
+    payload = {
+        "developer_id": user,
+        "repo_name": os.path.basename(os.path.abspath(REPO_PATH)),
+        "commit_msg": msg,
+        "risk_level": risk,
+        "ai_summary": summary,
+        "timestamp": datetime.now().astimezone().isoformat(timespec="seconds")
+    }
+    try:
+        resp = requests.post(TRACK_URL, json=payload, timeout=2)
+        if resp.status_code == 200:
+            flush_report_outbox()
+            return
+    except Exception: pass
+    queue_report(payload)
 
-        payload = {
-            "developer_id": user,
-            "repo_name": os.path.basename(os.path.abspath(REPO_PATH)),
-            "commit_msg": msg,
-            "risk_level": risk,
-            "ai_summary": summary
-        }
-        requests.post(TRACK_URL, json=payload, timeout=2)
+# ==========================================
+# Staged Diff: One git Invocation, Parsed per File
+# ==========================================
+def unquote_git_path(path):
+    """Undo git's C-style quoting ("a/na\\303\\257ve.py") of unusual paths"""
+    if not (len(path) >= 2 and path[0] == path[-1] == '"'): return path
+    raw = path[1:-1].encode("latin-1", "backslashreplace")
+    return raw.decode("unicode_escape").encode("latin-1").decode("utf-8", "replace")
+
+def _strip_prefix(path):
+    path = unquote_git_path(path)
+    return path[2:] if path[:2] in ("a/", "b/") else path
+
+def _file_line_path(line):
+    """Path of a '---'/'+++' line; git ends it with a TAB when the path contains a space"""
+    return line[4:].split("\t")[0]
+
+def _header_path(header):
+    """Path from 'diff --git a/P b/P' when no other line names it (mode-only, empty or binary)"""
+    rest = header[len("diff --git "):]
+    if rest.startswith('"'):
+        return _strip_prefix(rest[:rest.index('"', 1) + 1])
+    half = (len(rest) - 1) // 2
+    return _strip_prefix(rest[:half])
+
+def parse_staged_diff(lines):
+    """
+    Split `git diff --cached -M` output into one entry per file:
+    {path, old_path, status (A/M/D/R/C), binary, hunks, text}. A generator,
+    so files can be processed while git is still writing the rest.
+    """
+    entry = None
+
+    def finish(e):
+        e["path"] = e["path"] or e["old_path"] or _header_path(e["header"])
+        e["old_path"] = e["old_path"] or e["path"]
+        e["text"] = "\n".join(e.pop("lines"))
+        del e["header"]
+        return e
+
+    for line in lines:
+        if line.startswith("diff --git "):
+            if entry: yield finish(entry)
+            entry = {"header": line, "path": None, "old_path": None, "status": "M",
+                     "binary": False, "hunks": [], "lines": [line]}
+            continue
+        if entry is None: continue
+        entry["lines"].append(line)
+        if entry["hunks"] and line[:1] in (" ", "+", "-", "\\"):
+            entry["hunks"][-1].append(line)
+        elif line.startswith("@@"):
+            entry["hunks"].append([line])
+        elif line.startswith("new file mode"): entry["status"] = "A"
+        elif line.startswith("deleted file mode"): entry["status"] = "D"
+        elif line.startswith("rename from "):
+            entry["status"], entry["old_path"] = "R", unquote_git_path(line[12:])
+        elif line.startswith("rename to "): entry["path"] = unquote_git_path(line[10:])
+        elif line.startswith("copy from "):
+            entry["status"], entry["old_path"] = "C", unquote_git_path(line[10:])
+        elif line.startswith("copy to "): entry["path"] = unquote_git_path(line[8:])
+        elif line.startswith("--- ") and _file_line_path(line) != "/dev/null":
+            entry["old_path"] = _strip_prefix(_file_line_path(line))
+        elif line.startswith("+++ ") and _file_line_path(line) != "/dev/null":
+            entry["path"] = _strip_prefix(_file_line_path(line))
+        elif line.startswith("Binary files "): entry["binary"] = True
+    if entry: yield finish(entry)
+
+def iter_staged_diff(repo):
+    """Stream the whole staged diff from a single git process (works before the first commit too)"""
+    proc = repo.git.diff("--cached", "-M", "--no-color", "--no-ext-diff", as_process=True)
+    for raw in proc.stdout:
+        yield raw.decode("utf-8", "replace").rstrip("\r\n")
+    proc.wait()
+
+def staged_tree_id(repo):
+    """Hash of the index as a tree: identical for both hooks of one commit, new after any re-stage"""
+    try:
+        return repo.git.write_tree().strip()
     except Exception:
-        pass
+        return None
+
+def load_rag_cache(tree_id):
+    if not tree_id: return None
+    try:
+        with open(RAG_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get("tree") == tree_id and isinstance(cached.get("changes"), dict):
+            return cached["changes"], cached.get("context", "")
+    except Exception: pass
+    return None
+
+def save_rag_cache(tree_id, changes, context_str):
+    # Only the latest staged tree is kept: the next commit never reuses an older one
+    if not tree_id or not os.path.isdir(GUARD_DIR): return
+    try:
+        tmp_path = f"{RAG_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"tree": tree_id, "changes": changes, "context": context_str}, f, ensure_ascii=False)
+        os.replace(tmp_path, RAG_CACHE_PATH)
+    except Exception: pass
+
+def rerank_file_context(reranker, text, candidates):
+    """Reference snippets for one changed file from its retrieved candidates"""
+    context_str = ""
+    if candidates:
+        final_docs = reranker.rerank(query=text, documents=candidates, top_k=3)
+        for doc in final_docs:
+            score = doc.get('score', 0)
+            content = doc.get('answer', '')[:500]
+            context_str += f"\n[Ref Score: {score:.2f}]:\n{content}\n"
+    return context_str
 
 def process_changes_with_rag():
+    """Staged changes and retrieved context, reused across hooks while the index is unchanged"""
     if not API_KEY: return {}, ""
     try:
         repo = Repo(REPO_PATH)
-        try:
-            diff_index = repo.head.commit.diff()
-        except ValueError:
-            EMPTY_TREE = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
-            diff_index = repo.tree(EMPTY_TREE).diff(repo.index)
     except: return {}, ""
 
-    changes = {}
-    context_str = ""
-    retriever = Retrieval()
-    reranker = Reranker()
+    tree_id = staged_tree_id(repo)
+    cached = load_rag_cache(tree_id)
+    if cached: return cached
 
-    for diff in diff_index:
-        if diff.change_type == 'D': continue
-        fpath = diff.b_path if diff.b_path else diff.a_path
-        if not fpath: continue
-        try:
-            text = repo.git.diff("--cached", fpath)
-            if not text.strip(): text = "(New File)"
-            _, ext = os.path.splitext(fpath)
-            changes[fpath] = text
-            candidates = retriever.retrieve_code(query_diff=text, file_ext=ext, top_k=10)
-            if candidates:
-                final_docs = reranker.rerank(query=text, documents=candidates, top_k=3)
-                for doc in final_docs:
-                    score = doc.get('score', 0)
-                    content = doc.get('answer', '')[:500]
-                    context_str += f"\n[Ref Score: {score:.2f}]:\n{content}\n"
-        except Exception: pass
+    changes = {}
+    complete = True
+    try:
+        for diff in parse_staged_diff(iter_staged_diff(repo)):
+            if diff["status"] == "D": continue
+            changes[diff["path"]] = diff["text"] or "(New File)"
+    except Exception:
+        complete = False
 
+    # One batched embedding + one vector search per collection, then the
+    # per-file rerank calls run concurrently and are joined in diff order
+    queries = [(text, os.path.splitext(fpath)[1]) for fpath, text in changes.items()]
+    parts = []
+    try:
+        candidates = Retrieval().retrieve_code_batch(queries, top_k=10)
+    except Exception:
+        candidates, complete = [[] for _ in queries], False
+    reranker = Reranker()
+    with ThreadPoolExecutor(max_workers=RAG_MAX_WORKERS) as pool:
+        futures = [pool.submit(rerank_file_context, reranker, text, found)
+                   for (text, _), found in zip(queries, candidates)]
+        for future in futures:
+            try:
+                parts.append(future.result())
+            except Exception:
+                complete = False
+    context_str = "".join(parts)
+
+    if complete: save_rag_cache(tree_id, changes, context_str)  # never pin a degraded result
     return changes, context_str
 
+# ==========================================
+# LLM Completions: Cached by Prompt Hash
+# ==========================================
+def complete_llm(prompt):
+    """
+    Completion text for a prompt. A byte-identical prompt (e.g. the commit
+    retried after answering 'n') is answered from .git_guard without a
+    round trip. Set GIT_GUARD_NO_LLM_CACHE=1 to always ask the model.
+    """
+    cache = None
+    if LLM_CACHE_ENABLED and os.path.isdir(GUARD_DIR):
+        cache = ResultCache(RESULT_CACHE_PATH, "completions", LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES)
+    key = ResultCache.make_key(LLM_MODEL, prompt)
+    cached = cache.get(key) if cache else None
+    if isinstance(cached, str): return cached
+
+    client = ZhipuAiClient(api_key=API_KEY)
+    res = client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    content = res.choices[0].message.content
+    if cache and content: cache.put(key, content)
+    return content
+
 # ==========================================
 # Mode 1: Pre-commit Report (Report Only)
 # ==========================================
@@ -269,12 +792,7 @@ def run_report_mode():
     """
     
     try:
-        client = ZhipuAiClient(api_key=API_KEY)
-        res = client.chat.completions.create(
-            model="glm-4-air", 
-            messages=[{"role": "user", "content": prompt}]
-        )
-        report = clean_markdown(res.choices[0].message.content)
+        report = clean_markdown(complete_llm(prompt))
         
         print("\n" + "="*60)
         print(" GIT-GUARD IMPACT REPORT")
@@ -355,12 +873,7 @@ def run_suggestion_mode(msg_file_path):
     """
     
     try:
-        client = ZhipuAiClient(api_key=API_KEY)
-        res = client.chat.completions.create(
-            model="glm-4-air", 
-            messages=[{"role": "user", "content": prompt}]
-        )
-        content = res.choices[0].message.content
+        content = complete_llm(prompt)
         
         risk = "Medium"
         summary = "Update"
@@ -409,7 +922,9 @@ def run_suggestion_mode(msg_file_path):
     report_to_cloud(final_msg, risk, summary)
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
+    if sys.argv[1:] == ["--config-agent"]:
+        run_config_agent()
+    elif len(sys.argv) > 1:
         run_suggestion_mode(sys.argv[1])
     else:
         run_report_mode()
\ No newline at end of file
@@ -0,0 +1,534 @@
+# File: server/ci_engine.py
+import os
+import time
+import uuid
+import signal
+import hashlib
+import subprocess
+import threading
+import multiprocessing
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple
+from ci_selection import ImportGraphIndex, select_tests, git_blob_ids, parse_collected_ids, plan_shards
+from ci_sandbox import CISandbox
+from ci_store import CIRunStore, parse_junit_xml, summarize_tests
+from ci_logs import CILogStore, open_run_log
+
+# ==========================================
+# CI Pipeline (runs inside the job's child process)
+# ==========================================
+OUTPUT_TAIL_CHARS = 16 * 1024
+OUTPUT_TAIL_LINES = 400
+
+def _pump_output(proc, log, tail, prefix: bytes = b"", lock=None):
+    with proc.stdout:
+        for line in proc.stdout:
+            if lock is None:
+                log.write(prefix + line)
+            else:
+                with lock: log.write(prefix + line)
+            tail.append(prefix + line[-OUTPUT_TAIL_CHARS:])
+
+def _tail_text(tail) -> str:
+    return b"".join(tail).decode("utf-8", errors="replace")[-OUTPUT_TAIL_CHARS:]
+
+def stream_process(cmd: List[str], cwd: str, log) -> Tuple[int, str]:
+    """
+    Run a command with stdout+stderr streamed line by line into the run log.
+    Only the last OUTPUT_TAIL_LINES lines stay in memory, for the stored tail
+    and the summary line. Returns (exit code, output tail).
+    """
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    _pump_output(proc, log, tail)
+    returncode = proc.wait()
+    return returncode, _tail_text(tail)
+
+# ==========================================
+# Parallel Test Shards
+# ==========================================
+MIN_TESTS_PER_SHARD = 10
+MAX_INLINE_ARGS_BYTES = 32 * 1024
+
+def collect_test_ids(python: str, cwd: str, targets: List[str]) -> Optional[List[str]]:
+    """Node ids pytest would run, or None if collection fails"""
+    proc = subprocess.run(
+        [python, "-m", "pytest", "--collect-only", "-q", "-p", "no:cacheprovider"] + targets,
+        cwd=cwd, capture_output=True, text=True
+    )
+    return parse_collected_ids(proc.stdout) if proc.returncode == 0 else None
+
+def pytest_targets(nodeids: List[str], args_path: str) -> List[str]:
+    """Pass node ids inline, or through a pytest @argsfile when they would overflow the command line"""
+    if sum(len(n) + 1 for n in nodeids) <= MAX_INLINE_ARGS_BYTES:
+        return nodeids
+    with open(args_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(nodeids))
+    return ["@" + args_path]
+
+def merge_exit_codes(codes: List[int]) -> int:
+    """pytest exit codes of all shards as one: 5 (nothing collected) only if every shard had nothing"""
+    failing = [c for c in codes if c not in (0, 5)]
+    if failing: return max(failing)
+    return 0 if 0 in codes else 5
+
+def run_pytest_shards(python: str, cwd: str, shards: List[List[str]], junit_path: str, log) -> Tuple[int, str, List[Dict]]:
+    """
+    Run each shard as its own pytest process at the same time. Output lines
+    are prefixed with the shard number; per-shard JUnit reports are merged
+    into one result list. Returns (exit code, output tail, tests).
+    """
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    lock = threading.Lock()
+    procs, pumps = [], []
+    for i, nodeids in enumerate(shards):
+        cmd = [python, "-m", "pytest", f"--junitxml={junit_path}.{i}", "-o", "junit_family=xunit1",
+               "-p", "no:cacheprovider"] + pytest_targets(nodeids, f"{junit_path}.{i}.args")
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        pump = threading.Thread(target=_pump_output, args=(proc, log, tail, f"[shard {i}] ".encode(), lock), daemon=True)
+        pump.start()
+        procs.append(proc)
+        pumps.append(pump)
+    codes = [proc.wait() for proc in procs]
+    for pump in pumps:
+        pump.join()
+
+    tests = []
+    for i in range(len(shards)):
+        try:
+            tests.extend(parse_junit_xml(f"{junit_path}.{i}"))
+        except Exception as e:
+            print(f"   JUnit report of shard {i} unreadable: {e}")
+        for path in (f"{junit_path}.{i}", f"{junit_path}.{i}.args"):
+            try: os.remove(path)
+            except OSError: pass
+    return merge_exit_codes(codes), _tail_text(tail), tests
+
+def shard_summary(tests: List[Dict], seconds: float, shard_count: int) -> str:
+    counts = summarize_tests(tests)
+    parts = [f"{counts[k]} {k}" for k in ("failed", "error", "passed", "skipped") if counts[k]]
+    return f"{', '.join(parts) or 'no tests ran'} in {seconds:.2f}s across {shard_count} shards"
+
+def pytest_summary_line(output: str) -> str:
+    """'=== 3 passed, 1 failed in 0.52s ===' -> '3 passed, 1 failed in 0.52s'"""
+    lines = [line.strip("= ") for line in output.splitlines() if line.strip("= ")]
+    return lines[-1] if lines else ""
+
+def plan_test_selection(repo, checkout_dir: str, base_sha: str, head_sha: str, index_cache_path: str):
+    """Impacted test files for base..head, or None when the full suite must run"""
+    try:
+        raw = repo.git.diff("--name-status", "-M", f"{base_sha}..{head_sha}")
+        name_status = []
+        for line in raw.splitlines():
+            fields = line.split("\t")
+            if len(fields) >= 2:
+                name_status.append((fields[0], fields[-1]))
+        blob_ids = git_blob_ids(repo.git.ls_tree("-r", head_sha))
+        index = ImportGraphIndex(checkout_dir, index_cache_path).build(blob_ids)
+        return select_tests(index, name_status)
+    except Exception as e:
+        # e.g. the base commit vanished after a force-push
+        print(f"   Test selection unavailable ({e}), running full suite.")
+        return None
+
+def plan_parallel_shards(python: str, checkout: str, targets: List[str], history: Dict,
+                         max_shards: int) -> Optional[List[List[str]]]:
+    """Duration-balanced shards for the tests under `targets`, or None to run in one process"""
+    nodeids = collect_test_ids(python, checkout, targets)
+    if not nodeids: return None
+    shard_count = min(max_shards, len(nodeids) // MIN_TESTS_PER_SHARD)
+    if shard_count < 2: return None
+    return plan_shards(nodeids, history, shard_count)
+
+def run_ci_pipeline(spec: Dict) -> Dict:
+    """
+    Fetch & test one repo inside the job's child process. Returns the run
+    result: status, sha, selection, exit_code, per-test outcomes, details.
+    """
+    result = {"sha": None, "selection": "full", "exit_code": None, "tests": [], "output_tail": ""}
+    log = open_run_log(spec, spec["run_id"])
+    try:
+        repo_url = spec["repo_url"]
+        sandbox = CISandbox(spec["workspace_dir"], venv_budget_bytes=spec["venv_budget_bytes"])
+        log.write_line(f"$ git remote update {repo_url}")
+        mirror = sandbox.update_mirror(repo_url)
+        head_sha = mirror.commit("HEAD").hexsha  # a mirror's HEAD is the remote's default branch
+        result["sha"] = head_sha
+        log.write_line(f"HEAD is {head_sha}")
+        store = CIRunStore(spec["store_path"])
+        force = spec.get("force", False)
+
+        if not force:
+            previous = store.find_conclusive_run(repo_url, head_sha)
+            if previous:
+                log.write_line(f"Already tested by run {previous['run_id']} ({previous['status']}), skipping.")
+                return dict(result, status="Skipped", reused_run_id=previous["run_id"],
+                            details=f"{head_sha[:10]} already tested by run {previous['run_id']} ({previous['status']}).")
+
+        with sandbox.worktree(mirror, head_sha, spec["run_id"]) as checkout:
+            # Only narrow the run when the last tested commit was fully green;
+            # otherwise earlier failures outside the impacted set would be hidden.
+            tests = None
+            baseline = None if force else store.latest_conclusive_run(repo_url)
+            if baseline and baseline["status"] == "Success" and baseline["sha"]:
+                tests = plan_test_selection(mirror, checkout, baseline["sha"], head_sha, spec["index_cache_path"])
+
+            if tests == []:
+                log.write_line("No tests impacted by this change.")
+                return dict(result, status="Success", selection="none",
+                            details=f"No tests impacted by {baseline['sha'][:10]}..{head_sha[:10]}.")
+
+            if tests:
+                print(f"   Running {len(tests)} impacted test files...")
+                header = f"{len(tests)} impacted test files since {baseline['sha'][:10]}: "
+            else:
+                print("   Running Pytest (full suite)...")
+                header = ""
+            junit_path = spec["junit_path"]
+            if os.path.exists(junit_path): os.remove(junit_path)
+
+            def run_logged(cmd, cwd):
+                log.write_line("$ " + " ".join(cmd))
+                return stream_process(cmd, cwd, log)
+
+            with sandbox.venv(checkout, lambda cmd, cwd: run_logged(cmd, cwd)[0]) as python:
+                shards = None
+                if spec.get("shards", 1) > 1:
+                    shards = plan_parallel_shards(python, checkout, tests or [], store.test_history(repo_url),
+                                                  spec["shards"])
+                if shards:
+                    log.write_line(f"Running {sum(map(len, shards))} tests in {len(shards)} shards")
+                    started = time.time()
+                    returncode, output_tail, parsed = run_pytest_shards(python, checkout, shards, junit_path, log)
+                    summary = shard_summary(parsed, time.time() - started, len(shards))
+                else:
+                    cmd = [python, "-m", "pytest", f"--junitxml={junit_path}", "-o", "junit_family=xunit1"] + (tests or [])
+                    returncode, output_tail = run_logged(cmd, checkout)
+                    try:
+                        parsed = parse_junit_xml(junit_path)
+                    except Exception as e:
+                        print(f"   JUnit report unreadable: {e}")
+                        parsed = []
+                    summary = pytest_summary_line(output_tail)
+        return dict(
+            result,
+            status="Success" if returncode == 0 else "Failed",
+            selection="impacted" if tests else "full",
+            exit_code=returncode,
+            tests=parsed,
+            details=header + summary,
+            output_tail=output_tail,
+        )
+    except Exception as e:
+        log.write_line(f"System Error: {e}")
+        return dict(result, status="System Error", details=str(e))
+    finally:
+        log.close()
+
+def _child_main(spec: Dict, conn, pipeline):
+    # Own process group, so cancel/timeout can kill pytest and git along with us
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    try:
+        conn.send(pipeline(spec))
+    finally:
+        conn.close()
+
+# ==========================================
+# CI Job Queue: Bounded Pool of Worker Processes
+# ==========================================
+QUEUED, RUNNING = "queued", "running"
+SUCCEEDED, FAILED, SKIPPED = "succeeded", "failed", "skipped"
+CANCELLED, TIMED_OUT, ERROR = "cancelled", "timed_out", "error"
+FINISHED_STATES = {SUCCEEDED, FAILED, SKIPPED, CANCELLED, TIMED_OUT, ERROR}
+RESULT_STATES = {"Success": SUCCEEDED, "Failed": FAILED, "Skipped": SKIPPED}
+
+class CIQueueFull(Exception):
+    """Raised by submit() when `max_queued` jobs are already waiting"""
+
+class CIJob:
+    def __init__(self, repo_url: str, trigger: str, timeout: float, force: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.repo_url = repo_url
+        self.trigger = trigger
+        self.timeout = timeout
+        self.force = force  # bypass skip-if-unchanged and test selection
+        self.status = QUEUED
+        self.result_status = None  # "Success" / "Failed" / ... as shown on the dashboard
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self.process = None
+        self.run_id = None  # CI run holding this job's results (a reused one if skipped)
+        self.details = None
+
+    def to_dict(self) -> Dict:
+        def fmt(ts): return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else None
+        duration = None
+        if self.started_at:
+            duration = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "job_id": self.id,
+            "repo_url": self.repo_url,
+            "trigger": self.trigger,
+            "status": self.status,
+            "result": self.result_status,
+            "run_id": self.run_id,
+            "details": self.details,
+            "created_at": fmt(self.created_at),
+            "started_at": fmt(self.started_at),
+            "finished_at": fmt(self.finished_at),
+            "duration_s": duration,
+            "timeout_s": self.timeout,
+        }
+
+class CIJobQueue:
+    """
+    CI jobs wait in a FIFO and are executed by `max_workers` dispatcher
+    threads, each running one job at a time in a child process. A repo never
+    has two jobs running at once (they share a workspace), and a trigger for
+    a repo that already has a queued job is coalesced into that job.
+    """
+    def __init__(self, workspace_dir: str, state_dir: str, store: CIRunStore, logs: CILogStore,
+                 max_workers: int = 2, default_timeout: float = 1800, history_size: int = 100,
+                 venv_budget_bytes: int = 4 * 1024 ** 3, shards: int = 1, max_queued: Optional[int] = None,
+                 on_finish=None, on_update=None, pipeline=run_ci_pipeline):
+        self.pipeline = pipeline  # module-level callable, pickled by reference into the child
+        self.workspace_dir = workspace_dir  # sandbox root: mirrors, worktrees, cached venvs
+        self.venv_budget_bytes = venv_budget_bytes
+        self.shards = shards  # parallel pytest processes per job
+        self.state_dir = state_dir
+        self.store = store
+        self.logs = logs
+        self.max_workers = max_workers  # global cap on concurrently running jobs
+        self.max_queued = max_queued  # backpressure: submit() refuses new jobs beyond this
+        self.on_finish = on_finish  # called with each finished CIJob, outside the lock
+        self.on_update = on_update  # called on every job state change, outside the lock
+        self.default_timeout = default_timeout
+        self.history_size = history_size
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._cond = threading.Condition()
+        self._queue: List[CIJob] = []
+        self._jobs: Dict[str, CIJob] = {}
+        self._running_repos = set()
+        self._threads = []
+        self._stopping = False
+
+    # ---------- Public API ----------
+    def submit(self, repo_url: str, trigger: str = "manual", timeout: Optional[float] = None,
+               force: bool = False) -> Tuple[CIJob, bool]:
+        """Returns (job, coalesced); raises CIQueueFull when the queue is saturated"""
+        with self._cond:
+            for job in self._queue:
+                if job.repo_url == repo_url:
+                    job.force = job.force or force
+                    return job, True
+            if self.max_queued is not None and len(self._queue) >= self.max_queued:
+                raise CIQueueFull(f"{len(self._queue)} CI jobs already queued")
+            job = CIJob(repo_url, trigger, timeout or self.default_timeout, force)
+            self._queue.append(job)
+            self._jobs[job.id] = job
+            self._trim_history()
+            self._cond.notify()
+        self._notify_update(job)
+        return job, False
+
+    def cancel(self, job_id: str) -> Optional[CIJob]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES: return job
+            job.cancel_requested = True
+            cancelled_queued = job.status == QUEUED
+            if cancelled_queued:
+                self._queue.remove(job)
+                self._finish(job, CANCELLED, {"status": "Cancelled", "details": "Cancelled before start."})
+            self._cond.notify_all()
+        if cancelled_queued: self._notify_update(job)
+        return job
+
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def running(self) -> int:
+        return len(self._running_repos)
+
+    def get(self, job_id: str) -> Optional[CIJob]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        with self._cond:
+            jobs = sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+        return [job.to_dict() for job in jobs]
+
+    def start(self):
+        self._stopping = False
+        for i in range(self.max_workers):
+            t = threading.Thread(target=self._worker_loop, name=f"ci-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 10.0):
+        with self._cond:
+            self._stopping = True
+            for job in list(self._jobs.values()):
+                if job.status == RUNNING:
+                    job.cancel_requested = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    # ---------- Internals ----------
+    def _trim_history(self):
+        finished = [j for j in self._jobs.values() if j.status in FINISHED_STATES]
+        finished.sort(key=lambda j: j.created_at)
+        for job in finished[:max(0, len(finished) - self.history_size)]:
+            del self._jobs[job.id]
+
+    def _next_job(self) -> Optional[CIJob]:
+        while not self._stopping:
+            for job in self._queue:
+                if job.repo_url not in self._running_repos:
+                    self._queue.remove(job)
+                    self._running_repos.add(job.repo_url)
+                    job.status = RUNNING
+                    job.started_at = time.time()
+                    return job
+            self._cond.wait()
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+            if job is None: return
+            self._notify_update(job)
+            try:
+                self._run_job(job)
+            except Exception as e:
+                self._complete(job, ERROR, {"status": "System Error", "details": str(e)})
+
+    def _run_job(self, job: CIJob):
+        print(f"\n⏰ [CI Job {job.id}] Starting ({job.trigger})...")
+        os.makedirs(self.state_dir, exist_ok=True)
+        repo_key = hashlib.sha1(job.repo_url.encode()).hexdigest()[:16]
+        spec = {
+            "run_id": job.id,
+            "repo_url": job.repo_url,
+            "workspace_dir": self.workspace_dir,
+            "venv_budget_bytes": self.venv_budget_bytes,
+            "shards": self.shards,
+            "force": job.force,
+            "store_path": self.store.db_path,
+            "junit_path": os.path.join(self.state_dir, f"{job.id}.junit.xml"),
+            "index_cache_path": os.path.join(self.state_dir, f"{repo_key}.imports.json"),
+            **self.logs.spec(),
+        }
+        parent_conn, child_conn = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(target=_child_main, args=(spec, child_conn, self.pipeline), daemon=True)
+        process.start()
+        child_conn.close()
+        job.process = process
+
+        deadline = job.started_at + job.timeout
+        result = None
+        while True:
+            if parent_conn.poll(0.5):
+                try: result = parent_conn.recv()
+                except EOFError: pass
+                break
+            if job.cancel_requested or time.time() >= deadline or not process.is_alive():
+                break
+        if result is None and parent_conn.poll(0):  # sent right before the child exited
+            try: result = parent_conn.recv()
+            except EOFError: pass
+        process.join(timeout=0 if result is None else 5)
+
+        if result is not None:
+            self._complete(job, RESULT_STATES.get(result["status"], ERROR), result)
+        elif job.cancel_requested:
+            self._kill(process)
+            self._complete(job, CANCELLED, {"status": "Cancelled", "details": "Cancelled while running."})
+        elif process.is_alive():
+            self._kill(process)
+            self._complete(job, TIMED_OUT, {"status": "Timed Out", "details": f"Job exceeded {job.timeout:.0f}s."})
+        else:
+            self._complete(job, ERROR, {"status": "System Error", "details": f"Worker exited with code {process.exitcode}."})
+        parent_conn.close()
+        try: os.remove(spec["junit_path"])
+        except OSError: pass
+        self.logs.prune()
+
+    def _kill(self, process):
+        # The group takes pytest and its shards along; a child killed before
+        # its setpgrp() has no group yet and is killed directly
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.join(timeout=5)
+                return
+            except OSError:
+                pass
+        try:
+            process.kill()
+        except OSError:
+            pass
+        process.join(timeout=5)
+
+    def _complete(self, job: CIJob, state: str, result: Dict):
+        # Store the run first: once the job shows as finished, its run_id must resolve
+        finished_at = time.time()
+        if state != SKIPPED and job.started_at is not None:
+            self._record(job, result, finished_at)
+        with self._cond:
+            self._running_repos.discard(job.repo_url)
+            self._finish(job, state, result, finished_at)
+            self._cond.notify_all()
+        self._notify_update(job)
+        if self.on_finish is not None:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                print(f"⚠️ [CI Job {job.id}] on_finish failed: {e}")
+
+    def _notify_update(self, job: CIJob):
+        if self.on_update is None: return
+        try:
+            self.on_update(job)
+        except Exception as e:
+            print(f"⚠️ [CI Job {job.id}] on_update failed: {e}")
+
+    def _finish(self, job: CIJob, state: str, result: Dict, finished_at: Optional[float] = None):
+        job.status = state
+        job.result_status = result["status"]
+        job.details = result.get("details")
+        job.finished_at = time.time() if finished_at is None else finished_at
+        job.process = None
+        icon = "✅" if state in (SUCCEEDED, SKIPPED) else "❌"
+        print(f"{icon} [CI Job {job.id}] {result['status']}")
+        if state == SKIPPED:
+            job.run_id = result.get("reused_run_id")
+        elif job.started_at is not None:  # jobs cancelled while queued never produced a run
+            job.run_id = job.id
+
+    def _record(self, job: CIJob, result: Dict, finished_at: float):
+        try:
+            self.store.record_run({
+                "run_id": job.id,
+                "repo_url": job.repo_url,
+                "sha": result.get("sha"),
+                "trigger": job.trigger,
+                "status": result["status"],
+                "selection": result.get("selection", "full"),
+                "started_at": job.started_at,
+                "finished_at": finished_at,
+                "duration_s": round(finished_at - job.started_at, 3),
+                "exit_code": result.get("exit_code"),
+                "details": result.get("details") or "",
+                "output_tail": result.get("output_tail") or "",
+            }, result.get("tests") or [])
+        except Exception as e:
+            print(f"⚠️ [CI Job {job.id}] Failed to record run: {e}")
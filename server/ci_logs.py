@@ -0,0 +1,192 @@
+# File: server/ci_logs.py
+import os
+import re
+import shutil
+from typing import Iterator, List, Optional, Tuple
+
+# ==========================================
+# CI Run Logs: Segmented, Rotating, Offset-addressed
+# ==========================================
+# Each run writes its output to <log_dir>/<run_id>/<n>.log. Segment n holds
+# the log bytes [n * segment_bytes, (n + 1) * segment_bytes), so a byte
+# offset is stable for the life of the run even after old segments are
+# rotated out. Only the newest `max_segments` are kept per run.
+RUN_ID_PATTERN = re.compile(r"^[0-9a-f]{1,32}$")
+
+class CIRunLog:
+    def __init__(self, run_dir: str, segment_bytes: int, max_segments: int):
+        self.run_dir = run_dir
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self._file = None
+        self._index = 0
+        self._size = 0
+
+    # ---------- Writer (CI child process) ----------
+    def write(self, data: bytes):
+        if self._file is None:
+            os.makedirs(self.run_dir, exist_ok=True)
+            self._file = open(self._segment_path(0), "ab")
+        while data:
+            room = self.segment_bytes - self._size
+            if room <= 0:
+                self._rotate()
+                continue
+            chunk, data = data[:room], data[room:]
+            self._file.write(chunk)
+            self._size += len(chunk)
+        self._file.flush()  # readers tail the file while the run is live
+
+    def write_line(self, text: str):
+        self.write((text + "\n").encode("utf-8"))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self):
+        self._file.close()
+        self._index += 1
+        self._size = 0
+        self._file = open(self._segment_path(self._index), "ab")
+        expired = self._index - self.max_segments
+        if expired >= 0:
+            try: os.remove(self._segment_path(expired))
+            except OSError: pass
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.run_dir, f"{index:06d}.log")
+
+    # ---------- Reader (API) ----------
+    def segments(self) -> List[int]:
+        try:
+            names = os.listdir(self.run_dir)
+        except OSError:
+            return []
+        return sorted(int(n[:-4]) for n in names if n.endswith(".log") and n[:-4].isdigit())
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.run_dir)
+
+    def extent(self) -> Tuple[int, int]:
+        """(first retained offset, end offset) of the log"""
+        segments = self.segments()
+        if not segments: return 0, 0
+        try:
+            last = os.path.getsize(self._segment_path(segments[-1]))
+        except OSError:
+            last = 0
+        return segments[0] * self.segment_bytes, segments[-1] * self.segment_bytes + last
+
+    def iter_range(self, start: int, end: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Bytes [start, end) in chunks; segments rotated out mid-read are skipped"""
+        offset = start
+        while offset < end:
+            index, pos = divmod(offset, self.segment_bytes)
+            want = min(end - offset, self.segment_bytes - pos, chunk_size)
+            try:
+                with open(self._segment_path(index), "rb") as f:
+                    f.seek(pos)
+                    data = f.read(want)
+            except OSError:
+                data = b""
+            if not data:
+                # Rotated out, or not written yet: move to the next segment
+                offset = (index + 1) * self.segment_bytes
+                continue
+            offset += len(data)
+            yield data
+
+    def open_range(self, start: int, end: int, chunk_size: int = 64 * 1024) -> Tuple[int, int, Iterator[bytes]]:
+        """
+        Open the segments holding [start, end) up front, so a download can
+        declare its exact length: a segment rotated out after this call is
+        still read through its open handle. Returns (first, last, chunks),
+        where [first, last) is the part of the range that was still retained.
+        """
+        files = []
+        if end > start:
+            for index in range(start // self.segment_bytes, (end - 1) // self.segment_bytes + 1):
+                try:
+                    files.append((index, open(self._segment_path(index), "rb")))
+                except OSError:
+                    if files: break  # only the oldest segments can be gone
+        if not files:
+            return end, end, iter(())
+        first = max(start, files[0][0] * self.segment_bytes)
+        last = min(end, (files[-1][0] + 1) * self.segment_bytes)
+
+        def chunks():
+            try:
+                for index, f in files:
+                    offset = max(first, index * self.segment_bytes)
+                    stop = min(last, (index + 1) * self.segment_bytes)
+                    f.seek(offset - index * self.segment_bytes)
+                    while offset < stop:
+                        data = f.read(min(chunk_size, stop - offset))
+                        if not data: return
+                        offset += len(data)
+                        yield data
+            finally:
+                for _, f in files: f.close()
+        return first, last, chunks()
+
+    def read(self, start: int, end: int) -> bytes:
+        return b"".join(self.iter_range(start, end))
+
+class CILogStore:
+    """Per-run logs under one directory, keeping the newest `keep_runs` runs"""
+    def __init__(self, log_dir: str, segment_bytes: int = 4 * 1024 * 1024,
+                 max_segments: int = 8, keep_runs: int = 200):
+        self.log_dir = log_dir
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.keep_runs = keep_runs
+
+    def open(self, run_id: str) -> CIRunLog:
+        if not RUN_ID_PATTERN.match(run_id):
+            raise ValueError(f"Invalid run id: {run_id!r}")
+        return CIRunLog(os.path.join(self.log_dir, run_id), self.segment_bytes, self.max_segments)
+
+    def spec(self) -> dict:
+        """Settings handed to the CI child so it can write with the same layout"""
+        return {"log_dir": self.log_dir, "log_segment_bytes": self.segment_bytes,
+                "log_max_segments": self.max_segments}
+
+    def prune(self):
+        try:
+            runs = [e for e in os.scandir(self.log_dir) if e.is_dir() and RUN_ID_PATTERN.match(e.name)]
+        except OSError:
+            return
+        runs.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        for entry in runs[self.keep_runs:]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def open_run_log(spec: dict, run_id: str) -> CIRunLog:
+    return CIRunLog(os.path.join(spec["log_dir"], run_id), spec["log_segment_bytes"], spec["log_max_segments"])
+
+# ==========================================
+# HTTP Range Parsing (single range only)
+# ==========================================
+def parse_byte_range(header: Optional[str], start: int, end: int) -> Optional[Tuple[int, int]]:
+    """
+    Resolve 'bytes=a-b', 'bytes=a-' or 'bytes=-n' against the retained log
+    [start, end). Returns a half-open (first, last) pair, None when there is
+    no usable Range header, or raises ValueError when it is unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header: return None
+    first, sep, last = header[6:].strip().partition("-")
+    if not sep: return None
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0 or end <= start: raise ValueError("empty suffix range")
+            return max(start, end - suffix), end
+        first = int(first)
+        last = int(last) + 1 if last else end
+    except ValueError:
+        raise ValueError(f"Malformed range: {header}")
+    if first < start or first >= end or last <= first:
+        raise ValueError(f"Unsatisfiable range: {header}")
+    return first, min(last, end)
@@ -0,0 +1,182 @@
+# File: server/ci_sandbox.py
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+from git import Repo
+from ci_selection import SKIP_DIRS
+
+try:
+    import fcntl  # POSIX only: guards the venv cache shared by concurrent CI children
+except ImportError:
+    fcntl = None
+
+# ==========================================
+# Helpers
+# ==========================================
+def dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try: total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError: pass
+    return total
+
+def find_requirements(root: str) -> List[str]:
+    """Relative paths of every requirements*.txt in a checkout, sorted"""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for name in filenames:
+            if name.startswith("requirements") and name.endswith(".txt"):
+                found.append(os.path.relpath(os.path.join(dirpath, name), root).replace("\\", "/"))
+    return sorted(found)
+
+def requirements_key(root: str, requirements: List[str]) -> str:
+    """Venv cache key: interpreter version + path and content of each requirements file"""
+    h = hashlib.sha256(sys.version.encode())
+    for rel in requirements:
+        with open(os.path.join(root, rel), "rb") as f:
+            h.update(b"\0" + rel.encode() + b"\0" + f.read())
+    return h.hexdigest()[:24]
+
+def venv_python(venv_dir: str) -> str:
+    if os.name == "nt":
+        return os.path.join(venv_dir, "Scripts", "python.exe")
+    return os.path.join(venv_dir, "bin", "python")
+
+def _lock(fd, exclusive: bool, blocking: bool = True) -> bool:
+    if fcntl is None: return True
+    flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    try:
+        fcntl.flock(fd, flags if blocking else flags | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+# ==========================================
+# CI Sandbox: Bare Mirror + Worktree per Run + Cached Venvs
+# ==========================================
+class CISandbox:
+    """
+    Layout under `root`:
+      mirrors/<repo>.git   bare mirror, fetched before every run
+      worktrees/<run_id>   detached worktree for one run, removed afterwards
+      venvs/<key>/         virtualenv per requirements hash, LRU-evicted
+                           to stay within `venv_budget_bytes`
+    A venv is held with a shared lock for the whole run, so eviction by a
+    concurrent job never deletes an interpreter that is in use.
+    """
+    def __init__(self, root: str, venv_budget_bytes: int = 4 * 1024 ** 3):
+        self.root = root
+        self.venv_budget_bytes = venv_budget_bytes
+        self.mirrors_dir = os.path.join(root, "mirrors")
+        self.worktrees_dir = os.path.join(root, "worktrees")
+        self.venvs_dir = os.path.join(root, "venvs")
+
+    # ---------- Git ----------
+    def mirror_path(self, repo_url: str) -> str:
+        return os.path.join(self.mirrors_dir, hashlib.sha1(repo_url.encode()).hexdigest()[:16] + ".git")
+
+    def update_mirror(self, repo_url: str) -> Repo:
+        path = self.mirror_path(repo_url)
+        if os.path.isdir(path):
+            try:
+                mirror = Repo(path)
+                mirror.git.remote("update", "--prune")
+                return mirror
+            except Exception as e:
+                # Only the mirror is rebuilt; cached venvs are untouched
+                print(f"   Mirror fetch failed ({e}), re-cloning mirror...")
+                shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(self.mirrors_dir, exist_ok=True)
+        print(f"   Mirroring {repo_url}...")
+        return Repo.clone_from(repo_url, path, mirror=True)
+
+    @contextmanager
+    def worktree(self, mirror: Repo, sha: str, run_id: str):
+        path = os.path.join(self.worktrees_dir, run_id)
+        os.makedirs(self.worktrees_dir, exist_ok=True)
+        mirror.git.worktree("prune")  # forget worktrees whose directory is gone
+        mirror.git.worktree("add", "--detach", "--force", path, sha)
+        try:
+            yield path
+        finally:
+            try:
+                mirror.git.worktree("remove", "--force", path)
+            except Exception:
+                shutil.rmtree(path, ignore_errors=True)
+                try: mirror.git.worktree("prune")
+                except Exception: pass
+
+    # ---------- Virtualenvs ----------
+    @contextmanager
+    def venv(self, checkout_dir: str, run_command: Callable[[List[str], str], int]):
+        """
+        Yield the python of a venv with the checkout's requirements (and
+        pytest) installed, creating it on a cache miss. `run_command(cmd,
+        cwd) -> exit code` runs the install steps so their output is logged.
+        """
+        requirements = find_requirements(checkout_dir)
+        key = requirements_key(checkout_dir, requirements)
+        os.makedirs(self.venvs_dir, exist_ok=True)
+        venv_dir = os.path.join(self.venvs_dir, key)
+        with open(venv_dir + ".lock", "a+") as lock:
+            _lock(lock, exclusive=True)
+            if not os.path.exists(os.path.join(venv_dir, ".ready")):
+                self._create_venv(venv_dir, checkout_dir, requirements, run_command)
+            _lock(lock, exclusive=False)  # downgrade: in use, but not being built
+            os.utime(os.path.join(venv_dir, ".ready"))  # LRU clock
+            self.evict(keep=key)
+            yield venv_python(venv_dir)
+
+    def _create_venv(self, venv_dir: str, checkout_dir: str, requirements: List[str],
+                     run_command: Callable[[List[str], str], int]):
+        shutil.rmtree(venv_dir, ignore_errors=True)  # leftover of an interrupted build
+        if run_command([sys.executable, "-m", "venv", venv_dir], checkout_dir) != 0:
+            shutil.rmtree(venv_dir, ignore_errors=True)
+            raise RuntimeError("Failed to create virtualenv")
+        install = [venv_python(venv_dir), "-m", "pip", "install", "--disable-pip-version-check", "pytest"]
+        for rel in requirements:
+            install += ["-r", rel]
+        if run_command(install, checkout_dir) != 0:
+            shutil.rmtree(venv_dir, ignore_errors=True)
+            raise RuntimeError("Failed to install requirements: " + (", ".join(requirements) or "pytest"))
+        with open(os.path.join(venv_dir, ".ready"), "w", encoding="utf-8") as f:
+            json.dump({"requirements": requirements, "size": dir_size(venv_dir), "created_at": time.time()}, f)
+
+    def cached_venvs(self) -> List[dict]:
+        """Ready venvs, least recently used first"""
+        venvs = []
+        try:
+            entries = list(os.scandir(self.venvs_dir))
+        except OSError:
+            return venvs
+        for entry in entries:
+            marker = os.path.join(entry.path, ".ready")
+            if not entry.is_dir() or not os.path.exists(marker): continue
+            try:
+                with open(marker, "r", encoding="utf-8") as f:
+                    size = json.load(f).get("size", 0)
+                venvs.append({"key": entry.name, "size": size, "last_used": os.path.getmtime(marker)})
+            except (OSError, ValueError):
+                continue
+        return sorted(venvs, key=lambda v: v["last_used"])
+
+    def evict(self, keep: Optional[str] = None):
+        """Delete least recently used venvs until the cache fits the budget; busy ones are skipped"""
+        venvs = self.cached_venvs()
+        total = sum(v["size"] for v in venvs)
+        for v in venvs:
+            if total <= self.venv_budget_bytes: break
+            if v["key"] == keep: continue
+            venv_dir = os.path.join(self.venvs_dir, v["key"])
+            with open(venv_dir + ".lock", "a+") as lock:
+                if not _lock(lock, exclusive=True, blocking=False): continue
+                shutil.rmtree(venv_dir, ignore_errors=True)
+            total -= v["size"]
+            print(f"   Evicted venv {v['key']} ({v['size'] // (1024 * 1024)} MB)")
@@ -0,0 +1,133 @@
+# File: server/ci_scheduler.py
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional
+from ci_engine import CIJobQueue, CIQueueFull
+
+# ==========================================
+# CI Repo Registry (SQLite, next to the CI runs)
+# ==========================================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ci_repos (
+    repo_url         TEXT PRIMARY KEY,
+    interval_minutes INTEGER NOT NULL,
+    timeout_minutes  INTEGER NOT NULL,
+    enabled          INTEGER NOT NULL DEFAULT 1,
+    updated_at       REAL NOT NULL
+);
+"""
+
+class CIRepoRegistry:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def upsert(self, repo_url: str, interval_minutes: int, timeout_minutes: int, enabled: bool = True) -> Dict:
+        conn = self.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ci_repos (repo_url, interval_minutes, timeout_minutes, enabled, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (repo_url, max(1, interval_minutes), max(1, timeout_minutes), int(enabled), time.time())
+            )
+        return self.get(repo_url)
+
+    def delete(self, repo_url: str) -> bool:
+        conn = self.connect()
+        with conn:
+            return conn.execute("DELETE FROM ci_repos WHERE repo_url = ?", (repo_url,)).rowcount > 0
+
+    def get(self, repo_url: str) -> Optional[Dict]:
+        row = self.connect().execute("SELECT * FROM ci_repos WHERE repo_url = ?", (repo_url,)).fetchone()
+        return self._repo_dict(row) if row else None
+
+    def list(self) -> List[Dict]:
+        return [self._repo_dict(row) for row in self.connect().execute("SELECT * FROM ci_repos ORDER BY repo_url")]
+
+    def _repo_dict(self, row) -> Dict:
+        repo = dict(row)
+        repo["enabled"] = bool(repo["enabled"])
+        return repo
+
+# ==========================================
+# Fair Scheduler
+# ==========================================
+def stagger_offset(repo_url: str, interval_s: float) -> float:
+    """Stable per-repo phase in [0, interval), so repos sharing an interval don't fire together"""
+    fraction = int(hashlib.sha1(repo_url.encode()).hexdigest()[:8], 16) / 0x100000000
+    return fraction * interval_s
+
+class FairCIScheduler:
+    """
+    Called on a short tick. Each repo is due every `interval_minutes`, with
+    its first run offset by a hash-derived phase. Due repos are submitted
+    most-overdue first; once the job queue is saturated the rest stay due
+    and keep their place for the next tick (backpressure), so a busy server
+    falls behind evenly instead of starving the same repos.
+    """
+    def __init__(self, queue: CIJobQueue, repos_fn: Callable[[], List[Dict]],
+                 on_dispatch: Optional[Callable[[float], None]] = None):
+        self.queue = queue
+        self.repos_fn = repos_fn
+        self.on_dispatch = on_dispatch  # called with each submitted repo's lag behind its due time
+        self._lock = threading.Lock()
+        self._next_due: Dict[str, float] = {}
+        self._intervals: Dict[str, float] = {}
+        self.deferred = 0  # due repos left waiting by the last tick
+
+    def tick(self, now: Optional[float] = None) -> List[str]:
+        """Submit due repos; returns the repo urls that were enqueued"""
+        now = time.time() if now is None else now
+        repos = {r["repo_url"]: r for r in self.repos_fn() if r.get("enabled", True)}
+        with self._lock:
+            for url in list(self._next_due):
+                if url not in repos:
+                    del self._next_due[url]
+                    del self._intervals[url]
+            for url, repo in repos.items():
+                interval = repo["interval_minutes"] * 60
+                if url not in self._next_due:
+                    self._next_due[url] = now + stagger_offset(url, interval)
+                elif interval != self._intervals[url]:
+                    self._next_due[url] = min(self._next_due[url], now + interval)
+                self._intervals[url] = interval
+            due = sorted((t, url) for url, t in self._next_due.items() if t <= now)
+
+            submitted = []
+            for i, (due_at, url) in enumerate(due):
+                try:
+                    job, coalesced = self.queue.submit(url, trigger="schedule",
+                                                       timeout=repos[url]["timeout_minutes"] * 60)
+                except CIQueueFull:
+                    self.deferred = len(due) - i
+                    print(f"⏳ [CI Scheduler] Queue saturated, deferring {self.deferred} due repos.")
+                    return submitted
+                self._next_due[url] = now + self._intervals[url]
+                if not coalesced: submitted.append(url)
+                if self.on_dispatch: self.on_dispatch(now - due_at)
+            self.deferred = 0
+            return submitted
+
+    def next_due(self, repo_url: str) -> Optional[float]:
+        return self._next_due.get(repo_url)
+
+    def due_times(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._next_due)
+
+    def max_overdue(self, now: Optional[float] = None) -> float:
+        """Seconds the most overdue repo has been waiting to be enqueued (scheduler lag)"""
+        now = time.time() if now is None else now
+        return max([now - t for t in list(self._next_due.values()) if t <= now], default=0.0)
@@ -0,0 +1,196 @@
+# File: server/ci_selection.py
+import os
+import ast
+import json
+import heapq
+from typing import Dict, List, Optional, Set
+
+# ==========================================
+# Change Classification
+# ==========================================
+# Changes to these never affect test outcomes
+IGNORED_SUFFIXES = {".md", ".rst", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico"}
+# Changes to these can affect any test, so they force the full suite
+FULL_SUITE_FILES = {"conftest.py", "pytest.ini", "setup.cfg", "setup.py", "pyproject.toml", "tox.ini"}
+SKIP_DIRS = {".git", ".git_guard", "__pycache__", "node_modules", ".venv", "venv", ".tox"}
+
+def is_test_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+def module_names(rel_path: str) -> List[str]:
+    """
+    Every dotted name a file could be imported as. 'server/main.py' yields
+    'server.main' and 'main', since test suites often put source dirs on
+    sys.path and import modules by their bare name.
+    """
+    parts = rel_path[:-3].replace("\\", "/").split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return [".".join(parts[i:]) for i in range(len(parts)) if parts[i:]]
+
+def parse_imports(source: str, rel_path: str) -> List[str]:
+    """Dotted names imported by a file; relative imports are made absolute"""
+    tree = ast.parse(source)
+    package = rel_path.replace("\\", "/").split("/")[:-1]
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package[:len(package) - node.level + 1] if node.level > 1 else package
+                prefix = ".".join(base + ([node.module] if node.module else []))
+            else:
+                prefix = node.module or ""
+            if prefix: names.append(prefix)
+            # 'from pkg import mod' may import a submodule
+            names.extend(f"{prefix}.{alias.name}" if prefix else alias.name for alias in node.names)
+    return names
+
+# ==========================================
+# Import Graph Index
+# ==========================================
+class ImportGraphIndex:
+    """
+    Reverse import graph of a checkout. Parsed imports are cached on disk per
+    file, keyed by (mtime, size) or, when given, the file's git blob id, so
+    after a pull only changed files are re-parsed. Blob ids keep the cache
+    valid across fresh worktrees, where every mtime is new.
+    """
+    def __init__(self, root: str, cache_path: Optional[str] = None):
+        self.root = root
+        self.cache_path = cache_path
+        self.files: Dict[str, List[str]] = {}       # rel path -> imported names
+        self.modules: Dict[str, Set[str]] = {}      # dotted name -> rel paths
+        self.importers: Dict[str, Set[str]] = {}    # rel path -> rel paths importing it
+
+    def build(self, blob_ids: Optional[Dict[str, str]] = None):
+        cache = self._load_cache()
+        fresh = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            for filename in filenames:
+                if not filename.endswith(".py"): continue
+                full = os.path.join(dirpath, filename)
+                rel = os.path.relpath(full, self.root).replace("\\", "/")
+                if blob_ids and rel in blob_ids:
+                    signature = blob_ids[rel]
+                else:
+                    st = os.stat(full)
+                    signature = [st.st_mtime_ns, st.st_size]
+                entry = cache.get(rel)
+                if entry is None or entry["sig"] != signature:
+                    try:
+                        with open(full, "r", encoding="utf-8", errors="replace") as f:
+                            imports = parse_imports(f.read(), rel)
+                    except SyntaxError:
+                        imports = []
+                    entry = {"sig": signature, "imports": imports}
+                fresh[rel] = entry
+        self._save_cache(fresh)
+
+        self.files = {rel: entry["imports"] for rel, entry in fresh.items()}
+        self.modules = {}
+        for rel in self.files:
+            for name in module_names(rel):
+                self.modules.setdefault(name, set()).add(rel)
+        self.importers = {}
+        for rel, imports in self.files.items():
+            for name in imports:
+                for target in self.modules.get(name, ()):
+                    if target != rel:
+                        self.importers.setdefault(target, set()).add(rel)
+        return self
+
+    def impacted_tests(self, changed: List[str]) -> Set[str]:
+        """Test files that are, or transitively import, any of the changed files"""
+        seen = set()
+        stack = [c for c in changed if c in self.files]
+        while stack:
+            rel = stack.pop()
+            if rel in seen: continue
+            seen.add(rel)
+            stack.extend(self.importers.get(rel, ()))
+        return {rel for rel in seen if is_test_file(rel)}
+
+    def _load_cache(self) -> Dict:
+        if not self.cache_path or not os.path.exists(self.cache_path): return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save_cache(self, entries: Dict):
+        if not self.cache_path: return
+        try:
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"⚠️ [CI] Failed to save import index: {e}")
+
+# ==========================================
+# Test Selection
+# ==========================================
+def git_blob_ids(ls_tree: str) -> Dict[str, str]:
+    """Parse `git ls-tree -r <commit>` ('<mode> blob <id>\t<path>') into {path: blob id}"""
+    blobs = {}
+    for line in ls_tree.splitlines():
+        meta, _, path = line.partition("\t")
+        fields = meta.split()
+        if len(fields) == 3 and fields[1] == "blob" and path:
+            blobs[path] = fields[2]
+    return blobs
+
+def select_tests(index: ImportGraphIndex, name_status: List[tuple]) -> Optional[List[str]]:
+    """
+    Map `git diff --name-status` entries to the test files to run.
+    Returns None when the change cannot be mapped safely (full suite needed),
+    or a possibly empty, sorted list of test files.
+    """
+    changed = []
+    for status, path in name_status:
+        path = path.replace("\\", "/")
+        name = os.path.basename(path)
+        _, ext = os.path.splitext(name)
+        if ext.lower() in IGNORED_SUFFIXES: continue
+        if name in FULL_SUITE_FILES or name.startswith("requirements"): return None
+        if ext != ".py": return None
+        # Whoever imported a deleted or renamed-away module is no longer in the graph
+        if status[0] in ("D", "R"): return None
+        changed.append(path)
+    return sorted(index.impacted_tests(changed))
+
+# ==========================================
+# Test Sharding
+# ==========================================
+DEFAULT_TEST_SECONDS = 0.5  # cost assumed for a test with no history and nothing to average
+
+def parse_collected_ids(output: str) -> List[str]:
+    """Node ids from `pytest --collect-only -q` output"""
+    return [line.strip() for line in output.splitlines() if "::" in line and not line.startswith(" ")]
+
+def plan_shards(nodeids: List[str], history: Dict[str, Dict], shard_count: int) -> List[List[str]]:
+    """
+    Split tests into `shard_count` shards of similar total duration (greedy
+    longest-first onto the least loaded shard). Tests that failed last time
+    are placed first, so every shard reports them before anything else.
+    Unknown tests cost the average known duration.
+    """
+    known = [h["duration_s"] for h in history.values()]
+    default = sum(known) / len(known) if known else DEFAULT_TEST_SECONDS
+    cost = {n: history[n]["duration_s"] if n in history else default for n in nodeids}
+
+    def failed_before(n): return history.get(n, {}).get("outcome") in ("failed", "error")
+
+    shard_count = max(1, min(shard_count, len(nodeids)))
+    shards = [[] for _ in range(shard_count)]
+    heap = [(0.0, i) for i in range(shard_count)]
+    for nodeid in sorted(nodeids, key=lambda n: (not failed_before(n), -cost[n], n)):
+        load, i = heapq.heappop(heap)
+        shards[i].append(nodeid)
+        heapq.heappush(heap, (load + cost[nodeid], i))
+    return [shard for shard in shards if shard]
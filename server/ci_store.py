@@ -0,0 +1,308 @@
+# File: server/ci_store.py
+import os
+import json
+import time
+import sqlite3
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# ==========================================
+# JUnit XML Parsing (pytest -o junit_family=xunit1)
+# ==========================================
+def junit_nodeid(case) -> str:
+    """Rebuild the pytest node id from a <testcase> (xunit1 carries the file)"""
+    name = case.get("name", "")
+    classname = case.get("classname", "")
+    path = case.get("file")
+    if not path:
+        return f"{classname}::{name}" if classname else name
+    path = path.replace("\\", "/")
+    module = path[:-3].replace("/", ".") if path.endswith(".py") else path
+    inner = classname[len(module):].lstrip(".") if classname.startswith(module) else ""
+    return "::".join([path] + (inner.split(".") if inner else []) + [name])
+
+def parse_junit_xml(path: str) -> List[Dict]:
+    """Per-test outcomes: [{nodeid, outcome, duration_s, message}]"""
+    if not os.path.exists(path): return []
+    results = []
+    for case in ET.parse(path).getroot().iter("testcase"):
+        outcome, message = "passed", ""
+        for tag in ("failure", "error", "skipped"):
+            node = case.find(tag)
+            if node is not None:
+                outcome = {"failure": "failed", "error": "error", "skipped": "skipped"}[tag]
+                message = (node.get("message") or "")[:500]
+                break
+        results.append({
+            "nodeid": junit_nodeid(case),
+            "outcome": outcome,
+            "duration_s": float(case.get("time") or 0),
+            "message": message,
+        })
+    return results
+
+def summarize_tests(tests: List[Dict]) -> Dict:
+    counts = {"total": len(tests), "passed": 0, "failed": 0, "error": 0, "skipped": 0}
+    for t in tests:
+        counts[t["outcome"]] = counts.get(t["outcome"], 0) + 1
+    return counts
+
+# ==========================================
+# CI Run Store (SQLite): one row per executed run
+# ==========================================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ci_runs (
+    run_id      TEXT PRIMARY KEY,
+    repo_url    TEXT NOT NULL,
+    sha         TEXT,
+    trigger     TEXT NOT NULL,
+    status      TEXT NOT NULL,    -- Success | Failed | Cancelled | Timed Out | System Error
+    selection   TEXT NOT NULL,    -- full | impacted | none
+    started_at  REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    duration_s  REAL NOT NULL,
+    exit_code   INTEGER,
+    total       INTEGER NOT NULL DEFAULT 0,
+    passed      INTEGER NOT NULL DEFAULT 0,
+    failed      INTEGER NOT NULL DEFAULT 0,
+    errors      INTEGER NOT NULL DEFAULT 0,
+    skipped     INTEGER NOT NULL DEFAULT 0,
+    details     TEXT NOT NULL DEFAULT '',  -- one-line summary
+    output_tail TEXT NOT NULL DEFAULT ''   -- last few KB of pytest output
+);
+CREATE INDEX IF NOT EXISTS idx_ci_runs_sha      ON ci_runs (repo_url, sha, finished_at);
+CREATE INDEX IF NOT EXISTS idx_ci_runs_finished ON ci_runs (repo_url, finished_at);
+CREATE INDEX IF NOT EXISTS idx_ci_runs_recent   ON ci_runs (finished_at);
+
+CREATE TABLE IF NOT EXISTS ci_test_results (
+    run_id     TEXT NOT NULL,
+    nodeid     TEXT NOT NULL,
+    outcome    TEXT NOT NULL,
+    duration_s REAL NOT NULL,
+    message    TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (run_id, nodeid)
+) WITHOUT ROWID;
+
+-- Multi-worker: the leader mirrors its job queue here for the other workers
+CREATE TABLE IF NOT EXISTS ci_jobs (
+    job_id     TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    finished   INTEGER NOT NULL DEFAULT 0,
+    data       TEXT NOT NULL      -- CIJob.to_dict() as JSON
+);
+CREATE INDEX IF NOT EXISTS idx_ci_jobs_created ON ci_jobs (created_at);
+
+-- Multi-worker: commands (run/cancel) posted by followers for the leader to execute
+CREATE TABLE IF NOT EXISTS ci_commands (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind       TEXT NOT NULL,
+    payload    TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    result     TEXT              -- JSON, set by the leader
+);
+
+-- Multi-worker: snapshots of leader-only in-memory state (scheduler, queue)
+CREATE TABLE IF NOT EXISTS ci_state (
+    key        TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    data       TEXT NOT NULL
+);
+"""
+
+# Results that describe the code at a SHA, and can therefore be reused
+CONCLUSIVE_STATUSES = ("Success", "Failed")
+
+def _fmt(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else None
+
+class CIRunStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def record_run(self, run: Dict, tests: List[Dict]):
+        counts = summarize_tests(tests)
+        row = dict(run, total=counts["total"], passed=counts["passed"], failed=counts["failed"],
+                   errors=counts["error"], skipped=counts["skipped"])
+        conn = self.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ci_runs (run_id, repo_url, sha, trigger, status, selection, started_at, "
+                "finished_at, duration_s, exit_code, total, passed, failed, errors, skipped, details, output_tail) "
+                "VALUES (:run_id, :repo_url, :sha, :trigger, :status, :selection, :started_at, :finished_at, "
+                ":duration_s, :exit_code, :total, :passed, :failed, :errors, :skipped, :details, :output_tail)",
+                row
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO ci_test_results (run_id, nodeid, outcome, duration_s, message) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(run["run_id"], t["nodeid"], t["outcome"], t["duration_s"], t["message"]) for t in tests]
+            )
+
+    def get_run(self, run_id: str) -> Optional[Dict]:
+        row = self.connect().execute("SELECT * FROM ci_runs WHERE run_id = ?", (run_id,)).fetchone()
+        return self._run_dict(row, with_output=True) if row else None
+
+    def find_conclusive_run(self, repo_url: str, sha: str) -> Optional[Dict]:
+        """Most recent Success/Failed run of this exact commit"""
+        row = self.connect().execute(
+            "SELECT * FROM ci_runs WHERE repo_url = ? AND sha = ? AND status IN (?, ?) "
+            "ORDER BY finished_at DESC LIMIT 1", (repo_url, sha, *CONCLUSIVE_STATUSES)
+        ).fetchone()
+        return self._run_dict(row) if row else None
+
+    def latest_conclusive_run(self, repo_url: str) -> Optional[Dict]:
+        row = self.connect().execute(
+            "SELECT * FROM ci_runs WHERE repo_url = ? AND status IN (?, ?) "
+            "ORDER BY finished_at DESC LIMIT 1", (repo_url, *CONCLUSIVE_STATUSES)
+        ).fetchone()
+        return self._run_dict(row) if row else None
+
+    def latest_run(self, repo_url: Optional[str] = None) -> Optional[Dict]:
+        if repo_url:
+            row = self.connect().execute(
+                "SELECT * FROM ci_runs WHERE repo_url = ? ORDER BY finished_at DESC LIMIT 1", (repo_url,)
+            ).fetchone()
+        else:
+            row = self.connect().execute("SELECT * FROM ci_runs ORDER BY finished_at DESC LIMIT 1").fetchone()
+        return self._run_dict(row) if row else None
+
+    def list_runs(self, repo_url: Optional[str] = None, sha: Optional[str] = None,
+                  before: Optional[float] = None, limit: int = 20) -> List[Dict]:
+        clauses, params = [], []
+        if repo_url:
+            clauses.append("repo_url = ?")
+            params.append(repo_url)
+        if sha:
+            clauses.append("sha = ?")
+            params.append(sha)
+        if before is not None:
+            clauses.append("finished_at < ?")
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.connect().execute(
+            f"SELECT * FROM ci_runs {where} ORDER BY finished_at DESC LIMIT ?", params + [limit]
+        ).fetchall()
+        return [self._run_dict(row) for row in rows]
+
+    def list_tests(self, run_id: str, outcome: Optional[str] = None,
+                   offset: int = 0, limit: int = 100) -> List[Dict]:
+        sql = "SELECT nodeid, outcome, duration_s, message FROM ci_test_results WHERE run_id = ?"
+        params = [run_id]
+        if outcome:
+            sql += " AND outcome = ?"
+            params.append(outcome)
+        sql += " ORDER BY nodeid LIMIT ? OFFSET ?"
+        return [dict(row) for row in self.connect().execute(sql, params + [limit, offset])]
+
+    def test_history(self, repo_url: str, runs: int = 10) -> Dict[str, Dict]:
+        """Latest {duration_s, outcome} of each test over the repo's last `runs` executed runs"""
+        rows = self.connect().execute(
+            "SELECT t.nodeid, t.outcome, t.duration_s FROM ci_test_results t "
+            "JOIN (SELECT run_id, finished_at FROM ci_runs WHERE repo_url = ? AND total > 0 "
+            "      ORDER BY finished_at DESC LIMIT ?) r ON r.run_id = t.run_id "
+            "ORDER BY r.finished_at DESC", (repo_url, runs)
+        )
+        history = {}
+        for row in rows:
+            if row["nodeid"] not in history:
+                history[row["nodeid"]] = {"duration_s": row["duration_s"], "outcome": row["outcome"]}
+        return history
+
+    # ---------- Job mirror (written by the leader) ----------
+    def save_job(self, job: Dict, created_at: float, finished: bool, keep: int = 500):
+        conn = self.connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO ci_jobs (job_id, created_at, finished, data) VALUES (?, ?, ?, ?)",
+                         (job["job_id"], created_at, int(finished), json.dumps(job)))
+            if finished:
+                conn.execute("DELETE FROM ci_jobs WHERE created_at < (SELECT MIN(created_at) FROM "
+                             "(SELECT created_at FROM ci_jobs ORDER BY created_at DESC LIMIT ?))", (keep,))
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        row = self.connect().execute("SELECT data FROM ci_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def list_jobs(self, limit: int = 100) -> List[Dict]:
+        rows = self.connect().execute("SELECT data FROM ci_jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [json.loads(row["data"]) for row in rows]
+
+    def abandon_unfinished_jobs(self, details: str) -> int:
+        """Mark jobs a dead leader left queued/running as errored"""
+        conn = self.connect()
+        rows = conn.execute("SELECT job_id, created_at, data FROM ci_jobs WHERE finished = 0").fetchall()
+        for row in rows:
+            job = dict(json.loads(row["data"]), status="error", result="System Error", details=details)
+            self.save_job(job, row["created_at"], finished=True)
+        return len(rows)
+
+    def save_state(self, key: str, data: Dict):
+        conn = self.connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO ci_state (key, updated_at, data) VALUES (?, ?, ?)",
+                         (key, time.time(), json.dumps(data)))
+
+    def load_state(self, key: str) -> Optional[Dict]:
+        """Last snapshot saved under `key`, with its `updated_at`"""
+        row = self.connect().execute("SELECT updated_at, data FROM ci_state WHERE key = ?", (key,)).fetchone()
+        return dict(json.loads(row["data"]), updated_at=row["updated_at"]) if row else None
+
+    # ---------- Command inbox (followers -> leader) ----------
+    def post_command(self, kind: str, payload: Dict) -> int:
+        conn = self.connect()
+        with conn:
+            return conn.execute("INSERT INTO ci_commands (kind, payload, created_at) VALUES (?, ?, ?)",
+                                (kind, json.dumps(payload), time.time())).lastrowid
+
+    def pending_commands(self) -> List[Dict]:
+        rows = self.connect().execute("SELECT id, kind, payload FROM ci_commands WHERE result IS NULL ORDER BY id")
+        return [{"id": row["id"], "kind": row["kind"], "payload": json.loads(row["payload"])} for row in rows]
+
+    def complete_command(self, command_id: int, result: Dict, keep_seconds: float = 3600):
+        conn = self.connect()
+        with conn:
+            conn.execute("UPDATE ci_commands SET result = ? WHERE id = ?", (json.dumps(result), command_id))
+            conn.execute("DELETE FROM ci_commands WHERE created_at < ?", (time.time() - keep_seconds,))
+
+    def command_result(self, command_id: int) -> Optional[Dict]:
+        row = self.connect().execute("SELECT result FROM ci_commands WHERE id = ?", (command_id,)).fetchone()
+        return json.loads(row["result"]) if row and row["result"] else None
+
+    def _run_dict(self, row, with_output: bool = False) -> Dict:
+        run = dict(row)
+        if not with_output:
+            run.pop("output_tail", None)
+        run["started"] = _fmt(run["started_at"])
+        run["finished"] = _fmt(run["finished_at"])
+        run["tests"] = {"total": run.pop("total"), "passed": run.pop("passed"), "failed": run.pop("failed"),
+                        "error": run.pop("errors"), "skipped": run.pop("skipped")}
+        return run
+
+    def status_summary(self, repo_url: Optional[str] = None) -> Dict:
+        """Compact payload for GET /api/v1/ci/status (no log text)"""
+        run = self.latest_run(repo_url)
+        if run is None:
+            return {"status": "Never Ran", "last_run": None, "details": "No runs yet."}
+        return {
+            "status": run["status"],
+            "last_run": run["finished"],
+            "run_id": run["run_id"],
+            "repo_url": run["repo_url"],
+            "sha": run["sha"],
+            "selection": run["selection"],
+            "duration_s": run["duration_s"],
+            "tests": run["tests"],
+            "details": run["details"],
+        }
@@ -0,0 +1,729 @@
+# File: server/commit_store.py
+import io
+import os
+import csv
+import json
+import time
+import zlib
+import base64
+import sqlite3
+import hashlib
+import argparse
+import threading
+from collections import deque, Counter
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Tuple, Callable
+
+try:
+    import fcntl  # POSIX only: serializes spill/replay between server workers
+except ImportError:
+    fcntl = None
+
+# ==========================================
+# Storage: Append-only Commit Log (SQLite WAL)
+# ==========================================
+COMMIT_COLUMNS = ["ts", "developer_id", "repo_name", "risk_level", "commit_msg", "ai_summary"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts           INTEGER NOT NULL,  -- epoch ms: the record's own timestamp (commit time, queued or backfilled),
+                                    -- else server receive time
+    developer_id TEXT NOT NULL,
+    repo_name    TEXT NOT NULL,
+    risk_level   TEXT NOT NULL,
+    commit_msg   TEXT NOT NULL,
+    ai_summary   TEXT NOT NULL
+);
+-- Every filter index ends in ts so it also serves the (ts, id) keyset order;
+-- id is the rowid and therefore implicitly part of each index.
+CREATE INDEX IF NOT EXISTS idx_commits_ts        ON commits (ts);
+CREATE INDEX IF NOT EXISTS idx_commits_developer ON commits (developer_id, ts);
+CREATE INDEX IF NOT EXISTS idx_commits_repo      ON commits (repo_name, ts);
+CREATE INDEX IF NOT EXISTS idx_commits_risk      ON commits (risk_level, ts);
+
+-- Pre-aggregated commit counts, maintained in the same transaction as the rows
+CREATE TABLE IF NOT EXISTS rollups (
+    granularity TEXT NOT NULL,     -- 'hour' | 'day'
+    bucket      INTEGER NOT NULL,  -- bucket start (UTC), epoch milliseconds
+    dimension   TEXT NOT NULL,     -- 'total' | 'repo' | 'developer' | 'risk'
+    key         TEXT NOT NULL,
+    count       INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, dimension, key)
+) WITHOUT ROWID;
+
+-- Sealed partitions: rows of a closed week, packed in (ts, id) order into
+-- compressed chunks of a bounded size. The open week lives in `commits`.
+-- A chunk is keyed by its first row, so chunks are disjoint and the primary
+-- key walks them newest-first like the keyset index over open rows.
+CREATE TABLE IF NOT EXISTS chunks (
+    min_ts    INTEGER NOT NULL,
+    min_id    INTEGER NOT NULL,
+    max_ts    INTEGER NOT NULL,
+    part_start INTEGER NOT NULL,  -- week start (UTC), epoch milliseconds
+    row_count INTEGER NOT NULL,
+    data      BLOB NOT NULL,     -- zlib(JSON rows [id, ts, ...] sorted by (ts, id))
+    PRIMARY KEY (min_ts, min_id)
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_partition ON chunks (part_start);
+
+-- Distinct filter values per chunk: a filtered page only opens chunks that
+-- contain the value, found by an index range scan in the same order.
+CREATE TABLE IF NOT EXISTS chunk_keys (
+    col    TEXT NOT NULL,
+    value  TEXT NOT NULL,
+    min_ts INTEGER NOT NULL,
+    min_id INTEGER NOT NULL,
+    PRIMARY KEY (col, value, min_ts, min_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# ==========================================
+# Rollups: Hourly / Daily Commit Counts
+# ==========================================
+GRANULARITY_MS = {"hour": 3_600_000, "day": 86_400_000}
+ROLLUP_DIMENSIONS = {"repo": "repo_name", "developer": "developer_id", "risk": "risk_level"}
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+def encode_cursor(ts: int, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{ts}:{row_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Raises ValueError for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.split(":")
+        return int(ts), int(row_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+# ==========================================
+# Partitions: Weekly, Compressed once Sealed
+# ==========================================
+PARTITION_MS = 7 * 86_400_000
+PARTITION_OFFSET_MS = 4 * 86_400_000  # epoch day 0 is a Thursday; weeks start on Monday
+PARTITION_FILTER_COLUMNS = ("developer_id", "repo_name", "risk_level")
+CHUNK_ROWS = 1000
+
+def partition_start(ts: int, partition_ms: int = PARTITION_MS) -> int:
+    return (ts - PARTITION_OFFSET_MS) // partition_ms * partition_ms + PARTITION_OFFSET_MS
+
+def pack_chunk(records: List[Dict]) -> bytes:
+    """Records must already be sorted by (ts, id)"""
+    rows = [[r["id"]] + [r[c] for c in COMMIT_COLUMNS] for r in records]
+    return zlib.compress(json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+def unpack_chunk(data: bytes) -> List[Dict]:
+    return [dict(zip(["id"] + COMMIT_COLUMNS, row)) for row in json.loads(zlib.decompress(data))]
+
+def legacy_csv_offset(data: bytes, stored: Optional[str]) -> Optional[int]:
+    """
+    Bytes of the legacy CSV that were already imported, or None if the
+    file no longer starts with them. Older imports stored only the digest
+    of the whole file, which is matched against each line boundary.
+    """
+    if not stored: return 0
+    try:
+        state = json.loads(stored)
+    except ValueError:
+        state = None
+    if isinstance(state, dict):
+        offset = state["offset"]
+        if len(data) >= offset and hashlib.sha256(data[:offset]).hexdigest() == state["digest"]:
+            return offset
+        return None
+    h, offset = hashlib.sha256(), 0
+    for line in data.splitlines(keepends=True):
+        h.update(line)
+        offset += len(line)
+        if h.hexdigest() == stored: return offset
+    return None
+
+def rollup_deltas(records: List[Dict]) -> Counter:
+    """Count records per (granularity, bucket, dimension, key)"""
+    deltas = Counter()
+    for record in records:
+        for granularity, size in GRANULARITY_MS.items():
+            bucket = record["ts"] // size * size
+            deltas[(granularity, bucket, "total", "")] += 1
+            for dimension, column in ROLLUP_DIMENSIONS.items():
+                deltas[(granularity, bucket, dimension, record[column])] += 1
+    return deltas
+
+def format_rollups(rows, granularity: str) -> Dict:
+    """Shape (bucket, dimension, key, count) rows into the /api/v1/stats payload"""
+    buckets = {}
+    totals = {"total": 0, "by_repo": {}, "by_developer": {}, "by_risk": {}}
+    for bucket, dimension, key, count in rows:
+        if count == 0: continue
+        entry = buckets.setdefault(bucket, {
+            "bucket": datetime.fromtimestamp(bucket / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "bucket_ts": bucket,
+            "total": 0, "by_repo": {}, "by_developer": {}, "by_risk": {},
+        })
+        if dimension == "total":
+            entry["total"] += count
+            totals["total"] += count
+        else:
+            field = f"by_{dimension}"
+            entry[field][key] = entry[field].get(key, 0) + count
+            totals[field][key] = totals[field].get(key, 0) + count
+    return {
+        "granularity": granularity,
+        "buckets": [buckets[b] for b in sorted(buckets)],
+        "totals": totals,
+    }
+
+class PendingRollups:
+    """
+    Rollup deltas for records accepted by /track but not yet group-committed.
+    Stats are served as persisted rollups + these deltas, so counts are
+    current without ever scanning the log.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas = Counter()
+
+    def record(self, record: Dict):
+        deltas = rollup_deltas([record])
+        with self._lock:
+            self._deltas.update(deltas)
+
+    def settle(self, records: List[Dict]):
+        deltas = rollup_deltas(records)
+        with self._lock:
+            self._deltas.subtract(deltas)
+            for k in [k for k, v in self._deltas.items() if v == 0]:
+                del self._deltas[k]
+
+    def rows(self, granularity: str, start_ms: int, end_ms: int):
+        with self._lock:
+            return [
+                (bucket, dimension, key, count)
+                for (g, bucket, dimension, key), count in self._deltas.items()
+                if g == granularity and start_ms <= bucket < end_ms
+            ]
+
+class CommitLogStore:
+    """
+    Durable commit log. Every thread gets its own SQLite connection. Rows
+    of the open partition are indexed in `commits`; closed partitions are
+    sealed into compressed chunks of `chunk_rows` and dropped after
+    `retention_days` (None keeps them forever). Rollups are kept, so stats
+    outlive raw rows.
+    """
+    def __init__(self, db_path: str, partition_ms: int = PARTITION_MS,
+                 retention_days: Optional[int] = None, chunk_rows: int = CHUNK_ROWS):
+        self.db_path = db_path
+        self.partition_ms = partition_ms
+        self.retention_days = retention_days
+        self.chunk_rows = chunk_rows
+        self._local = threading.local()
+        self._connections = []
+        self._conn_lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Batches are group-committed, so a full fsync per commit is affordable
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            with self._conn_lock:
+                self._connections.append(conn)
+        return conn
+
+    def append_many(self, records: List[Dict]) -> int:
+        """Insert a batch of records in a single transaction"""
+        if not records: return 0
+        conn = self.connect()
+        with conn:
+            self._insert(conn, records)
+        return len(records)
+
+    def _insert(self, conn: sqlite3.Connection, records: List[Dict]):
+        """Rows plus their rollup deltas, inside the caller's transaction"""
+        placeholders = ", ".join(f":{c}" for c in COMMIT_COLUMNS)
+        conn.executemany(
+            f"INSERT INTO commits ({', '.join(COMMIT_COLUMNS)}) VALUES ({placeholders})",
+            records
+        )
+        conn.executemany(
+            "INSERT INTO rollups (granularity, bucket, dimension, key, count) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (granularity, bucket, dimension, key) DO UPDATE SET count = count + excluded.count",
+            [(*k, v) for k, v in rollup_deltas(records).items()]
+        )
+
+    def rollup_rows(self, granularity: str, start_ms: int, end_ms: int):
+        """Primary-key range scan: cost depends on the window, not on history"""
+        return [tuple(row) for row in self.connect().execute(
+            "SELECT bucket, dimension, key, count FROM rollups "
+            "WHERE granularity = ? AND bucket >= ? AND bucket < ?",
+            (granularity, start_ms, end_ms)
+        )]
+
+    def pruned_before(self) -> int:
+        """Raw rows before this day boundary may have been dropped by retention"""
+        row = self.connect().execute("SELECT value FROM meta WHERE key = 'pruned_before'").fetchone()
+        return int(row[0]) if row else 0
+
+    def rebuild_rollups(self):
+        """
+        Recompute rollups from the open rows and the sealed chunks. Buckets
+        before the retention watermark are kept as they are, since their
+        raw rows are gone.
+        """
+        since = self.pruned_before()
+        conn = self.connect()
+        with conn:
+            conn.execute("DELETE FROM rollups WHERE bucket >= ?", (since,))
+            for granularity, size in GRANULARITY_MS.items():
+                conn.execute(
+                    "INSERT INTO rollups SELECT ?, ts / ? * ?, 'total', '', COUNT(*) FROM commits WHERE ts >= ? GROUP BY 2",
+                    (granularity, size, size, since)
+                )
+                for dimension, column in ROLLUP_DIMENSIONS.items():
+                    conn.execute(
+                        f"INSERT INTO rollups SELECT ?, ts / ? * ?, ?, {column}, COUNT(*) FROM commits WHERE ts >= ? "
+                        "GROUP BY 2, 4",
+                        (granularity, size, size, dimension, since)
+                    )
+            for (data,) in conn.execute("SELECT data FROM chunks WHERE max_ts >= ?", (since,)):
+                deltas = rollup_deltas([r for r in unpack_chunk(data) if r["ts"] >= since])
+                conn.executemany(
+                    "INSERT INTO rollups (granularity, bucket, dimension, key, count) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (granularity, bucket, dimension, key) DO UPDATE SET count = count + excluded.count",
+                    [(*k, v) for k, v in deltas.items()]
+                )
+
+    def import_legacy_csv(self, csv_path: str) -> int:
+        """
+        Backfill rows from the pre-SQLite commit_history.csv. The imported
+        byte prefix (length + digest) is recorded with the rows, so lines
+        appended later are imported on the next call and no row twice.
+        """
+        if not os.path.exists(csv_path): return 0
+        with open(csv_path, 'rb') as f:
+            data = f.read()
+        conn = self.connect()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'legacy_csv'").fetchone()
+        offset = legacy_csv_offset(data, row[0] if row else None)
+        if offset is None:
+            print(f"⚠️ [Commit Log] {csv_path} was rewritten since it was imported; not importing it again.")
+            return 0
+        end = data.rfind(b"\n") + 1  # complete lines only; a partial last line waits for the next call
+        if end <= offset: return 0
+
+        text = data[:end] if offset == 0 else data[:data.find(b"\n") + 1] + data[offset:end]
+        records = []
+        for row in csv.DictReader(io.StringIO(text.decode("utf-8", "replace"), newline='')):
+            try:
+                ts = datetime.strptime(row["Timestamp"], "%Y-%m-%d %H:%M:%S")
+            except (KeyError, TypeError, ValueError):
+                continue
+            records.append({
+                "ts": int(ts.timestamp() * 1000),
+                "developer_id": row.get("Developer") or "",
+                "repo_name": row.get("Repo") or "",
+                "risk_level": row.get("Risk") or "",
+                "commit_msg": row.get("Message") or "",
+                "ai_summary": row.get("AI Summary") or "",
+            })
+        state = json.dumps({"offset": end, "digest": hashlib.sha256(data[:end]).hexdigest()})
+        with conn:
+            if records: self._insert(conn, records)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_csv', ?)", (state,))
+        return len(records)
+
+    def query(self, developer_id: Optional[str] = None, repo_name: Optional[str] = None,
+              risk_level: Optional[str] = None, since_ms: Optional[int] = None,
+              until_ms: Optional[int] = None, cursor: Optional[str] = None,
+              limit: int = 50) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Newest-first page of commits plus the cursor for the next page.
+        Pagination is keyset-based on (ts, id), so every page is an index
+        range scan regardless of how deep into history it is.
+        """
+        clauses, params = [], []
+        for column, value in (("developer_id", developer_id), ("repo_name", repo_name), ("risk_level", risk_level)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since_ms is not None:
+            clauses.append("ts >= ?")
+            params.append(since_ms)
+        if until_ms is not None:
+            clauses.append("ts < ?")
+            params.append(until_ms)
+        if cursor:
+            clauses.append("(ts, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT id, {', '.join(COMMIT_COLUMNS)} FROM commits {where} ORDER BY ts DESC, id DESC LIMIT ?"
+        rows = [dict(row) for row in self.connect().execute(sql, params + [limit + 1]).fetchall()]
+        filters = {"developer_id": developer_id, "repo_name": repo_name, "risk_level": risk_level}
+        rows += self._sealed_rows(filters, since_ms, until_ms, decode_cursor(cursor) if cursor else None, limit + 1)
+        rows.sort(key=lambda r: (r["ts"], r["id"]), reverse=True)
+
+        items = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = encode_cursor(last["ts"], last["id"])
+        return items, next_cursor
+
+    def _sealed_rows(self, filters: Dict, since_ms: Optional[int], until_ms: Optional[int],
+                     cursor: Optional[Tuple[int, int]], need: int) -> List[Dict]:
+        """
+        Up to `need` newest matching rows from sealed chunks. Chunks are
+        walked newest-first by primary key (or, with a filter, through
+        chunk_keys) starting below the cursor, so a page opens only the few
+        chunks that hold its rows however deep it is.
+        """
+        filters = {c: v for c, v in filters.items() if v is not None}
+        key = "k" if filters else "c"  # table whose index drives the newest-first walk
+        clauses, params = [], []
+        if until_ms is not None:
+            clauses.append(f"{key}.min_ts < ?")
+            params.append(until_ms)
+        if cursor:
+            clauses.append(f"({key}.min_ts, {key}.min_id) < (?, ?)")
+            params.extend(cursor)
+        source = "chunks c"
+        if filters:
+            # Drive the scan from one filter's key index, check the others by key lookup
+            (first_col, first_value), *others = filters.items()
+            source = "chunk_keys k JOIN chunks c ON c.min_ts = k.min_ts AND c.min_id = k.min_id"
+            clauses[:0] = ["k.col = ?", "k.value = ?"]
+            params[:0] = [first_col, first_value]
+            for col, value in others:
+                clauses.append("EXISTS (SELECT 1 FROM chunk_keys o WHERE o.col = ? AND o.value = ? "
+                               "AND o.min_ts = c.min_ts AND o.min_id = c.min_id)")
+                params.extend([col, value])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        chunks = self.connect().execute(
+            f"SELECT c.max_ts, c.data FROM {source} {where} ORDER BY {key}.min_ts DESC, {key}.min_id DESC", params)
+
+        found = []
+        for max_ts, data in chunks:
+            if since_ms is not None and max_ts < since_ms: break
+            for record in reversed(unpack_chunk(data)):
+                if since_ms is not None and record["ts"] < since_ms: break
+                if until_ms is not None and record["ts"] >= until_ms: continue
+                if cursor and (record["ts"], record["id"]) >= cursor: continue
+                if any(record[c] != v for c, v in filters.items()): continue
+                found.append(record)
+                if len(found) >= need: return found
+        return found
+
+    def seal_partitions(self, now: Optional[int] = None) -> int:
+        """
+        Move rows of every closed partition out of `commits` into compressed
+        chunks. Late rows for an already sealed partition are merged by
+        repacking its chunks, so chunks stay disjoint. Returns the rows sealed.
+        """
+        open_start = partition_start(now_ms() if now is None else now, self.partition_ms)
+        conn = self.connect()
+        sealed = 0
+        starts = [row[0] for row in conn.execute(
+            "SELECT DISTINCT (ts - ?) / ? * ? + ? FROM commits WHERE ts < ?",
+            (PARTITION_OFFSET_MS, self.partition_ms, self.partition_ms, PARTITION_OFFSET_MS, open_start)
+        )]
+        for start in starts:
+            end = start + self.partition_ms
+            with conn:
+                rows = [dict(r) for r in conn.execute(
+                    f"SELECT id, {', '.join(COMMIT_COLUMNS)} FROM commits WHERE ts >= ? AND ts < ?", (start, end))]
+                records = list(rows)
+                for (data,) in conn.execute("SELECT data FROM chunks WHERE part_start = ?", (start,)).fetchall():
+                    records += unpack_chunk(data)
+                records.sort(key=lambda r: (r["ts"], r["id"]))
+                self._drop_chunks(conn, "part_start = ?", (start,))
+                for i in range(0, len(records), self.chunk_rows):
+                    chunk = records[i:i + self.chunk_rows]
+                    first = chunk[0]
+                    conn.execute(
+                        "INSERT INTO chunks (min_ts, min_id, max_ts, part_start, row_count, data) VALUES (?, ?, ?, ?, ?, ?)",
+                        (first["ts"], first["id"], chunk[-1]["ts"], start, len(chunk), pack_chunk(chunk))
+                    )
+                    conn.executemany(
+                        "INSERT INTO chunk_keys (col, value, min_ts, min_id) VALUES (?, ?, ?, ?)",
+                        [(c, v, first["ts"], first["id"])
+                         for c in PARTITION_FILTER_COLUMNS for v in {r[c] for r in chunk}]
+                    )
+                conn.execute("DELETE FROM commits WHERE ts >= ? AND ts < ?", (start, end))
+            sealed += len(rows)
+        return sealed
+
+    def _drop_chunks(self, conn: sqlite3.Connection, where: str, params: Tuple) -> int:
+        """Delete matching chunks with their keys; returns the rows they held"""
+        dropped = conn.execute(f"SELECT COALESCE(SUM(row_count), 0) FROM chunks WHERE {where}", params).fetchone()[0]
+        conn.execute(f"DELETE FROM chunk_keys WHERE (min_ts, min_id) IN (SELECT min_ts, min_id FROM chunks WHERE {where})",
+                     params)
+        conn.execute(f"DELETE FROM chunks WHERE {where}", params)
+        return dropped
+
+    def prune(self, now: Optional[int] = None) -> int:
+        """Drop raw rows older than the retention window; returns the rows dropped"""
+        if self.retention_days is None: return 0
+        cutoff = (now_ms() if now is None else now) - self.retention_days * 86_400_000
+        # Rollup buckets from the next day on can still be rebuilt from raw rows
+        day = GRANULARITY_MS["day"]
+        watermark = -(-cutoff // day) * day
+        conn = self.connect()
+        with conn:
+            dropped = self._drop_chunks(conn, "part_start + ? <= ?", (self.partition_ms, cutoff))
+            dropped += conn.execute("DELETE FROM commits WHERE ts < ?", (cutoff,)).rowcount
+            if dropped:
+                conn.execute("INSERT INTO meta (key, value) VALUES ('pruned_before', ?) "
+                             "ON CONFLICT (key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+                             (str(watermark),))
+        return dropped
+
+    def compact(self, now: Optional[int] = None) -> Dict:
+        """Periodic maintenance: seal closed partitions, then apply retention"""
+        return {"sealed": self.seal_partitions(now), "pruned": self.prune(now)}
+
+    def partition_stats(self) -> Dict:
+        conn = self.connect()
+        sealed, chunks, rows, size = conn.execute(
+            "SELECT COUNT(DISTINCT part_start), COUNT(*), COALESCE(SUM(row_count), 0), COALESCE(SUM(LENGTH(data)), 0) "
+            "FROM chunks").fetchone()
+        return {"sealed_partitions": sealed, "sealed_chunks": chunks, "sealed_rows": rows, "sealed_bytes": size,
+                "open_rows": conn.execute("SELECT COUNT(*) FROM commits").fetchone()[0]}
+
+    def count(self) -> int:
+        stats = self.partition_stats()
+        return stats["open_rows"] + stats["sealed_rows"]
+
+    def close(self):
+        with self._conn_lock:
+            for conn in self._connections:
+                try: conn.close()
+                except Exception: pass
+            self._connections = []
+        self._local = threading.local()
+
+# ==========================================
+# Ingestion: Write-behind Queue with Group Commit
+# ==========================================
+class CommitIngestQueue:
+    """
+    /track only appends to an in-memory deque; a single writer thread flushes
+    batches when `max_batch` records are pending or the oldest one has waited
+    `max_delay` seconds. Failed batches are retried, and anything still
+    pending at shutdown is spilled to NDJSON and replayed on the next start.
+    """
+    def __init__(self, store: CommitLogStore, max_batch: int = 500, max_delay: float = 0.2,
+                 on_flush: Optional[Callable[[List[Dict]], None]] = None):
+        self.store = store
+        self.on_flush = on_flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.spill_path = store.db_path + ".spill.ndjson"
+
+        self._cond = threading.Condition()
+        self._pending = deque()  # (enqueue monotonic time, record)
+        self._thread = None
+        self._stopping = False
+
+        # Metrics
+        self.enqueued_total = 0
+        self.flushed_total = 0
+        self.batches_total = 0
+        self.failed_flushes = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def submit(self, record: Dict):
+        with self._cond:
+            self._pending.append((time.monotonic(), record))
+            self.enqueued_total += 1
+            # Wake the writer to arm the delay timer, or to flush a full batch
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def start(self):
+        if self._thread and self._thread.is_alive(): return
+        self._stopping = False
+        self._replay_spill()
+        self._thread = threading.Thread(target=self._run, name="commit-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        # Last chance: anything the writer could not persist goes to the spill file
+        if not self.flush():
+            self._spill()
+
+    def flush(self) -> bool:
+        """Synchronously write everything pending. Returns False on failure."""
+        while True:
+            batch = self._take_batch()
+            if not batch: return True
+            if not self._write(batch): return False
+
+    def _take_batch(self):
+        with self._cond:
+            batch = []
+            while self._pending and len(batch) < self.max_batch:
+                batch.append(self._pending.popleft())
+            return batch
+
+    def _write(self, batch) -> bool:
+        started = time.monotonic()
+        records = [record for _, record in batch]
+        try:
+            self.store.append_many(records)
+        except Exception as e:
+            self.failed_flushes += 1
+            print(f"❌ [Ingest] Group commit of {len(batch)} records failed: {e}")
+            with self._cond:
+                self._pending.extendleft(reversed(batch))
+            return False
+        if self.on_flush:
+            self.on_flush(records)
+
+        finished = time.monotonic()
+        self.batches_total += 1
+        self.flushed_total += len(batch)
+        self.last_batch_size = len(batch)
+        self.last_flush_ms = (finished - started) * 1000
+        self.last_lag_ms = (finished - batch[0][0]) * 1000
+        self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+        return True
+
+    def _run(self):
+        backoff = 0.0
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if len(self._pending) >= self.max_batch: break
+                    if self._pending:
+                        remaining = self.max_delay - (time.monotonic() - self._pending[0][0])
+                        if remaining <= 0: break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._stopping: return
+
+            batch = self._take_batch()
+            if not batch: continue
+            if self._write(batch):
+                backoff = 0.0
+            else:
+                backoff = min(max(backoff * 2, 0.1), 5.0)
+                time.sleep(backoff)
+
+    def _open_spill_locked(self, mode: str):
+        """
+        Open the spill file (shared by all server workers) under an exclusive
+        lock. Re-opens if another worker replayed and unlinked it meanwhile.
+        Returns None if mode is 'r+' and there is no spill file.
+        """
+        while True:
+            try:
+                f = open(self.spill_path, mode, encoding='utf-8')
+            except FileNotFoundError:
+                return None
+            if fcntl is None: return f
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.spill_path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()
+            if mode == 'r+': return None
+
+    def _spill(self):
+        with self._cond:
+            batch = list(self._pending)
+            self._pending.clear()
+        if not batch: return
+        try:
+            f = self._open_spill_locked('a')
+            with f:
+                f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for _, record in batch))
+            print(f"⚠️ [Ingest] Spilled {len(batch)} unflushed records to {self.spill_path}")
+        except Exception as e:
+            print(f"❌ [Ingest] Lost {len(batch)} records, spill failed: {e}")
+
+    def _replay_spill(self):
+        if not os.path.exists(self.spill_path): return
+        try:
+            f = self._open_spill_locked('r+')
+            if f is None: return
+            with f:
+                records = [json.loads(line) for line in f if line.strip()]
+                if records:
+                    self.store.append_many(records)
+                # Unlink while still holding the lock, so nobody replays it twice
+                os.remove(self.spill_path)
+            if records: print(f"♻️ [Ingest] Replayed {len(records)} spilled records.")
+        except Exception as e:
+            print(f"⚠️ [Ingest] Spill replay failed, will retry on next start: {e}")
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            oldest_age_ms = (time.monotonic() - self._pending[0][0]) * 1000 if self._pending else 0.0
+            depth = len(self._pending)
+        return {
+            "queue_depth": depth,
+            "oldest_pending_age_ms": round(oldest_age_ms, 3),
+            "enqueued_total": self.enqueued_total,
+            "flushed_total": self.flushed_total,
+            "batches_total": self.batches_total,
+            "failed_flushes": self.failed_flushes,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "last_lag_ms": round(self.last_lag_ms, 3),
+            "max_lag_ms": round(self.max_lag_ms, 3),
+        }
+
+# ==========================================
+# CLI: Maintenance Commands
+# ==========================================
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Git-Guard commit log maintenance")
+    parser.add_argument("command", choices=["rebuild-rollups", "compact"])
+    parser.add_argument("--db", default=os.path.join(base_dir, "commit_history.db"))
+    parser.add_argument("--csv", default=os.path.join(base_dir, "commit_history.csv"),
+                        help="legacy CSV log to backfill before rebuilding")
+    parser.add_argument("--retention-days", type=int, default=None,
+                        help="compact: drop raw rows older than this (rollups are kept)")
+    args = parser.parse_args()
+
+    store = CommitLogStore(args.db, retention_days=args.retention_days)
+    if args.command == "compact":
+        result = store.compact()
+        print(f"🗜️ Sealed {result['sealed']} rows, pruned {result['pruned']} rows: {store.partition_stats()}")
+    else:
+        imported = store.import_legacy_csv(args.csv)
+        print(f"📥 Imported {imported} rows from {args.csv}")
+        store.rebuild_rollups()
+        print(f"✅ Rollups rebuilt from {store.count()} commits.")
+    store.close()
@@ -1,7 +1,11 @@
 # File: server/indexer_template.py
 import os
 import sys
+import time
 import shutil
+import struct
+import sqlite3
+import hashlib
 import requests
 import chromadb
 from typing import List, Dict, Any
@@ -36,6 +40,8 @@ if not os.path.exists(GUARD_DIR):
     except: pass
 
 DB_PATH = os.path.join(GUARD_DIR, "chroma_db")
+EMBED_CACHE_PATH = os.path.join(GUARD_DIR, "embedding_cache.db")  # survives re-indexing, shared with the analyzer
+EMBED_MODEL = "embedding-3"
 API_KEY = os.getenv("ZHIPU_API_KEY") 
 
 EXT_TO_COLLECTION = {
@@ -98,23 +104,124 @@ class Reranker:
         except Exception:
             return documents[:top_k]
 
+# ==========================================
+# Embedding Cache (same file and format in analyzer and indexer)
+# ==========================================
+class EmbeddingCache:
+    """
+    On-disk cache of embeddings keyed by (model, sha256(text)), stored as
+    packed float32 (or float16) in SQLite. Least recently used vectors are
+    evicted once the cache exceeds `max_bytes`.
+    """
+    FORMATS = {"float32": "f", "float16": "e"}
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, dtype: str = "float32"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, text_sha TEXT NOT NULL, "
+                "dtype TEXT NOT NULL, vec BLOB NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (model, text_sha))")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_lru ON embeddings (last_used)")
+        return self._conn
+
+    @staticmethod
+    def text_key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Any]:
+        """Cached vector per text, None where missing"""
+        keys = [self.text_key(t) for t in texts]
+        found = {}
+        try:
+            conn = self._connect()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT text_sha, dtype, vec FROM embeddings WHERE model = ? AND text_sha IN ({','.join('?' * len(chunk))})",
+                    [model] + chunk).fetchall()
+                for text_sha, dtype, vec in rows:
+                    fmt = self.FORMATS[dtype]
+                    found[text_sha] = list(struct.unpack(f"<{len(vec) // struct.calcsize(fmt)}{fmt}", vec))
+            if found:
+                with conn:
+                    conn.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND text_sha = ?",
+                                     [(time.time(), model, k) for k in found])
+        except Exception:
+            found = {}  # a broken cache only costs API calls
+        result = [found.get(k) for k in keys]
+        self.hits += sum(1 for v in result if v is not None)
+        self.misses += sum(1 for v in result if v is None)
+        return result
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        fmt = self.FORMATS[self.dtype]
+        rows = [(model, self.text_key(t), self.dtype, struct.pack(f"<{len(v)}{fmt}", *v), time.time())
+                for t, v in zip(texts, vectors) if v]
+        if not rows: return
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO embeddings (model, text_sha, dtype, vec, last_used) "
+                                 "VALUES (?, ?, ?, ?, ?)", rows)
+            self.evict()
+        except Exception: pass
+
+    def evict(self):
+        """Drop least recently used vectors until the cache is within max_bytes"""
+        conn = self._connect()
+        total = conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes: return
+        excess = total - self.max_bytes * 0.9  # leave headroom so eviction isn't run on every put
+        victims, freed = [], 0
+        for rowid, size in conn.execute("SELECT rowid, LENGTH(vec) FROM embeddings ORDER BY last_used"):
+            if freed >= excess: break
+            victims.append((rowid,))
+            freed += size
+        with conn:
+            conn.executemany("DELETE FROM embeddings WHERE rowid = ?", victims)
+
+    def embed(self, model: str, texts: List[str], compute) -> List[List[float]]:
+        """Vectors for texts, calling compute(missing_texts) only for cache misses"""
+        cached = self.get_many(model, texts)
+        missing = [i for i, v in enumerate(cached) if v is None]
+        if missing:
+            computed = compute([texts[i] for i in missing])
+            self.put_many(model, [texts[i] for i in missing], computed)
+            for i, v in zip(missing, computed):
+                cached[i] = v
+        return cached
+
 class ZhipuEmbeddingFunction(chromadb.EmbeddingFunction):
     def __init__(self):
         self.api_key = API_KEY
         self.client = ZhipuAiClient(api_key=self.api_key)
+        self.cache = EmbeddingCache(EMBED_CACHE_PATH)
     
     def __call__(self, input: List[str]) -> List[List[float]]:
         if not self.api_key: return [[]] * len(input)
         try:
             # 这里的 batch size 由 ChromaDB 外部调用者控制，或者我们在 __call__ 里自己分批
             # 但最好的做法是在 collection.add 层面控制
-            response = self.client.embeddings.create(model="embedding-3", input=input)
-            return [data.embedding for data in response.data]
+            # 未变化的代码块直接命中缓存，只为新内容调用 API
+            return self.cache.embed(EMBED_MODEL, input, self._embed)
         except Exception as e:
             print(f"[Error] Embedding failed: {e}")
             # 返回空向量防止程序崩溃 (维度需匹配，这里假设是 1024 或 2048，暂时返回空列表会报错，只能抛出)
             raise e
 
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(model=EMBED_MODEL, input=texts)
+        return [data.embedding for data in response.data]
+
 class Retrieval:
     def __init__(self):
         if not os.path.exists(DB_PATH):
@@ -237,6 +344,7 @@ def build_index():
             except Exception as e:
                 print(f"      [Error] Failed to add batch {i}: {e}")
 
+    print(f"[Indexer] Embedding cache: {emb_fn.cache.hits} hits, {emb_fn.cache.misses} misses")
     print("[Indexer] Local Knowledge Base Updated.")
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+# File: server/leader.py
+import os
+from typing import Optional
+
+try:
+    import fcntl  # POSIX only
+except ImportError:
+    fcntl = None
+
+# ==========================================
+# Leader Election: Exclusive Lock on a Shared File
+# ==========================================
+class LeaderLease:
+    """
+    One process per host holds a non-blocking exclusive flock on `lock_path`
+    and becomes the leader (scheduler + CI pool). The OS drops the lock when
+    the process dies, so a follower retrying try_acquire() takes over
+    without any lease expiry to tune. Without fcntl (Windows) every process
+    is its own leader, which is only correct for a single worker.
+    """
+    def __init__(self, lock_path: str):
+        self.lock_path = lock_path
+        self._file = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        if self._file is not None: return True
+        f = open(self.lock_path, "a+")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+        f.seek(0)
+        f.truncate()
+        f.write(f"{os.getpid()}\n")
+        f.flush()
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None: return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def holder_pid(self) -> Optional[int]:
+        """Pid written by the current leader (informational)"""
+        try:
+            with open(self.lock_path, "r") as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
@@ -1,29 +1,43 @@
 # File: server/main.py
 import os
 import json
-import csv
-import shutil
-import subprocess
+import argparse
+import hashlib
+import time
+import threading
 import asyncio
 from datetime import datetime
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, BackgroundTasks 
+from fastapi import FastAPI, HTTPException, Request, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import uvicorn
 from typing import Optional, Dict
-from git import Repo
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from script_bundles import ScriptBundleRegistry
+from metrics import MetricsRegistry, RequestMetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from ci_engine import CIJobQueue, CIQueueFull, FINISHED_STATES
+from ci_scheduler import CIRepoRegistry, FairCIScheduler
+from leader import LeaderLease
+from rate_limit import TokenBucketLimiter, AdmissionController, retry_after_header
+from ci_store import CIRunStore
+from ci_logs import CILogStore, parse_byte_range
+from commit_store import CommitLogStore, CommitIngestQueue, PendingRollups, GRANULARITY_MS, format_rollups, now_ms
 
 # ==========================================
 # Config: File Paths
 # ==========================================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_FILE_PATH = os.path.join(BASE_DIR, "server_config.json")
-LOG_FILE_PATH = os.path.join(BASE_DIR, "commit_history.csv")
-CI_STATUS_PATH = os.path.join(BASE_DIR, "ci_status.json")
+LOG_FILE_PATH = os.path.join(BASE_DIR, "commit_history.csv")  # legacy, pre-SQLite
+LOG_DB_PATH = os.path.join(BASE_DIR, "commit_history.db")
+CI_RUNS_DB_PATH = os.path.join(BASE_DIR, "ci_runs.db")
 CI_WORKSPACE_DIR = os.path.join(BASE_DIR, "ci_workspace")
+CI_STATE_DIR = os.path.join(BASE_DIR, "ci_state")
+CI_LOG_DIR = os.path.join(BASE_DIR, "ci_logs")
+LEADER_LOCK_PATH = os.path.join(BASE_DIR, "leader.lock")
 
 # ==========================================
 # Config: Default Settings
@@ -32,7 +46,8 @@ DEFAULT_CONFIG = {
     "template_format": "[<Module>][<Type>] <Description>",
     "custom_rules": "1. <Module>: [Backend], [Frontend]. 2. <Type>: [Feat], [Fix].",
     "github_repo_url": "", 
-    "ci_interval_minutes": 60
+    "ci_interval_minutes": 60,
+    "ci_timeout_minutes": 30
 }
 
 # ==========================================
@@ -41,10 +56,153 @@ DEFAULT_CONFIG = {
 scheduler = AsyncIOScheduler()
 
 # ==========================================
-# Helper Functions: Persistence
+# Global: Metrics (scraped at GET /metrics)
 # ==========================================
-def load_config_from_disk() -> dict:
-    if not os.path.exists(CONFIG_FILE_PATH): return DEFAULT_CONFIG
+# Each worker keeps its own counters and answers a scrape with them, labelled
+# worker="<pid>"; sum by the other labels for totals. CI gauges are shared:
+# every worker reports the leader's state, so any worker can answer.
+metrics = MetricsRegistry(const_labels={"worker": str(os.getpid())})
+HTTP_LATENCY = metrics.histogram(
+    "gitguard_http_request_duration_seconds", "Time to response start per route.", ("method", "route", "status"))
+CONFIG_CACHE_LOOKUPS = metrics.counter(
+    "gitguard_config_cache_lookups_total", "Config snapshot lookups by result (hit/miss).", ("result",))
+CONFIG_NOT_MODIFIED = metrics.counter(
+    "gitguard_config_not_modified_total", "GET /api/v1/config answered with 304.")
+COMMIT_LOG_COMPACTED = metrics.counter(
+    "gitguard_commit_log_compacted_rows_total", "Commit log rows sealed into partitions or pruned.", ("action",))
+INGEST_REJECTED = metrics.counter(
+    "gitguard_ingest_rejected_total", "Commit records refused by rate limits or load shedding.", ("reason",))
+CI_RUN_DURATION = metrics.histogram(
+    "gitguard_ci_run_duration_seconds", "Wall time of finished CI jobs by result.", ("result",),
+    buckets=(5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+CI_RUNS = metrics.counter("gitguard_ci_runs_total", "Finished CI jobs by result.", ("result",))
+CI_SCHEDULE_LAG = metrics.histogram(
+    "gitguard_ci_schedule_lag_seconds", "Delay between a repo falling due and its job being enqueued.",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 900, 1800, 3600))
+
+def record_ci_job(job):
+    CI_RUNS.inc(job.result_status or job.status)
+    if job.started_at is not None:
+        CI_RUN_DURATION.observe(job.finished_at - job.started_at, job.result_status or job.status)
+
+# ==========================================
+# Global: CI Job Queue (jobs run in child processes)
+# ==========================================
+ci_store = CIRunStore(CI_RUNS_DB_PATH)
+ci_logs = CILogStore(
+    CI_LOG_DIR,
+    segment_bytes=int(os.getenv("CI_LOG_SEGMENT_BYTES", str(4 * 1024 * 1024))),
+    max_segments=int(os.getenv("CI_LOG_MAX_SEGMENTS", "8")),
+    keep_runs=int(os.getenv("CI_LOG_KEEP_RUNS", "200")),
+)
+CI_MAX_WORKERS = int(os.getenv("CI_MAX_WORKERS", "2"))
+CI_MAX_QUEUED = int(os.getenv("CI_MAX_QUEUED", "50"))
+CI_SCHEDULER_TICK_SECONDS = 15
+ci_queue = CIJobQueue(CI_WORKSPACE_DIR, CI_STATE_DIR, ci_store, ci_logs,
+                      max_workers=CI_MAX_WORKERS,
+                      max_queued=CI_MAX_QUEUED,
+                      on_finish=record_ci_job,
+                      on_update=lambda job: mirror_ci_job(job),
+                      venv_budget_bytes=int(os.getenv("CI_VENV_BUDGET_MB", "4096")) * 1024 * 1024,
+                      # By default the cores are split between concurrently running jobs
+                      shards=int(os.getenv("CI_SHARDS", str(max(1, (os.cpu_count() or 1) // CI_MAX_WORKERS)))))
+ci_repos = CIRepoRegistry(CI_RUNS_DB_PATH)
+
+# ==========================================
+# Global: Leader Election (multi-worker deployments)
+# ==========================================
+# Every worker serves the API; only the worker holding the leader lock runs
+# the CI scheduler and job pool. Followers post CI commands to an inbox
+# table and read job state from the leader's mirror in ci_runs.db.
+leader = LeaderLease(LEADER_LOCK_PATH)
+LEADER_RETRY_SECONDS = 5
+CI_COMMAND_POLL_SECONDS = 1
+CI_COMMAND_WAIT_SECONDS = 5
+
+def mirror_ci_job(job):
+    ci_store.save_job(job.to_dict(), job.created_at, finished=job.status in FINISHED_STATES)
+    publish_ci_state()
+
+def current_ci_state() -> dict:
+    """Scheduler and queue state; only the leader holds it in memory"""
+    return {"queued": ci_queue.depth(), "running": ci_queue.running(), "deferred": ci_scheduler.deferred,
+            "overdue_s": ci_scheduler.max_overdue(), "next_due": ci_scheduler.due_times()}
+
+def publish_ci_state():
+    """Leader: mirror scheduler and queue state into ci_runs.db for the followers"""
+    try:
+        ci_store.save_state("scheduler", current_ci_state())
+    except Exception as e:
+        print(f"⚠️ [CI] Failed to publish scheduler state: {e}")
+
+def read_ci_state() -> Optional[dict]:
+    """In-memory state on the leader, the leader's last snapshot on followers"""
+    if leader.is_leader: return current_ci_state()
+    return ci_store.load_state("scheduler")
+
+def ci_state_metric(key):
+    """Gauge callback: the leader's live CI state, or its last snapshot on a follower"""
+    def read():
+        state = read_ci_state()
+        return state[key] if state and key in state else {}
+    return read
+ci_scheduler = FairCIScheduler(ci_queue, lambda: configured_ci_repos(), on_dispatch=CI_SCHEDULE_LAG.observe)
+
+# ==========================================
+# Global: Hook Script Bundles
+# ==========================================
+script_bundles = ScriptBundleRegistry(BASE_DIR, {
+    "analyzer": "analyzer_template.py",
+    "indexer": "indexer_template.py",
+})
+
+# ==========================================
+# Global: Commit Log Store & Ingest Queue
+# ==========================================
+# Closed weeks are sealed into compressed partitions; raw rows older than the
+# retention window are dropped (stats rollups are kept). Unset keeps history.
+COMMIT_RETENTION_DAYS = int(os.getenv("COMMIT_RETENTION_DAYS", "0")) or None
+COMMIT_COMPACT_INTERVAL_MINUTES = 60
+commit_store = CommitLogStore(LOG_DB_PATH, retention_days=COMMIT_RETENTION_DAYS)
+pending_rollups = PendingRollups()
+ingest_queue = CommitIngestQueue(commit_store, on_flush=pending_rollups.settle)
+
+# ==========================================
+# Global: Ingest Rate Limits & Admission Control
+# ==========================================
+# Buckets live in each worker and connections spread over workers, so the
+# configured rates are divided by the worker count.
+INGEST_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+developer_limiter = TokenBucketLimiter(
+    float(os.getenv("INGEST_RATE_PER_DEVELOPER", "2")) / INGEST_WORKERS,
+    float(os.getenv("INGEST_BURST_PER_DEVELOPER", "120")) / INGEST_WORKERS)
+repo_limiter = TokenBucketLimiter(
+    float(os.getenv("INGEST_RATE_PER_REPO", "20")) / INGEST_WORKERS,
+    float(os.getenv("INGEST_BURST_PER_REPO", "600")) / INGEST_WORKERS)
+ingest_admission = AdmissionController(lambda: ingest_queue.depth, int(os.getenv("INGEST_SHED_QUEUE_DEPTH", "10000")))
+BATCH_ADMISSION_SHARE = 0.5  # batch uploads/backfills are shed at half the depth single reports are
+
+# ==========================================
+# Global: Config Snapshot Cache
+# ==========================================
+# The parsed config is kept in memory together with its serialized body and
+# a strong ETag. It is rebuilt only when the file's (mtime, size) changes or
+# save_config_to_disk() invalidates it, so GET /api/v1/config costs one stat().
+_config_lock = threading.Lock()
+_config_snapshot = None
+CONFIG_WATCH_MAX_SECONDS = 55     # long-poll cap, below common proxy idle timeouts
+CONFIG_WATCH_POLL_SECONDS = 0.5   # a stat() per tick also sees saves made by other workers
+_config_watchers = 0
+
+def _config_file_signature():
+    try:
+        st = os.stat(CONFIG_FILE_PATH)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def _read_config_file() -> dict:
+    if not os.path.exists(CONFIG_FILE_PATH): return dict(DEFAULT_CONFIG)
     try:
         with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
             config = json.load(f)
@@ -52,114 +210,166 @@ def load_config_from_disk() -> dict:
             for k, v in DEFAULT_CONFIG.items():
                 if k not in config: config[k] = v
             return config
-    except: return DEFAULT_CONFIG
+    except: return dict(DEFAULT_CONFIG)
+
+def get_config_snapshot() -> dict:
+    """Return the current snapshot: {config, body, etag, version, signature}"""
+    global _config_snapshot
+    signature = _config_file_signature()
+    snapshot = _config_snapshot
+    if snapshot is not None and snapshot["signature"] == signature:
+        CONFIG_CACHE_LOOKUPS.inc("hit")
+        return snapshot
+
+    CONFIG_CACHE_LOOKUPS.inc("miss")
+    with _config_lock:
+        snapshot = _config_snapshot
+        if snapshot is not None and snapshot["signature"] == signature:
+            return snapshot
+        config = _read_config_file()
+        body = json.dumps(config, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        # Derived from the content, so every worker (and every restart) agrees on it
+        version = hashlib.sha256(body).hexdigest()[:32]
+        _config_snapshot = {
+            "config": config,
+            "body": body,
+            "etag": f'"{version}"',
+            "version": version,
+            "signature": signature,
+        }
+        return _config_snapshot
+
+def invalidate_config_cache():
+    global _config_snapshot
+    with _config_lock:
+        if _config_snapshot is not None:
+            # Keep the etag so an unchanged rewrite is still answered with 304
+            _config_snapshot = dict(_config_snapshot, signature="stale")
+
+# ==========================================
+# Helper Functions: Persistence
+# ==========================================
+def load_config_from_disk() -> dict:
+    return dict(get_config_snapshot()["config"])
 
 def save_config_to_disk(config_data: dict):
     try:
-        with open(CONFIG_FILE_PATH, 'w', encoding='utf-8') as f:
+        # Write-then-rename so concurrent readers never parse a partial file
+        tmp_path = f"{CONFIG_FILE_PATH}.{os.getpid()}.tmp"  # per worker, so two saves can't interleave
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(config_data, f, ensure_ascii=False, indent=4)
-        # Reschedule CI job if config updated
-        reschedule_ci_job(config_data.get("ci_interval_minutes", 60))
+        os.replace(tmp_path, CONFIG_FILE_PATH)
+        invalidate_config_cache()
+        # The CI scheduler reads the interval on its next tick
     except Exception as e:
         print(f"❌ Failed to save config: {e}")
 
-def save_log_to_csv(log):
-    file_exists = os.path.exists(LOG_FILE_PATH)
-    try:
-        with open(LOG_FILE_PATH, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(["Timestamp", "Developer", "Repo", "Risk", "Message", "AI Summary"])
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            writer.writerow([timestamp, log.developer_id, log.repo_name, log.risk_level, log.commit_msg, log.ai_summary])
-    except: pass
-
-# CI Status Management
-def load_ci_status():
-    if not os.path.exists(CI_STATUS_PATH):
-        return {"status": "Never Ran", "last_run": None, "details": "No logs yet."}
-    try:
-        with open(CI_STATUS_PATH, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except: return {"status": "Error", "details": "File read error"}
-
-def save_ci_status(status, details):
-    data = {
-        "last_run": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "status": status,
-        "details": details 
-    }
-    with open(CI_STATUS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag (RFC 9110)"""
+    if not if_none_match: return False
+    if if_none_match.strip() == "*": return True
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return any(c.removeprefix("W/") == etag for c in candidates)
 
 # ==========================================
-# Core Logic: CI Task (Pull & Test)
+# Core Logic: CI Trigger
 # ==========================================
-def run_ci_task():
-    print("\n⏰ [CI Job] Starting scheduled CI task...")
+def configured_ci_repos() -> list:
+    """Registry repos, plus the legacy single `github_repo_url` using the global interval/timeout"""
+    repos = ci_repos.list()
     config = load_config_from_disk()
-    repo_url = config.get("github_repo_url")
+    legacy_url = config.get("github_repo_url")
+    if legacy_url and not any(r["repo_url"] == legacy_url for r in repos):
+        repos.append({
+            "repo_url": legacy_url,
+            "interval_minutes": max(1, config.get("ci_interval_minutes") or 60),
+            "timeout_minutes": max(1, config.get("ci_timeout_minutes") or 30),
+            "enabled": True,
+        })
+    return repos
 
-    if not repo_url:
-        print("⚠️ [CI Job] No 'github_repo_url' configured. Skipping.")
-        save_ci_status("Skipped", "Repo URL not configured.")
-        return
+def enqueue_ci_job(trigger: str, force: bool = False, repo_url: Optional[str] = None):
+    """
+    Queue a CI run for one repo (default: the configured `github_repo_url`).
+    Returns (job, coalesced) or (None, False); raises CIQueueFull.
+    """
+    repos = {r["repo_url"]: r for r in configured_ci_repos()}
+    if repo_url is None:
+        repo_url = load_config_from_disk().get("github_repo_url")
+    if not repo_url or repo_url not in repos:
+        return None, False
+    timeout = repos[repo_url]["timeout_minutes"] * 60
+    return ci_queue.submit(repo_url, trigger=trigger, timeout=timeout, force=force)
 
-    try:
-        # 1. Setup workspace
-        if not os.path.exists(CI_WORKSPACE_DIR):
-            os.makedirs(CI_WORKSPACE_DIR)
-            print(f"   Cloning {repo_url}...")
-            Repo.clone_from(repo_url, CI_WORKSPACE_DIR)
-        else:
-            try:
-                repo = Repo(CI_WORKSPACE_DIR)
-                print("   Pulling latest code (main)...")
-                repo.git.checkout('main')
-                repo.remotes.origin.pull()
-            except Exception as e:
-                # Force re-clone on git error
-                print(f"   Git pull failed ({e}), re-cloning...")
-                shutil.rmtree(CI_WORKSPACE_DIR)
-                os.makedirs(CI_WORKSPACE_DIR)
-                Repo.clone_from(repo_url, CI_WORKSPACE_DIR)
-
-        # 2. Run Pytest
-        print("   Running Pytest...")
-        result = subprocess.run(
-            ["pytest"], 
-            cwd=CI_WORKSPACE_DIR, 
-            capture_output=True, 
-            text=True,
-            shell=True # Required for Windows
-        )
-
-        # 3. Log results
-        output_log = result.stdout + "\n" + result.stderr
-        if result.returncode == 0:
-            print("✅ [CI Job] Tests Passed!")
-            save_ci_status("Success", output_log)
-        else:
-            print("❌ [CI Job] Tests Failed.")
-            save_ci_status("Failed", output_log)
+def run_ci_task():
+    """Scheduler tick: enqueues whichever repos are due, the CI pool does the work"""
+    ci_scheduler.tick()
+    publish_ci_state()
 
+def import_legacy_commit_log():
+    """Leader, once at startup: backfill rows of commit_history.csv that were not imported yet"""
+    try:
+        imported = commit_store.import_legacy_csv(LOG_FILE_PATH)
     except Exception as e:
-        print(f"❌ [CI Job] System Error: {e}")
-        save_ci_status("System Error", str(e))
+        print(f"⚠️ [Commit Log] Legacy CSV import failed: {e}")
+        return
+    if imported: print(f"📥 [Commit Log] Imported {imported} rows from {LOG_FILE_PATH}.")
 
-def reschedule_ci_job(interval_minutes):
-    """Update job interval"""
+def compact_commit_log():
+    """Leader: seal closed commit log partitions and apply retention"""
     try:
-        scheduler.remove_all_jobs()
-        scheduler.add_job(
-            run_ci_task, 
-            IntervalTrigger(minutes=max(1, interval_minutes)),
-            id="ci_job",
-            replace_existing=True
-        )
-        print(f"🔄 CI Job Rescheduled: Every {interval_minutes} minutes.")
+        result = commit_store.compact()
     except Exception as e:
-        print(f"⚠️ Scheduler Error: {e}")
+        print(f"⚠️ [Commit Log] Compaction failed: {e}")
+        return
+    for action, rows in result.items():
+        COMMIT_LOG_COMPACTED.inc(action, amount=rows)
+    if any(result.values()): print(f"🗜️ [Commit Log] Sealed {result['sealed']}, pruned {result['pruned']} rows.")
+
+def execute_ci_command(kind: str, payload: dict) -> dict:
+    """Run a CI command on the leader; errors are returned as {"error": ...}"""
+    if kind == "run":
+        # Manual runs always test the full suite, even if HEAD has not moved
+        try:
+            job, coalesced = enqueue_ci_job("manual", force=True, repo_url=payload.get("repo_url"))
+        except CIQueueFull as e:
+            return {"error": "queue_full", "details": str(e)}
+        if job is None:
+            return {"status": "Error", "details": "Repo URL not configured."}
+        return {"status": "Triggered", "job_id": job.id, "coalesced": coalesced}
+    if kind == "cancel":
+        job = ci_queue.cancel(payload["job_id"])
+        return job.to_dict() if job else {"error": "not_found"}
+    return {"error": "unknown_command"}
+
+def process_ci_commands():
+    """Leader: execute commands that follower workers posted to the inbox"""
+    for command in ci_store.pending_commands():
+        ci_store.complete_command(command["id"], execute_ci_command(command["kind"], command["payload"]))
+
+async def dispatch_ci_command(kind: str, payload: dict) -> dict:
+    if leader.is_leader:
+        result = execute_ci_command(kind, payload)
+    else:
+        command_id = ci_store.post_command(kind, payload)
+        deadline = asyncio.get_running_loop().time() + CI_COMMAND_WAIT_SECONDS
+        result = None
+        while result is None and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.1)
+            result = ci_store.command_result(command_id)
+        if result is None:
+            return {"status": "Accepted", "command_id": command_id}
+    if result.get("error") == "queue_full":
+        raise HTTPException(status_code=503, detail=result["details"], headers={"Retry-After": "60"})
+    if result.get("error") == "not_found":
+        raise HTTPException(status_code=404)
+    return result
+
+def lookup_ci_job(job_id: str) -> Optional[dict]:
+    if leader.is_leader:
+        job = ci_queue.get(job_id)
+        return job.to_dict() if job else None
+    return ci_store.get_job(job_id)
 
 # ==========================================
 # Lifespan: Scheduler Management
@@ -167,18 +377,41 @@ def reschedule_ci_job(interval_minutes):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    config = load_config_from_disk()
-    interval = config.get("ci_interval_minutes", 60)
-    
-    scheduler.add_job(run_ci_task, IntervalTrigger(minutes=interval), id="ci_job")
-    scheduler.start()
-    print("🚀 Scheduler Started.")
+    ingest_queue.start()
+    script_bundles.refresh_all()
+    election = asyncio.create_task(leader_election_loop())
     
     yield
     
     # Shutdown
-    scheduler.shutdown()
-    print("🛑 Scheduler Shutdown.")
+    election.cancel()
+    if leader.is_leader:
+        scheduler.shutdown()
+        print("🛑 Scheduler Shutdown.")
+        ci_queue.stop()
+        leader.release()
+    ingest_queue.stop()
+    commit_store.close()
+    print("💾 Commit log flushed.")
+
+async def leader_election_loop():
+    while not leader.is_leader:
+        if leader.try_acquire():
+            become_leader()
+            return
+        await asyncio.sleep(LEADER_RETRY_SECONDS)
+
+def become_leader():
+    abandoned = ci_store.abandon_unfinished_jobs("Server restarted while the job was pending.")
+    if abandoned: print(f"⚠️ [CI] Marked {abandoned} jobs of the previous leader as errored.")
+    ci_queue.start()
+    scheduler.add_job(run_ci_task, IntervalTrigger(seconds=CI_SCHEDULER_TICK_SECONDS), id="ci_scheduler")
+    scheduler.add_job(process_ci_commands, IntervalTrigger(seconds=CI_COMMAND_POLL_SECONDS), id="ci_commands")
+    scheduler.add_job(import_legacy_commit_log, id="legacy_csv_import")  # runs once, off the event loop
+    scheduler.add_job(compact_commit_log, IntervalTrigger(minutes=COMMIT_COMPACT_INTERVAL_MINUTES),
+                      id="commit_log_compaction", next_run_time=datetime.now())
+    scheduler.start()
+    print(f"👑 Worker {os.getpid()} is the leader. Scheduler Started.")
 
 # ==========================================
 # App Initialization
@@ -192,6 +425,33 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware, histogram=HTTP_LATENCY)
+
+# Queue depths and totals that the components already keep are read at scrape time
+def _ingest_metric(key):
+    return lambda: ingest_queue.metrics()[key]
+
+metrics.counter_fn("gitguard_ingest_enqueued_total", "Commit records accepted by /track and /track/batch.",
+                   _ingest_metric("enqueued_total"))
+metrics.counter_fn("gitguard_ingest_flushed_total", "Commit records written to SQLite.", _ingest_metric("flushed_total"))
+metrics.counter_fn("gitguard_ingest_failed_flushes_total", "Ingest batches that failed to commit.",
+                   _ingest_metric("failed_flushes"))
+metrics.gauge_fn("gitguard_ingest_queue_depth", "Commit records waiting to be written.", lambda: ingest_queue.depth)
+metrics.gauge_fn("gitguard_ingest_oldest_pending_seconds", "Age of the oldest unwritten commit record.",
+                 lambda: ingest_queue.metrics()["oldest_pending_age_ms"] / 1000)
+metrics.gauge_fn("gitguard_ci_queue_depth", "CI jobs waiting for a worker.",
+                 ci_state_metric("queued"), shared=True)
+metrics.gauge_fn("gitguard_ci_running_jobs", "CI jobs currently running.", ci_state_metric("running"), shared=True)
+metrics.gauge_fn("gitguard_ci_workers", "Global cap on concurrently running CI jobs.", lambda: ci_queue.max_workers,
+                 shared=True)
+metrics.gauge_fn("gitguard_ci_scheduler_overdue_seconds", "How long the most overdue repo has been waiting.",
+                 ci_state_metric("overdue_s"), shared=True)
+metrics.gauge_fn("gitguard_config_watchers", "Clients long-polling GET /api/v1/config for changes.",
+                 lambda: _config_watchers)
+metrics.gauge_fn("gitguard_leader", "1 on the worker that runs the CI scheduler and job pool.",
+                 lambda: int(leader.is_leader))
+metrics.gauge_fn("gitguard_ci_scheduler_deferred_repos", "Due repos deferred by queue backpressure.",
+                 ci_state_metric("deferred"), shared=True)
 
 class CommitLog(BaseModel):
     developer_id: str
@@ -199,54 +459,453 @@ class CommitLog(BaseModel):
     commit_msg: str
     risk_level: str
     ai_summary: str
+    timestamp: Optional[datetime] = None  # original commit time, for queued reports and backfills
+
+def to_commit_record(log: CommitLog) -> dict:
+    record = log.model_dump(exclude={"timestamp"})
+    record["ts"] = int(log.timestamp.timestamp() * 1000) if log.timestamp else now_ms()
+    return record
+
+def ingest_commit(log: CommitLog):
+    record = to_commit_record(log)
+    pending_rollups.record(record)
+    ingest_queue.submit(record)
+
+def rate_limit_commit(log: CommitLog) -> Optional[HTTPException]:
+    """Charge one record to its developer and repo buckets; returns the 429 to raise, if any"""
+    wait = developer_limiter.acquire(log.developer_id)
+    scope = "developer"
+    if not wait:
+        wait = repo_limiter.acquire(log.repo_name)
+        scope = "repo"
+        if wait: developer_limiter.refund(log.developer_id)
+    if not wait: return None
+    INGEST_REJECTED.inc(scope)
+    name = log.developer_id if scope == "developer" else log.repo_name
+    return HTTPException(status_code=429, detail=f"Rate limit exceeded for {scope} '{name}'",
+                         headers={"Retry-After": retry_after_header(wait)})
+
+def shed_ingest_load(share: float = 1.0):
+    if ingest_admission.overloaded(share):
+        INGEST_REJECTED.inc("overload")
+        raise HTTPException(status_code=503, detail="Ingest queue is saturated, retry later",
+                            headers={"Retry-After": retry_after_header(ingest_admission.retry_after)})
+
+# Batch ingestion limits
+BATCH_MAX_LINE_BYTES = 64 * 1024
+BATCH_MAX_RECORDS = 100_000
+
+async def iter_ndjson_lines(request: Request, max_line_bytes: int = BATCH_MAX_LINE_BYTES):
+    """
+    Yield (line_no, raw_line) from a streamed NDJSON body without buffering it.
+    Oversized lines are yielded as None and skipped up to the next newline.
+    """
+    buffer = b""
+    line_no = 0
+    overflow = False
+    async for chunk in request.stream():
+        buffer += chunk
+        while True:
+            newline = buffer.find(b"\n")
+            if newline < 0: break
+            line, buffer = buffer[:newline], buffer[newline + 1:]
+            line_no += 1
+            yield line_no, None if overflow or len(line) > max_line_bytes else line
+            overflow = False
+        if len(buffer) > max_line_bytes:
+            overflow = True
+            buffer = b""
+    if buffer or overflow:
+        yield line_no + 1, None if overflow or len(buffer) > max_line_bytes else buffer
 
 class ProjectConfig(BaseModel):
     template_format: str
     custom_rules: str
     github_repo_url: Optional[str] = ""
     ci_interval_minutes: Optional[int] = 60
+    ci_timeout_minutes: Optional[int] = 30
 
 # ==========================================
 # API Endpoints
 # ==========================================
 
+@app.get("/metrics")
+def get_metrics():
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/api/v1/scripts/manifest")
+def get_script_manifest(request: Request):
+    manifest = script_bundles.manifest()
+    headers = {"ETag": manifest["etag"], "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), manifest["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=json.dumps({"scripts": manifest["scripts"]}, separators=(",", ":")),
+        media_type="application/json",
+        headers=headers,
+    )
+
+@app.get("/api/v1/scripts/{script_name}/{sha256}")
+def get_script_version(script_name: str, sha256: str, request: Request):
+    bundle = script_bundles.get_version(script_name, sha256)
+    if bundle is None: raise HTTPException(status_code=404)
+    headers = {
+        "ETag": bundle.etag,
+        # The URL names the content, so it can be cached forever
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), bundle.etag):
+        return Response(status_code=304, headers=headers)
+    encoding, body = bundle.negotiate(request.headers.get("accept-encoding"))
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="text/x-python; charset=utf-8", headers=headers)
+
 @app.get("/api/v1/scripts/{script_name}")
 def get_script(script_name: str):
-    valid_scripts = {"analyzer": "analyzer_template.py", "indexer": "indexer_template.py"}
-    if script_name not in valid_scripts: raise HTTPException(status_code=404)
-    file_path = os.path.join(BASE_DIR, valid_scripts[script_name])
-    if not os.path.exists(file_path): raise HTTPException(status_code=500)
-    with open(file_path, "r", encoding="utf-8") as f: return {"code": f.read()}
+    if script_name not in script_bundles.scripts: raise HTTPException(status_code=404)
+    bundle = script_bundles.get(script_name)
+    if bundle is None: raise HTTPException(status_code=500)
+    return {"code": bundle.source.decode("utf-8")}
 
 @app.post("/api/v1/track")
-def track_commit(log: CommitLog):
+async def track_commit(log: CommitLog):
+    shed_ingest_load()
+    throttled = rate_limit_commit(log)
+    if throttled: raise throttled
     print(f"📡 [TRACKING] {log.developer_id}: {log.commit_msg}")
-    save_log_to_csv(log)
+    ingest_commit(log)
     return {"status": "recorded"}
 
+@app.post("/api/v1/track/batch")
+async def track_commit_batch(request: Request):
+    """
+    Ingest an NDJSON stream of CommitLog records, one result per non-empty
+    line. A rate-limited record ends the batch: the client re-sends from
+    `resume_from_line` after Retry-After (429 if nothing was accepted).
+    """
+    shed_ingest_load(BATCH_ADMISSION_SHARE)
+    results = []
+    accepted = 0
+    resume_from_line = None
+    throttled = None
+    async for line_no, raw in iter_ndjson_lines(request):
+        if raw is not None and not raw.strip(): continue
+        if len(results) >= BATCH_MAX_RECORDS or ingest_admission.overloaded(BATCH_ADMISSION_SHARE):
+            # Stop here; the client re-sends from this line in a new request
+            resume_from_line = line_no
+            break
+        if raw is None:
+            results.append({"line": line_no, "status": "rejected", "error": f"Line exceeds {BATCH_MAX_LINE_BYTES} bytes"})
+            continue
+        try:
+            log = CommitLog.model_validate_json(raw)
+        except ValidationError as e:
+            err = e.errors()[0]
+            loc = ".".join(str(p) for p in err.get("loc", ()))
+            results.append({"line": line_no, "status": "rejected", "error": f"{loc}: {err['msg']}" if loc else err["msg"]})
+            continue
+        throttled = rate_limit_commit(log)
+        if throttled:
+            resume_from_line = line_no
+            break
+        ingest_commit(log)
+        accepted += 1
+        results.append({"line": line_no, "status": "recorded"})
+
+    if throttled and not results:
+        raise throttled
+    print(f"📡 [TRACKING] Batch: {accepted} recorded, {len(results) - accepted} rejected")
+    headers = throttled.headers if throttled else None
+    return JSONResponse(headers=headers, content={
+        "accepted": accepted,
+        "rejected": len(results) - accepted,
+        "resume_from_line": resume_from_line,
+        "results": results,
+    })
+
+@app.get("/api/v1/track/metrics")
+def get_ingest_metrics():
+    return ingest_queue.metrics()
+
+@app.get("/api/v1/commits")
+def list_commits(
+    developer_id: Optional[str] = None,
+    repo_name: Optional[str] = None,
+    risk_level: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    try:
+        items, next_cursor = commit_store.query(
+            developer_id=developer_id,
+            repo_name=repo_name,
+            risk_level=risk_level,
+            since_ms=int(since.timestamp() * 1000) if since else None,
+            until_ms=int(until.timestamp() * 1000) if until else None,
+            cursor=cursor,
+            limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for item in items:
+        item["timestamp"] = datetime.fromtimestamp(item["ts"] / 1000).strftime("%Y-%m-%d %H:%M:%S")
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/api/v1/stats")
+def get_commit_stats(
+    granularity: str = Query("hour", pattern="^(hour|day)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    # Default window: last 24 hours / last 30 days; at most 1000 buckets per request
+    size = GRANULARITY_MS[granularity]
+    end_ms = int(until.timestamp() * 1000) if until else now_ms() // size * size + size
+    start_ms = int(since.timestamp() * 1000) if since else end_ms - size * (24 if granularity == "hour" else 30)
+    if end_ms <= start_ms:
+        raise HTTPException(status_code=400, detail="'since' must be before 'until'")
+    start_ms = max(start_ms // size * size, end_ms - size * 1000)
+
+    rows = commit_store.rollup_rows(granularity, start_ms, end_ms)
+    rows += pending_rollups.rows(granularity, start_ms, end_ms)
+    return format_rollups(rows, granularity)
+
 @app.post("/api/v1/config")
 def update_config(config: ProjectConfig):
     new_config = config.dict()
-    save_config_to_disk(new_config) # Auto reschedules job
+    save_config_to_disk(new_config) # CI scheduler picks up the new interval
     print(f"⚙️  Config Updated: {new_config}")
     return {"status": "updated", "config": new_config}
 
 @app.get("/api/v1/config")
-def get_config():
-    return load_config_from_disk()
+async def get_config(request: Request, wait: int = 0):
+    """
+    With `?wait=N` and If-None-Match this is a long-poll change feed: the
+    request is held until the config's etag changes or N seconds pass (304).
+    """
+    global _config_watchers
+    snapshot = get_config_snapshot()
+    wait = min(max(wait, 0), CONFIG_WATCH_MAX_SECONDS)
+    if wait and etag_matches(request.headers.get("if-none-match"), snapshot["etag"]):
+        deadline = time.monotonic() + wait
+        _config_watchers += 1
+        try:
+            while time.monotonic() < deadline and not await request.is_disconnected():
+                await asyncio.sleep(CONFIG_WATCH_POLL_SECONDS)
+                if _config_file_signature() != snapshot["signature"]:
+                    snapshot = get_config_snapshot()
+                    if not etag_matches(request.headers.get("if-none-match"), snapshot["etag"]): break
+        finally:
+            _config_watchers -= 1
+    headers = {
+        "ETag": snapshot["etag"],
+        "Cache-Control": "no-cache",
+        "X-Config-Version": snapshot["version"],
+    }
+    if etag_matches(request.headers.get("if-none-match"), snapshot["etag"]):
+        CONFIG_NOT_MODIFIED.inc()
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot["body"], media_type="application/json", headers=headers)
 
 @app.get("/api/v1/ci/status")
-def get_ci_status():
-    return load_ci_status()
+def get_ci_status(repo_url: Optional[str] = None):
+    return ci_store.status_summary(repo_url)
+
+class CIRepoConfig(BaseModel):
+    repo_url: str
+    interval_minutes: Optional[int] = 60
+    timeout_minutes: Optional[int] = 30
+    enabled: Optional[bool] = True
+
+@app.get("/api/v1/ci/repos")
+def list_ci_repos():
+    # Followers serve the leader's last snapshot; state_as_of shows its age
+    state = read_ci_state() or {}
+    next_due_times = state.get("next_due", {})
+    repos = []
+    for repo in configured_ci_repos():
+        next_due = next_due_times.get(repo["repo_url"])
+        repos.append(dict(repo, next_run=datetime.fromtimestamp(next_due).strftime("%Y-%m-%d %H:%M:%S") if next_due else None))
+    as_of = state.get("updated_at", time.time() if state else None)
+    return {"repos": repos, "queued": state.get("queued"), "running": state.get("running"),
+            "max_queued": ci_queue.max_queued, "max_workers": ci_queue.max_workers,
+            "deferred": state.get("deferred"),
+            "state_as_of": datetime.fromtimestamp(as_of).strftime("%Y-%m-%d %H:%M:%S") if as_of else None}
+
+@app.put("/api/v1/ci/repos")
+def upsert_ci_repo(repo: CIRepoConfig):
+    return ci_repos.upsert(repo.repo_url, repo.interval_minutes or 60, repo.timeout_minutes or 30,
+                           repo.enabled is not False)
+
+@app.delete("/api/v1/ci/repos")
+def delete_ci_repo(repo_url: str):
+    if not ci_repos.delete(repo_url): raise HTTPException(status_code=404)
+    return {"status": "deleted", "repo_url": repo_url}
+
+@app.get("/api/v1/ci/runs")
+def list_ci_runs(
+    repo_url: Optional[str] = None,
+    sha: Optional[str] = None,
+    before: Optional[float] = None,
+    limit: int = Query(20, ge=1, le=200),
+):
+    runs = ci_store.list_runs(repo_url=repo_url, sha=sha, before=before, limit=limit)
+    next_before = runs[-1]["finished_at"] if len(runs) == limit else None
+    return {"runs": runs, "next_before": next_before}
+
+@app.get("/api/v1/ci/runs/{run_id}")
+def get_ci_run(run_id: str):
+    run = ci_store.get_run(run_id)
+    if run is None: raise HTTPException(status_code=404)
+    return run
+
+@app.get("/api/v1/ci/runs/{run_id}/tests")
+def list_ci_run_tests(
+    run_id: str,
+    outcome: Optional[str] = Query(None, pattern="^(passed|failed|error|skipped)$"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    if ci_store.get_run(run_id) is None: raise HTTPException(status_code=404)
+    tests = ci_store.list_tests(run_id, outcome=outcome, offset=offset, limit=limit)
+    return {"tests": tests, "offset": offset, "next_offset": offset + limit if len(tests) == limit else None}
+
+def open_ci_log(run_id: str):
+    try:
+        log = ci_logs.open(run_id)
+    except ValueError:
+        raise HTTPException(status_code=404)
+    if not log.exists(): raise HTTPException(status_code=404)
+    return log
+
+def ci_run_is_live(run_id: str) -> bool:
+    job = lookup_ci_job(run_id)
+    return job is not None and job["status"] not in FINISHED_STATES
+
+@app.get("/api/v1/ci/runs/{run_id}/log")
+def download_ci_log(run_id: str, request: Request):
+    """Raw run log; supports a single 'Range: bytes=...' for resumable/partial reads"""
+    log = open_ci_log(run_id)
+    start, end = log.extent()
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "no-cache",
+        "X-Log-Start-Offset": str(start),  # bytes before this were rotated out
+        "X-Log-Complete": "false" if ci_run_is_live(run_id) else "true",
+    }
+    try:
+        span = parse_byte_range(request.headers.get("range"), start, end)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{end}"})
+    # Segments are opened before the headers go out, so the declared length
+    # holds even if a live run rotates them away mid-download
+    first, last, chunks = log.open_range(*(span or (start, end)))
+    if span is None: headers["X-Log-Start-Offset"] = str(first)
+    status_code = 200
+    if span is not None:
+        if first >= last:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{end}"})
+        status_code = 206
+        headers["Content-Range"] = f"bytes {first}-{last - 1}/{end}"
+    headers["Content-Length"] = str(last - first)
+    return StreamingResponse(chunks, status_code=status_code,
+                             media_type="text/plain; charset=utf-8", headers=headers)
+
+CI_LOG_POLL_SECONDS = 0.5
+CI_LOG_HEARTBEAT_SECONDS = 15
+CI_LOG_MAX_LINE_BYTES = 64 * 1024
+
+def sse_text(line: bytes) -> str:
+    # A bare CR would end the SSE field early
+    return line.decode("utf-8", errors="replace").replace("\r", "")
+
+@app.get("/api/v1/ci/runs/{run_id}/log/stream")
+async def stream_ci_log(run_id: str, request: Request, offset: Optional[int] = Query(None, ge=0)):
+    """
+    Live tail as Server-Sent Events: one 'data:' event per log line, with the
+    byte offset after the line as its id, so reconnecting with Last-Event-ID
+    (or ?offset=) resumes without gaps. Ends with an 'end' event once the
+    run has finished and the log is drained.
+    """
+    log = open_ci_log(run_id)
+    last_event_id = request.headers.get("last-event-id")
+    if offset is None and last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id)
+
+    async def events():
+        position = offset if offset is not None else log.extent()[0]
+        pending = b""
+        idle = 0.0
+        while True:
+            start, end = log.extent()
+            if position < start:
+                yield f"event: truncated\ndata: {start - position}\n\n"
+                position, pending = start, b""
+            if end > position + len(pending):
+                chunk = log.read(position + len(pending), min(end, position + len(pending) + 64 * 1024))
+                if not chunk:
+                    await asyncio.sleep(CI_LOG_POLL_SECONDS)
+                    continue
+                pending += chunk
+                *lines, pending = pending.split(b"\n")
+                lines = [(line, len(line) + 1) for line in lines]
+                if len(pending) >= CI_LOG_MAX_LINE_BYTES:  # never buffer an endless line
+                    lines.append((pending, len(pending)))
+                    pending = b""
+                for line, size in lines:
+                    position += size
+                    yield f"id: {position}\ndata: {sse_text(line)}\n\n"
+                idle = 0.0
+                continue
+            if not ci_run_is_live(run_id):
+                if log.extent()[1] > position + len(pending): continue  # written just before it finished
+                if pending:
+                    position += len(pending)
+                    yield f"id: {position}\ndata: {sse_text(pending)}\n\n"
+                job = lookup_ci_job(run_id)
+                yield f"event: end\ndata: {job['status'] if job else 'finished'}\n\n"
+                return
+            if await request.is_disconnected(): return
+            await asyncio.sleep(CI_LOG_POLL_SECONDS)
+            idle += CI_LOG_POLL_SECONDS
+            if idle >= CI_LOG_HEARTBEAT_SECONDS:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.post("/api/v1/ci/run")
-def trigger_ci_manually(background_tasks: BackgroundTasks = None): 
-    job = scheduler.get_job("ci_job")
-    if job:
-        job.modify(next_run_time=datetime.now()) # Execute immediately
-        return {"status": "Triggered"}
-    return {"status": "Error", "details": "Job not found"}
+async def trigger_ci_manually(repo_url: Optional[str] = None):
+    return await dispatch_ci_command("run", {"repo_url": repo_url})
+
+@app.get("/api/v1/ci/jobs")
+def list_ci_jobs():
+    return {"jobs": ci_queue.list_jobs() if leader.is_leader else ci_store.list_jobs()}
+
+@app.get("/api/v1/ci/jobs/{job_id}")
+def get_ci_job(job_id: str):
+    job = lookup_ci_job(job_id)
+    if job is None: raise HTTPException(status_code=404)
+    return job
+
+@app.post("/api/v1/ci/jobs/{job_id}/cancel")
+async def cancel_ci_job(job_id: str):
+    return await dispatch_ci_command("cancel", {"job_id": job_id})
 
 if __name__ == "__main__":
-    print(f"🚀 Server Starting...")
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, reload_dirs=[BASE_DIR])
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Git-Guard Cloud Server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                        help="API worker processes; one of them is elected to run the CI scheduler")
+    args = parser.parse_args()
+    print(f"🚀 Server Starting ({args.workers} workers)...")
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)  # workers split the ingest rate limits
+    if args.workers > 1:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run("main:app", host=args.host, port=args.port, reload=True, reload_dirs=[BASE_DIR])
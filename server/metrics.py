@@ -0,0 +1,183 @@
+# File: server/metrics.py
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# ==========================================
+# In-process Metrics (Prometheus text format 0.0.4)
+# ==========================================
+# Hot paths only touch a dict under a per-metric lock; everything that the
+# server already tracks elsewhere (queue depths, ingest totals) is read by
+# callbacks at scrape time instead of being mirrored on every event.
+# Values are per process: the registry's constant labels (e.g. the worker
+# pid) tell the processes apart, except on metrics registered as shared,
+# whose value is the same whichever process answers the scrape.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra: pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _num(value: float) -> str:
+    if value == float("inf"): return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.const_labels: Tuple[Tuple[str, str], ...] = ()  # set by the registry
+        self._lock = threading.Lock()
+
+    def _labels(self, values: Sequence, extra: str = "") -> str:
+        names = self.labelnames + tuple(n for n, _ in self.const_labels)
+        return _labels(names, tuple(values) + tuple(v for _, v in self.const_labels), extra)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(k)} {_num(v)}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *labelvalues):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = []
+        for labelvalues, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="' + _num(bound) + '"'
+                lines.append(f"{self.name}_bucket{self._labels(labelvalues, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labelvalues)} {_num(series[-2])}")
+            lines.append(f"{self.name}_count{self._labels(labelvalues)} {series[-1]}")
+        return lines
+
+class CallbackMetric(_Metric):
+    """Gauge/counter whose value(s) are read at scrape time: fn() -> number or {labelvalues: number}"""
+    def __init__(self, name, help_text, fn: Callable, labelnames=(), kind: str = "gauge"):
+        super().__init__(name, help_text, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def collect(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return []  # a broken callback must not break the scrape
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f"{self.name}{self._labels(k)} {_num(v)}" for k, v in sorted(value.items())]
+
+class MetricsRegistry:
+    def __init__(self, const_labels: Optional[Dict[str, str]] = None):
+        self.const_labels = tuple((const_labels or {}).items())
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric, shared: bool = False) -> _Metric:
+        """`shared`: the value is the same in every process, so no constant labels"""
+        if not shared: metric.const_labels = self.const_labels
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge_fn(self, name, help_text, fn, labelnames=(), shared: bool = False) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, fn, labelnames, kind="gauge"), shared)
+
+    def counter_fn(self, name, help_text, fn, labelnames=()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, fn, labelnames, kind="counter"))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+# ==========================================
+# ASGI Middleware: Request Latency per Route
+# ==========================================
+class RequestMetricsMiddleware:
+    """
+    Observes time-to-response-start per (method, route template, status).
+    Route templates keep label cardinality bounded; unmatched paths share
+    one label. Long-lived streams are measured to their first byte.
+    """
+    def __init__(self, app, histogram: Histogram, skip_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.histogram = histogram
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status: int):
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "<unmatched>"
+            self.histogram.observe(time.perf_counter() - started, scope["method"], template, str(status))
+
+        async def send_wrapper(message):
+            nonlocal observed
+            if message["type"] == "http.response.start" and not observed:
+                observed = True
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not observed: observe(500)
+            raise
@@ -0,0 +1,67 @@
+# File: server/rate_limit.py
+import math
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# ==========================================
+# Token Buckets (per key, in process)
+# ==========================================
+class TokenBucketLimiter:
+    """
+    One bucket per key (developer, repo, ...): `burst` tokens, refilled at
+    `rate` tokens per second. Only the `max_keys` most recently used keys
+    are tracked; an evicted key simply starts again with a full bucket.
+    """
+    def __init__(self, rate: float, burst: float, max_keys: int = 10_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, updated_at]
+
+    def acquire(self, key: str, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """Take `cost` tokens; returns 0.0 if admitted, else the seconds until it would be"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / self.rate if self.rate > 0 else math.inf
+
+    def refund(self, key: str, cost: float = 1.0):
+        """Give back tokens taken for a request that was rejected further on"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket[0] = min(self.burst, bucket[0] + cost)
+
+# ==========================================
+# Admission Control: Shed Load on Queue Depth
+# ==========================================
+class AdmissionController:
+    """
+    Rejects new work while `depth_fn()` is at or above a share of
+    `max_depth`. Callers pass a lower share for bulk traffic so backfills
+    are shed first and interactive reports keep their latency.
+    """
+    def __init__(self, depth_fn: Callable[[], int], max_depth: int, retry_after: float = 5.0):
+        self.depth_fn = depth_fn
+        self.max_depth = max_depth
+        self.retry_after = retry_after
+
+    def overloaded(self, share: float = 1.0) -> bool:
+        return self.depth_fn() >= self.max_depth * share
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,121 @@
+# File: server/script_bundles.py
+import os
+import gzip
+import hashlib
+import threading
+from typing import Dict, Optional
+
+try:
+    import brotli  # Optional: enables Content-Encoding: br
+except ImportError:
+    brotli = None
+
+# ==========================================
+# Script Bundles: Content-addressed Hook Scripts
+# ==========================================
+class ScriptBundle:
+    """One immutable version of a hook script, pre-compressed"""
+    def __init__(self, name: str, source: bytes, signature):
+        self.name = name
+        self.source = source
+        self.signature = signature
+        self.sha256 = hashlib.sha256(source).hexdigest()
+        self.encodings = {"identity": source, "gzip": gzip.compress(source, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(source)
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.sha256}"'
+
+    def negotiate(self, accept_encoding: Optional[str]):
+        """Pick the smallest encoding the client accepts: (encoding, body)"""
+        accepted = set()
+        for part in (accept_encoding or "").split(","):
+            token, _, params = part.partition(";")
+            params = params.strip()
+            try:
+                q = float(params[2:]) if params.startswith("q=") else 1.0
+            except ValueError:
+                q = 1.0
+            if q > 0: accepted.add(token.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in self.encodings and (encoding in accepted or "*" in accepted):
+                return encoding, self.encodings[encoding]
+        return "identity", self.source
+
+class ScriptBundleRegistry:
+    """
+    Holds the current bundle per script plus every version seen since startup,
+    addressed by sha256. A bundle is rebuilt only when its file's
+    (mtime, size) changes, so serving a script never re-reads the file.
+    """
+    def __init__(self, base_dir: str, scripts: Dict[str, str]):
+        self.base_dir = base_dir
+        self.scripts = scripts
+        self._lock = threading.Lock()
+        self._current: Dict[str, ScriptBundle] = {}
+        self._versions: Dict[str, ScriptBundle] = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.base_dir, self.scripts[name])
+
+    def _signature(self, name: str):
+        try:
+            st = os.stat(self._path(name))
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def get(self, name: str) -> Optional[ScriptBundle]:
+        """Current bundle for a script, or None if the script file is missing"""
+        if name not in self.scripts: return None
+        signature = self._signature(name)
+        bundle = self._current.get(name)
+        if bundle is not None and bundle.signature == signature:
+            return bundle
+        return self._rebuild(name, signature)
+
+    def _rebuild(self, name: str, signature) -> Optional[ScriptBundle]:
+        with self._lock:
+            bundle = self._current.get(name)
+            if bundle is not None and bundle.signature == signature:
+                return bundle
+            if not os.path.exists(self._path(name)):
+                self._current.pop(name, None)
+                return None
+            with open(self._path(name), "r", encoding="utf-8") as f:
+                source = f.read().encode("utf-8")
+            bundle = ScriptBundle(name, source, signature)
+            self._current[name] = bundle
+            self._versions[bundle.sha256] = bundle
+            return bundle
+
+    def get_version(self, name: str, sha256: str) -> Optional[ScriptBundle]:
+        self.get(name)  # pick up a changed file before looking the hash up
+        bundle = self._versions.get(sha256)
+        return bundle if bundle is not None and bundle.name == name else None
+
+    def refresh_all(self):
+        for name in self.scripts:
+            self.get(name)
+
+    def clear(self):
+        with self._lock:
+            self._current.clear()
+            self._versions.clear()
+
+    def manifest(self) -> Dict:
+        scripts = {}
+        for name in self.scripts:
+            bundle = self.get(name)
+            if bundle is None: continue
+            scripts[name] = {
+                "sha256": bundle.sha256,
+                "size": len(bundle.source),
+                "url": f"/api/v1/scripts/{name}/{bundle.sha256}",
+            }
+        etag = '"' + hashlib.sha256(
+            "".join(f"{n}:{s['sha256']};" for n, s in sorted(scripts.items())).encode()
+        ).hexdigest()[:32] + '"'
+        return {"scripts": scripts, "etag": etag}
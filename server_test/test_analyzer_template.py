@@ -2,6 +2,8 @@ import unittest
 from unittest.mock import patch, MagicMock, mock_open
 import sys
 import os
+import json
+import tempfile
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
@@ -36,6 +38,273 @@ class TestAnalyzer(unittest.TestCase):
         rules = analyzer_template.fetch_dynamic_rules()
         self.assertEqual(rules['template_format'], "Standard")
 
+    @patch('analyzer_template.requests.get')
+    def test_fetch_dynamic_rules_not_modified(self, mock_get):
+        cached = {"etag": '"abc"', "config": {"template_format": "Cached"}}
+        with patch('analyzer_template.load_rules_cache', return_value=cached):
+            mock_get.return_value.status_code = 304
+            rules = analyzer_template.fetch_dynamic_rules()
+        self.assertEqual(rules['template_format'], "Cached")
+        self.assertEqual(mock_get.call_args[1]['headers'], {"If-None-Match": '"abc"'})
+
+    @patch('analyzer_template.start_config_agent')
+    @patch('analyzer_template.requests.get')
+    def test_fetch_dynamic_rules_uses_agent_synced_cache(self, mock_get, mock_start):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = os.path.join(tmp, "rules_cache.json")
+            with patch('analyzer_template.GUARD_DIR', tmp), patch('analyzer_template.RULES_CACHE_PATH', cache_path):
+                analyzer_template.save_rules_cache('"abc"', {"template_format": "Pushed"}, from_agent=True)
+                rules = analyzer_template.fetch_dynamic_rules()
+                mock_get.assert_not_called()
+
+                # A stale agent copy is revalidated and the agent restarted
+                analyzer_template.save_rules_cache('"abc"', {"template_format": "Pushed"})
+                mock_get.return_value.status_code = 304
+                stale = analyzer_template.fetch_dynamic_rules()
+        self.assertEqual(rules['template_format'], "Pushed")
+        self.assertEqual(stale['template_format'], "Pushed")
+        mock_get.assert_called_once()
+        mock_start.assert_called_once()
+
+    @patch('analyzer_template.requests.get')
+    def test_config_agent_long_polls_into_cache(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {"ETag": '"v2"'}
+        mock_get.return_value.json.return_value = {"template_format": "Pushed"}
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch('analyzer_template.GUARD_DIR', tmp), \
+                 patch('analyzer_template.RULES_CACHE_PATH', os.path.join(tmp, "rules_cache.json")), \
+                 patch('analyzer_template.CONFIG_AGENT_LOCK_PATH', os.path.join(tmp, "agent.lock")), \
+                 patch('analyzer_template.CONFIG_AGENT_LIFETIME_SECONDS', 0.05):
+                analyzer_template.run_config_agent()
+                cached = analyzer_template.load_rules_cache()
+        self.assertEqual(cached["config"]["template_format"], "Pushed")
+        self.assertIsNotNone(cached["agent_synced_at"])
+        self.assertEqual(mock_get.call_args[1]["params"], {"wait": analyzer_template.CONFIG_WATCH_SECONDS})
+
+    STAGED_DIFF = """diff --git a/gone.txt b/gone.txt
+deleted file mode 100644
+index c1b0730..0000000
+--- a/gone.txt
++++ /dev/null
+@@ -1 +0,0 @@
+-x
+diff --git a/keep.py b/keep.py
+old mode 100644
+new mode 100755
+index 422c2b7..de98044
+--- a/keep.py
++++ b/keep.py
+@@ -1,2 +1,3 @@
+ a
+--- not a header
++c
+diff --git "a/na\\303\\257ve.py" "b/na\\303\\257ve.py"
+new file mode 100644
+index 0000000..e69de29
+diff --git a/old.py b/new.py
+similarity index 96%
+rename from old.py
+rename to new.py
+index 1..2 100644
+--- a/old.py
++++ b/new.py
+@@ -50,0 +51 @@
++51"""
+
+    def test_parse_staged_diff(self):
+        files = list(analyzer_template.parse_staged_diff(self.STAGED_DIFF.split("\n")))
+        self.assertEqual([(f["status"], f["old_path"], f["path"]) for f in files], [
+            ("D", "gone.txt", "gone.txt"),
+            ("M", "keep.py", "keep.py"),
+            ("A", "na\u00efve.py", "na\u00efve.py"),
+            ("R", "old.py", "new.py"),
+        ])
+        self.assertEqual(files[1]["hunks"], [["@@ -1,2 +1,3 @@", " a", "--- not a header", "+c"]])
+        self.assertTrue(files[3]["text"].startswith("diff --git a/old.py b/new.py"))
+        self.assertTrue(files[3]["text"].endswith("+51"))
+
+    def test_parse_staged_diff_paths_with_spaces(self):
+        # git ends a ---/+++ path containing a space with a TAB
+        diff = ("diff --git a/my file.py b/my file.py\n--- a/my file.py\t\n+++ b/my file.py\t\n@@ -1 +1 @@\n-x\n+y\n"
+                'diff --git "a/na \\303\\257ve.py" "b/na \\303\\257ve.py"\nnew file mode 100644\n'
+                '--- /dev/null\n+++ "b/na \\303\\257ve.py"\t\n@@ -0,0 +1 @@\n+y')
+        files = list(analyzer_template.parse_staged_diff(diff.split("\n")))
+        self.assertEqual([(f["status"], f["old_path"], f["path"]) for f in files], [
+            ("M", "my file.py", "my file.py"),
+            ("A", "na \u00efve.py", "na \u00efve.py"),
+        ])
+        self.assertEqual(os.path.splitext(files[0]["path"])[1], ".py")
+
+    @patch('analyzer_template.Reranker')
+    @patch('analyzer_template.Retrieval')
+    @patch('analyzer_template.Repo')
+    def test_process_changes_runs_git_diff_once(self, MockRepo, MockRetrieval, MockReranker):
+        repo = MockRepo.return_value
+        repo.git.diff.return_value.stdout = [(l + "\n").encode() for l in self.STAGED_DIFF.split("\n")]
+        MockRetrieval.return_value.retrieve_code_batch.side_effect = lambda queries, top_k: [[] for _ in queries]
+        with patch('analyzer_template.API_KEY', "key"):
+            changes, _ = analyzer_template.process_changes_with_rag()
+        self.assertEqual(list(changes), ["keep.py", "na\u00efve.py", "new.py"])
+        repo.git.diff.assert_called_once_with("--cached", "-M", "--no-color", "--no-ext-diff", as_process=True)
+        queries = MockRetrieval.return_value.retrieve_code_batch.call_args[0][0]
+        self.assertEqual([ext for _, ext in queries], [".py", ".py", ".py"])
+
+    @patch('analyzer_template.Reranker')
+    @patch('analyzer_template.Retrieval')
+    @patch('analyzer_template.Repo')
+    def test_rag_result_reused_for_same_staged_tree(self, MockRepo, MockRetrieval, MockReranker):
+        repo = MockRepo.return_value
+        repo.git.write_tree.return_value = "tree1\n"
+        repo.git.diff.side_effect = lambda *a, **k: MagicMock(stdout=[(l + "\n").encode() for l in self.STAGED_DIFF.split("\n")])
+        MockRetrieval.return_value.retrieve_code_batch.side_effect = \
+            lambda queries, top_k: [[{"answer": "def f(): pass"}] for _ in queries]
+        MockReranker.return_value.rerank.return_value = [{"answer": "def f(): pass", "score": 0.9}]
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch('analyzer_template.API_KEY', "key"), patch('analyzer_template.GUARD_DIR', tmp), \
+                 patch('analyzer_template.RAG_CACHE_PATH', os.path.join(tmp, "rag_cache.json")):
+                report = analyzer_template.process_changes_with_rag()      # pre-commit hook
+                suggestion = analyzer_template.process_changes_with_rag()  # commit-msg hook
+                repo.git.write_tree.return_value = "tree2\n"               # re-staged
+                analyzer_template.process_changes_with_rag()
+        self.assertEqual(suggestion, report)
+        self.assertIn("[Ref Score: 0.90]", report[1])
+        self.assertEqual(repo.git.diff.call_count, 2)
+        self.assertEqual(MockReranker.return_value.rerank.call_count, 6)
+
+    @patch('analyzer_template.Reranker')
+    @patch('analyzer_template.Retrieval')
+    @patch('analyzer_template.Repo')
+    def test_files_are_reranked_concurrently_in_diff_order(self, MockRepo, MockRetrieval, MockReranker):
+        import time
+        MockRepo.return_value.git.diff.return_value.stdout = [(l + "\n").encode() for l in self.STAGED_DIFF.split("\n")]
+        MockRetrieval.return_value.retrieve_code_batch.side_effect = \
+            lambda queries, top_k: [[{"answer": text.split("\n")[0], "score": 1.0}] for text, _ in queries]
+        delays = {"keep.py": 0.3, "ve.py": 0.2, "new.py": 0.1}  # the first file finishes last
+
+        def slow_rerank(query, documents, top_k):
+            time.sleep(next(d for name, d in delays.items() if name in query.split("\n")[0]))
+            return documents
+        MockReranker.return_value.rerank.side_effect = slow_rerank
+        started = time.monotonic()
+        with patch('analyzer_template.API_KEY', "key"):
+            _, context = analyzer_template.process_changes_with_rag()
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertLess(context.index("a/keep.py"), context.index("ve.py"))
+        self.assertLess(context.index("ve.py"), context.index("a/old.py"))
+
+    def test_batched_query_embeddings_grouped_by_collection(self):
+        retriever = analyzer_template.Retrieval.__new__(analyzer_template.Retrieval)
+        retriever.client = MagicMock()
+        retriever.vector_distance_max = 2.0
+        retriever.embedding_function = MagicMock(side_effect=lambda texts: [[float(len(t))] for t in texts])
+        collections = {}
+
+        def get_collection(name, embedding_function):
+            collection = collections.setdefault(name, MagicMock())
+            collection.query.side_effect = lambda query_embeddings, n_results: {
+                "ids": [[f"{name}-{e[0]}"] for e in query_embeddings],
+                "documents": [["code"] for _ in query_embeddings],
+                "metadatas": [[{}] for _ in query_embeddings],
+                "distances": [[0.0] for _ in query_embeddings]}
+            return collection
+        retriever.client.get_collection.side_effect = get_collection
+
+        results = retriever.retrieve_code_batch([("a", ".py"), ("bb", ".js"), ("ccc", ".txt"), ("dddd", ".py")])
+        retriever.embedding_function.assert_called_once_with(["a", "bb", "dddd"])
+        self.assertEqual(collections["repo_python"].query.call_count, 1)
+        self.assertEqual(collections["repo_js"].query.call_count, 1)
+        self.assertEqual([[h["id"] for h in r] for r in results],
+                         [["repo_python-1.0"], ["repo_js-2.0"], [], ["repo_python-4.0"]])
+
+    def test_failed_embedding_batch_only_drops_the_bad_file(self):
+        retriever = analyzer_template.Retrieval.__new__(analyzer_template.Retrieval)
+        retriever.client = MagicMock()
+        retriever.vector_distance_max = 2.0
+
+        def embed(texts):
+            if any(t.startswith("minified") for t in texts):
+                raise ValueError("Expected embeddings to be non-empty")
+            return [[float(len(t))] for t in texts]
+        retriever.embedding_function = MagicMock(side_effect=embed)
+        collection = MagicMock()
+        collection.query.side_effect = lambda query_embeddings, n_results: {
+            "ids": [[f"hit-{e[0]}"] for e in query_embeddings],
+            "documents": [["code"] for _ in query_embeddings],
+            "metadatas": [[{}] for _ in query_embeddings],
+            "distances": [[0.0] for _ in query_embeddings]}
+        retriever.client.get_collection.return_value = collection
+
+        huge = "minified" + "x" * 100_000
+        results = retriever.retrieve_code_batch([("a", ".py"), (huge, ".js"), ("ccc", ".py")])
+        self.assertEqual([[h["id"] for h in r] for r in results], [["hit-1.0"], [], ["hit-3.0"]])
+        sent = [len(t) for call in retriever.embedding_function.call_args_list for t in call[0][0]]
+        self.assertEqual(max(sent), analyzer_template.EMBED_QUERY_MAX_CHARS)
+
+    def test_embedding_cache_roundtrip_and_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = analyzer_template.EmbeddingCache(os.path.join(tmp, "emb.db"), max_bytes=60)
+            compute = MagicMock(side_effect=lambda texts: [[0.5, -0.25, 1.0, 2.0] for _ in texts])  # 16 bytes each
+            first = cache.embed("m", ["a", "b", "c"], compute)
+            again = cache.embed("m", ["a", "b", "c"], compute)
+            self.assertEqual(first, again)
+            self.assertEqual(again[0], [0.5, -0.25, 1.0, 2.0])
+            self.assertEqual(compute.call_count, 1)
+            self.assertEqual((cache.hits, cache.misses), (3, 3))
+            self.assertEqual(cache.get_many("other-model", ["a"]), [None])
+
+            for text in ("a", "c", "b", "a", "c"):  # b is now the least recently used
+                cache.get_many("m", [text])
+            cache.embed("m", ["d"], compute)  # 64 bytes > cap
+            self.assertEqual([v is not None for v in cache.get_many("m", ["a", "b", "c", "d"])],
+                             [True, False, True, True])
+
+            half = analyzer_template.EmbeddingCache(os.path.join(tmp, "emb16.db"), dtype="float16")
+            half.put_many("m", ["x"], [[0.1, 0.5]])
+            self.assertAlmostEqual(half.get_many("m", ["x"])[0][0], 0.1, places=3)
+
+    def test_result_cache_is_bounded(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = analyzer_template.ResultCache(os.path.join(tmp, "c.db"), "t", ttl_seconds=60, max_entries=2)
+            for i in range(3):
+                cache.put(f"k{i}", {"i": i})
+            self.assertEqual([cache.get(f"k{i}") for i in range(3)], [None, {"i": 1}, {"i": 2}])
+
+    @patch('analyzer_template.ZhipuAiClient')
+    def test_llm_completion_cached_by_prompt_with_opt_out(self, MockClient):
+        create = MockClient.return_value.chat.completions.create
+        create.side_effect = lambda model, messages: MagicMock(
+            choices=[MagicMock(message=MagicMock(content="RISK LEVEL: Low #" + str(create.call_count)))])
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch('analyzer_template.GUARD_DIR', tmp), \
+                 patch('analyzer_template.RESULT_CACHE_PATH', os.path.join(tmp, "result_cache.db")):
+                first = analyzer_template.complete_llm("prompt")
+                retried = analyzer_template.complete_llm("prompt")
+                other = analyzer_template.complete_llm("prompt 2")
+                with patch('analyzer_template.LLM_CACHE_ENABLED', False):
+                    fresh = analyzer_template.complete_llm("prompt")
+        self.assertEqual(first, retried)
+        self.assertNotEqual(other, first)
+        self.assertNotEqual(fresh, first)
+        self.assertEqual(create.call_count, 3)
+
+    @patch('analyzer_template.requests.post')
+    def test_rerank_result_cached_by_query_and_candidates(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"results": [{"index": 1, "relevance_score": 0.8}]}
+        docs = lambda: [{"id": "a", "answer": "alpha"}, {"id": "b", "answer": "beta"}]
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch('analyzer_template.GUARD_DIR', tmp), patch('analyzer_template.API_KEY', "key"), \
+                 patch('analyzer_template.RESULT_CACHE_PATH', os.path.join(tmp, "result_cache.db")):
+                first = analyzer_template.Reranker().rerank("diff", docs(), top_k=1)
+                again = analyzer_template.Reranker().rerank("diff", docs(), top_k=1)
+                analyzer_template.Reranker().rerank("diff", list(reversed(docs())), top_k=1)
+                with patch('analyzer_template.RERANK_CACHE_TTL_SECONDS', -1):
+                    analyzer_template.Reranker().rerank("diff", docs(), top_k=1)
+        self.assertEqual(first, [{"id": "b", "answer": "beta", "score": 0.8}])
+        self.assertEqual(again, first)
+        self.assertEqual(mock_post.call_count, 3)  # candidate order and expiry are part of the key
+
     @patch('analyzer_template.requests.post')
     @patch('analyzer_template.getpass.getuser', return_value="test_user")
     def test_report_to_cloud(self, mock_user, mock_post):
@@ -45,6 +314,36 @@ class TestAnalyzer(unittest.TestCase):
         self.assertEqual(args['developer_id'], "test_user")
         self.assertEqual(args['risk_level'], "High")
 
+    @patch('analyzer_template.requests.post', side_effect=Exception("offline"))
+    @patch('analyzer_template.getpass.getuser', return_value="test_user")
+    def test_report_to_cloud_queues_and_flushes_outbox(self, mock_user, mock_post):
+        with tempfile.TemporaryDirectory() as tmp:
+            outbox = os.path.join(tmp, "report_outbox.ndjson")
+            with patch('analyzer_template.GUARD_DIR', tmp), patch('analyzer_template.REPORT_OUTBOX_PATH', outbox):
+                analyzer_template.report_to_cloud("msg", "High", "Summary")
+                with open(outbox, encoding='utf-8') as f:
+                    self.assertEqual(json.loads(f.readline())["commit_msg"], "msg")
+
+                mock_post.side_effect = None
+                mock_post.return_value.status_code = 200
+                mock_post.return_value.json.return_value = {"accepted": 1, "resume_from_line": None}
+                analyzer_template.report_to_cloud("msg2", "Low", "Summary")
+                self.assertFalse(os.path.exists(outbox))
+                self.assertEqual(mock_post.call_args[0][0], analyzer_template.TRACK_BATCH_URL)
+
+    @patch('analyzer_template.requests.post')
+    def test_flush_outbox_keeps_rate_limited_tail(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {"accepted": 2, "resume_from_line": 3}
+        with tempfile.TemporaryDirectory() as tmp:
+            outbox = os.path.join(tmp, "report_outbox.ndjson")
+            with open(outbox, 'w', encoding='utf-8') as f:
+                f.write('{"n": 1}\n{"n": 2}\n{"n": 3}\n{"n": 4}\n')
+            with patch('analyzer_template.REPORT_OUTBOX_PATH', outbox):
+                analyzer_template.flush_report_outbox()
+            with open(outbox, encoding='utf-8') as f:
+                self.assertEqual(f.read(), '{"n": 3}\n{"n": 4}\n')
+
     @patch('analyzer_template.process_changes_with_rag')
     @patch('analyzer_template.fetch_dynamic_rules')
     @patch('analyzer_template.ZhipuAI')
@@ -0,0 +1,254 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import io
+import time
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+server_path = os.path.join(project_root, 'server')
+if server_path not in sys.path:
+    sys.path.insert(0, server_path)
+
+import ci_engine
+from ci_engine import CIJobQueue
+from ci_store import CIRunStore
+from ci_logs import CILogStore, open_run_log
+
+def fake_pipeline(spec):
+    """Runs in the spawned child: 'sleep:<s>' sleeps, 'fail' fails, anything else passes"""
+    url = spec["repo_url"]
+    log = open_run_log(spec, spec["run_id"])
+    log.write_line(f"testing {url}")
+    log.close()
+    if url.startswith("sleep:"):
+        time.sleep(float(url.split(":")[1]))
+    tests = [{"nodeid": "test_a.py::test_a", "outcome": "passed", "duration_s": 0.1, "message": ""}]
+    if url == "fail":
+        tests.append({"nodeid": "test_a.py::test_b", "outcome": "failed", "duration_s": 0.2, "message": "boom"})
+        return {"status": "Failed", "sha": "f" * 40, "details": "1 failed, 1 passed", "tests": tests}
+    return {"status": "Success", "sha": "a" * 40, "details": "1 passed", "tests": tests}
+
+def wait_for(job, states, timeout=30):
+    deadline = time.time() + timeout
+    while job.status not in states and time.time() < deadline:
+        time.sleep(0.05)
+    return job.status
+
+class TestCIJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = CIRunStore(os.path.join(self.tmp.name, "ci_runs.db"))
+        self.logs = CILogStore(os.path.join(self.tmp.name, "logs"), keep_runs=1)
+        self.finished = []
+        self.queue = CIJobQueue(self.tmp.name, os.path.join(self.tmp.name, "state"), self.store, self.logs,
+                                max_workers=2, on_finish=self.finished.append, pipeline=fake_pipeline)
+
+    def tearDown(self):
+        self.queue.stop()
+        self.tmp.cleanup()
+
+    def test_job_runs_in_child_and_records_status(self):
+        self.queue.start()
+        job, coalesced = self.queue.submit("ok")
+        self.assertFalse(coalesced)
+        self.assertEqual(wait_for(job, ci_engine.FINISHED_STATES), ci_engine.SUCCEEDED)
+        self.assertEqual(self.store.status_summary()["status"], "Success")
+        self.assertEqual(self.logs.open(job.id).read(0, 100), b"testing ok\n")
+        self.assertIn(job, self.finished)
+
+        failed, _ = self.queue.submit("fail")
+        self.assertEqual(wait_for(failed, ci_engine.FINISHED_STATES), ci_engine.FAILED)
+        run = self.store.get_run(failed.run_id)
+        self.assertEqual((run["sha"], run["tests"]["failed"]), ("f" * 40, 1))
+        self.assertEqual([t["nodeid"] for t in self.store.list_tests(failed.run_id, outcome="failed")], ["test_a.py::test_b"])
+        # keep_runs=1: the older run's log was pruned
+        self.assertTrue(self.logs.open(failed.id).exists())
+        self.assertFalse(self.logs.open(job.id).exists())
+
+    def test_run_is_stored_before_job_shows_finished(self):
+        seen = []
+        record_run = self.store.record_run
+        def recording(run, tests):
+            seen.append(self.queue.get(run["run_id"]).status)
+            record_run(run, tests)
+        self.queue.start()
+        with patch.object(self.store, 'record_run', side_effect=recording):
+            job, _ = self.queue.submit("ok")
+            wait_for(job, ci_engine.FINISHED_STATES)
+        self.assertEqual(seen, [ci_engine.RUNNING])
+        self.assertEqual(self.store.get_run(job.run_id)["status"], "Success")
+
+    def test_kill_falls_back_when_child_has_no_process_group_yet(self):
+        process = MagicMock(pid=12345)
+        with patch('ci_engine.os.killpg', create=True, side_effect=ProcessLookupError):
+            self.queue._kill(process)
+        process.kill.assert_called_once()
+        process.join.assert_called_with(timeout=5)
+
+    def test_result_sent_just_before_exit_is_not_lost(self):
+        parent_conn = MagicMock()
+        parent_conn.poll.side_effect = lambda timeout: timeout == 0  # arrives after the last wait
+        parent_conn.recv.return_value = {"status": "Success", "sha": "a" * 40, "tests": []}
+        ctx = MagicMock()
+        ctx.Pipe.return_value = (parent_conn, MagicMock())
+        ctx.Process.return_value.is_alive.return_value = False
+        self.queue._ctx = ctx
+        job, _ = self.queue.submit("ok")
+        job.started_at = time.time()
+        self.queue._run_job(job)
+        self.assertEqual(job.status, ci_engine.SUCCEEDED)
+
+    def test_duplicate_triggers_coalesce_and_queued_jobs_cancel(self):
+        first, coalesced_1 = self.queue.submit("repo")
+        second, coalesced_2 = self.queue.submit("repo")
+        self.assertFalse(coalesced_1)
+        self.assertTrue(coalesced_2)
+        self.assertIs(first, second)
+
+        self.queue.cancel(first.id)
+        self.assertEqual(first.status, ci_engine.CANCELLED)
+        # A job cancelled before it started never produced a run
+        self.assertIsNone(first.run_id)
+        self.assertEqual(self.store.status_summary()["status"], "Never Ran")
+
+    def test_timeout_and_cancel_kill_running_jobs(self):
+        self.queue.start()
+        slow, _ = self.queue.submit("sleep:30", timeout=1)
+        other, _ = self.queue.submit("sleep:30:b")
+        wait_for(other, {ci_engine.RUNNING})
+        self.queue.cancel(other.id)
+
+        self.assertEqual(wait_for(slow, ci_engine.FINISHED_STATES), ci_engine.TIMED_OUT)
+        self.assertEqual(wait_for(other, ci_engine.FINISHED_STATES), ci_engine.CANCELLED)
+        self.assertLess(slow.finished_at - slow.started_at, 10)
+        self.assertEqual(self.store.get_run(slow.id)["status"], "Timed Out")
+
+def record(store, run_id, sha, status):
+    store.record_run({
+        "run_id": run_id, "repo_url": "repo", "sha": sha, "trigger": "schedule", "status": status,
+        "selection": "full", "started_at": time.time(), "finished_at": time.time(), "duration_s": 1.0,
+        "exit_code": 0, "details": "", "output_tail": "",
+    }, [])
+
+class TestCIPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = CIRunStore(os.path.join(self.tmp.name, "ci_runs.db"))
+        self.logs = CILogStore(os.path.join(self.tmp.name, "logs"))
+        self.spec = {
+            "run_id": "abc123",
+            "repo_url": "repo", "workspace_dir": self.tmp.name, "force": False, "venv_budget_bytes": 1 << 30,
+            "store_path": self.store.db_path,
+            "junit_path": os.path.join(self.tmp.name, "junit.xml"),
+            "index_cache_path": os.path.join(self.tmp.name, "imports.json"),
+            **self.logs.spec(),
+        }
+        self.repo = MagicMock()
+        self.repo.commit.return_value.hexsha = "a" * 40
+        sandbox = MagicMock()
+        sandbox.update_mirror.return_value = self.repo
+        sandbox.worktree.return_value.__enter__.return_value = self.tmp.name
+        sandbox.venv.return_value.__enter__.return_value = "venv-python"
+        patchers = [
+            patch('ci_engine.CISandbox', return_value=sandbox),
+            patch('ci_engine.subprocess.Popen'),
+        ]
+        self.mock_run = [p.start() for p in patchers][-1]
+        self.mock_run.side_effect = lambda *a, **kw: MagicMock(
+            stdout=io.BytesIO(b"collected 1 item\n\n== 1 passed in 0.1s ==\n"), wait=MagicMock(return_value=0))
+        for p in patchers: self.addCleanup(p.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def pytest_args(self):
+        return [a for a in self.mock_run.call_args[0][0][3:] if not a.startswith("-") and "junit_family" not in a]
+
+    def test_already_tested_sha_is_reused_unless_forced(self):
+        record(self.store, "run1", "a" * 40, "Success")
+        result = ci_engine.run_ci_pipeline(self.spec)
+        self.assertEqual((result["status"], result["reused_run_id"]), ("Skipped", "run1"))
+        self.mock_run.assert_not_called()
+
+        self.spec["force"] = True
+        result = ci_engine.run_ci_pipeline(self.spec)
+        self.assertEqual((result["status"], result["selection"]), ("Success", "full"))
+        self.assertEqual(result["details"], "1 passed in 0.1s")
+        self.assertEqual(self.pytest_args(), [])
+        self.assertEqual(self.mock_run.call_args[0][0][:3], ["venv-python", "-m", "pytest"])
+        # Output is streamed to the run log; only the tail is kept in the result
+        log = self.logs.open("abc123").read(0, 10_000).decode()
+        self.assertIn("already tested by run run1".lower(), log.lower())
+        self.assertTrue(log.endswith("collected 1 item\n\n== 1 passed in 0.1s ==\n"))
+        self.assertIn("1 passed", result["output_tail"])
+
+    def test_new_commits_run_impacted_tests_only(self):
+        record(self.store, "run1", "b" * 40, "Success")
+        with patch('ci_engine.plan_test_selection', return_value=["tests/test_x.py"]):
+            result = ci_engine.run_ci_pipeline(self.spec)
+        self.assertEqual((result["status"], result["selection"]), ("Success", "impacted"))
+        self.assertEqual(self.pytest_args(), ["tests/test_x.py"])
+
+    def test_failed_baseline_runs_full_suite(self):
+        record(self.store, "run1", "b" * 40, "Failed")
+        with patch('ci_engine.plan_test_selection') as mock_plan:
+            result = ci_engine.run_ci_pipeline(self.spec)
+        mock_plan.assert_not_called()
+        self.assertEqual(result["selection"], "full")
+
+SAMPLE_TESTS = '''
+import pytest
+
+@pytest.mark.parametrize("i", range(24))
+def test_ok(i):
+    assert True
+
+def test_broken():
+    assert 1 == 2
+'''
+
+class TestPytestShards(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmp.name, "test_sample.py"), "w", encoding="utf-8") as f:
+            f.write(SAMPLE_TESTS)
+        self.logs = CILogStore(os.path.join(self.tmp.name, "logs"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_shards_run_in_parallel_and_merge_into_one_report(self):
+        history = {"test_sample.py::test_broken": {"duration_s": 0.1, "outcome": "failed"}}
+        shards = ci_engine.plan_parallel_shards(sys.executable, self.tmp.name, [], history, 4)
+        self.assertEqual(len(shards), 2)  # 25 tests, at least 10 per shard
+        self.assertEqual(shards[0][0], "test_sample.py::test_broken")
+
+        log = self.logs.open("abc")
+        junit_path = os.path.join(self.tmp.name, "junit.xml")
+        code, tail, tests = ci_engine.run_pytest_shards(sys.executable, self.tmp.name, shards, junit_path, log)
+        log.close()
+        self.assertEqual(code, 1)
+        self.assertEqual(len(tests), 25)
+        self.assertEqual([t["nodeid"] for t in tests if t["outcome"] == "failed"], ["test_sample.py::test_broken"])
+        self.assertIn("1 failed, 24 passed", ci_engine.shard_summary(tests, 1.0, 2))
+        text = log.read(0, 1 << 20).decode()
+        self.assertIn("[shard 0] ", text)
+        self.assertIn("[shard 1] ", text)
+        self.assertFalse([n for n in os.listdir(self.tmp.name) if n.startswith("junit")])  # shard reports cleaned up
+
+    def test_merge_exit_codes(self):
+        self.assertEqual(ci_engine.merge_exit_codes([0, 5]), 0)
+        self.assertEqual(ci_engine.merge_exit_codes([5, 5]), 5)
+        self.assertEqual(ci_engine.merge_exit_codes([0, 1, 2]), 2)
+
+    def test_long_id_lists_use_an_args_file(self):
+        ids = [f"test_sample.py::test_ok[{i}]" for i in range(5000)]
+        args_path = os.path.join(self.tmp.name, "shard.args")
+        self.assertEqual(ci_engine.pytest_targets(ids, args_path), ["@" + args_path])
+        self.assertEqual(ci_engine.pytest_targets(ids[:3], args_path), ids[:3])
+
+if __name__ == '__main__':
+    unittest.main()
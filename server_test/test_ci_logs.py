@@ -0,0 +1,69 @@
+import unittest
+import sys
+import os
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+server_path = os.path.join(project_root, 'server')
+if server_path not in sys.path:
+    sys.path.insert(0, server_path)
+
+from ci_logs import CILogStore, parse_byte_range
+
+class TestCILogs(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.logs = CILogStore(self.tmp.name, segment_bytes=10, max_segments=3, keep_runs=2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_segments_rotate_but_offsets_stay_stable(self):
+        log = self.logs.open("a1")
+        data = bytes(range(65, 65 + 45))
+        for i in range(0, len(data), 7):
+            log.write(data[i:i + 7])
+        log.close()
+        self.assertEqual(log.segments(), [2, 3, 4])
+        self.assertEqual(log.extent(), (20, 45))
+        self.assertEqual(log.read(20, 45), data[20:])
+        self.assertEqual(log.read(18, 25), data[20:25])  # rotated-out bytes are skipped
+        self.assertEqual([len(c) for c in log.iter_range(20, 45, chunk_size=4)], [4, 4, 2, 4, 4, 2, 4, 1])
+
+    def test_open_range_survives_rotation_during_download(self):
+        log = self.logs.open("a1")
+        data = bytes(range(65, 65 + 45))
+        log.write(data[:35])  # segments 1-3, segment 0 already rotated out
+        first, last, chunks = log.open_range(*log.extent())
+        self.assertEqual((first, last), (10, 35))
+        log.write(data[35:])  # the live run keeps rotating and deletes segment 1
+        self.assertEqual(log.segments(), [2, 3, 4])
+        self.assertEqual(b"".join(chunks), data[10:35])  # exactly the declared length
+        log.close()
+        self.assertEqual(log.open_range(0, 5)[:2], (5, 5))  # range entirely rotated out
+
+    def test_prune_keeps_newest_runs_and_rejects_bad_ids(self):
+        for i, run_id in enumerate(["a1", "a2", "a3"]):
+            log = self.logs.open(run_id)
+            log.write_line("x")
+            log.close()
+            os.utime(log.run_dir, (1000 + i, 1000 + i))
+        self.logs.prune()
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["a2", "a3"])
+        with self.assertRaises(ValueError):
+            self.logs.open("../etc")
+
+    def test_parse_byte_range(self):
+        self.assertIsNone(parse_byte_range(None, 0, 100))
+        self.assertIsNone(parse_byte_range("bytes=0-1,5-6", 0, 100))
+        self.assertEqual(parse_byte_range("bytes=10-19", 0, 100), (10, 20))
+        self.assertEqual(parse_byte_range("bytes=90-", 0, 100), (90, 100))
+        self.assertEqual(parse_byte_range("bytes=90-500", 0, 100), (90, 100))
+        self.assertEqual(parse_byte_range("bytes=-30", 80, 100), (80, 100))
+        for header in ("bytes=100-", "bytes=5-9", "bytes=x-1", "bytes=-0"):
+            with self.assertRaises(ValueError):
+                parse_byte_range(header, 10, 100)
+
+if __name__ == '__main__':
+    unittest.main()
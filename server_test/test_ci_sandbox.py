@@ -0,0 +1,86 @@
+import unittest
+import sys
+import os
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+server_path = os.path.join(project_root, 'server')
+if server_path not in sys.path:
+    sys.path.insert(0, server_path)
+
+from ci_sandbox import CISandbox, find_requirements, requirements_key
+
+class FakeInstaller:
+    """Stands in for `python -m venv` / `pip install`: writes `size` bytes per venv"""
+    def __init__(self, size=1000):
+        self.size = size
+        self.calls = []
+
+    def __call__(self, cmd, cwd):
+        self.calls.append(cmd)
+        if cmd[1:3] == ["-m", "venv"]:
+            os.makedirs(cmd[3])
+            with open(os.path.join(cmd[3], "payload"), "wb") as f:
+                f.write(b"x" * self.size)
+        return 0
+
+class TestCISandbox(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sandbox = CISandbox(os.path.join(self.tmp.name, "sandbox"), venv_budget_bytes=2500)
+        self.installer = FakeInstaller()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def checkout(self, name, requirements):
+        root = os.path.join(self.tmp.name, name)
+        os.makedirs(os.path.join(root, "server"))
+        with open(os.path.join(root, "server", "requirements.txt"), "w") as f:
+            f.write(requirements)
+        return root
+
+    def test_requirements_key_follows_content(self):
+        a = self.checkout("a", "fastapi==1\n")
+        b = self.checkout("b", "fastapi==1\n")
+        c = self.checkout("c", "fastapi==2\n")
+        self.assertEqual(find_requirements(a), ["server/requirements.txt"])
+        key = lambda root: requirements_key(root, find_requirements(root))
+        self.assertEqual(key(a), key(b))
+        self.assertNotEqual(key(a), key(c))
+
+    def test_venv_is_built_once_and_reused(self):
+        a = self.checkout("a", "fastapi==1\n")
+        with self.sandbox.venv(a, self.installer) as python:
+            self.assertIn(self.sandbox.venvs_dir, python)
+        self.assertEqual(len(self.installer.calls), 2)
+        self.assertIn("server/requirements.txt", self.installer.calls[1])
+        with self.sandbox.venv(self.checkout("b", "fastapi==1\n"), self.installer):
+            pass
+        self.assertEqual(len(self.installer.calls), 2)
+
+    def test_failed_install_leaves_no_venv(self):
+        a = self.checkout("a", "nope\n")
+        failing = lambda cmd, cwd: 1 if "pip" in cmd else self.installer(cmd, cwd)
+        with self.assertRaises(RuntimeError):
+            with self.sandbox.venv(a, failing):
+                pass
+        self.assertEqual(self.sandbox.cached_venvs(), [])
+
+    def test_lru_eviction_respects_budget_and_busy_venvs(self):
+        roots = [self.checkout(f"r{i}", f"pkg=={i}\n") for i in range(4)]
+        with self.sandbox.venv(roots[0], self.installer):
+            for root in roots[1:3]:
+                with self.sandbox.venv(root, self.installer):
+                    pass
+            # 3 x 1000 bytes > 2500: r1 is the least recently used idle venv; r0 is busy
+            keys = {v["key"] for v in self.sandbox.cached_venvs()}
+            self.assertEqual(keys, {requirements_key(r, find_requirements(r)) for r in (roots[0], roots[2])})
+        with self.sandbox.venv(roots[3], self.installer):
+            pass
+        keys = {v["key"] for v in self.sandbox.cached_venvs()}
+        self.assertEqual(keys, {requirements_key(r, find_requirements(r)) for r in (roots[2], roots[3])})
+
+if __name__ == '__main__':
+    unittest.main()
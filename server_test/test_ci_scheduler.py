@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+server_path = os.path.join(project_root, 'server')
+if server_path not in sys.path:
+    sys.path.insert(0, server_path)
+
+from ci_engine import CIJobQueue
+from ci_scheduler import CIRepoRegistry, FairCIScheduler, stagger_offset
+
+def repo(url, interval=10, timeout=5):
+    return {"repo_url": url, "interval_minutes": interval, "timeout_minutes": timeout, "enabled": True}
+
+class TestFairCIScheduler(unittest.TestCase):
+    def setUp(self):
+        self.repos = [repo(f"https://example.com/r{i}.git") for i in range(20)]
+        self.queue = CIJobQueue("ws", "state", MagicMock(), MagicMock(), max_queued=5)
+        self.lags = []
+        self.scheduler = FairCIScheduler(self.queue, lambda: self.repos, on_dispatch=self.lags.append)
+
+    def drain(self):
+        for job in self.queue.list_jobs():
+            self.queue.cancel(job["job_id"])
+
+    def test_first_runs_are_staggered_across_the_interval(self):
+        self.queue.max_queued = None
+        self.assertEqual(self.scheduler.tick(now=0), [])
+        due_by_minute = [len(self.scheduler.tick(now=60 * m)) for m in range(1, 11)]
+        self.drain()
+        self.assertEqual(sum(due_by_minute), 20)
+        self.assertLessEqual(max(due_by_minute), 6)
+        self.assertTrue(all(0 <= stagger_offset(r["repo_url"], 600) < 600 for r in self.repos))
+
+    def test_backpressure_defers_overdue_repos_fairly(self):
+        self.scheduler.tick(now=0)
+        first = self.scheduler.tick(now=600)  # every repo is due, only 5 fit
+        self.assertEqual(len(first), 5)
+        self.assertEqual(self.scheduler.deferred, 15)
+        self.assertGreater(self.scheduler.max_overdue(now=600), 0)
+        self.assertEqual(len(self.lags), 5)
+        self.drain()
+        second = self.scheduler.tick(now=601)
+        self.assertEqual(len(second), 5)
+        self.assertFalse(set(first) & set(second))  # the deferred repos go next
+        # Submitted repos wait a full interval before they are due again
+        self.assertGreaterEqual(self.scheduler.next_due(first[0]), 1200)
+
+    def test_per_repo_interval_and_removal(self):
+        self.repos = [repo("https://example.com/fast.git", interval=1), repo("https://example.com/slow.git", interval=60)]
+        self.scheduler.tick(now=0)
+        self.drain()
+        self.assertEqual(self.scheduler.tick(now=60), ["https://example.com/fast.git"])
+        self.repos = self.repos[1:]
+        self.scheduler.tick(now=61)
+        self.assertIsNone(self.scheduler.next_due("https://example.com/fast.git"))
+
+class TestCIRepoRegistry(unittest.TestCase):
+    def test_upsert_list_delete(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = CIRepoRegistry(os.path.join(tmp, "ci_runs.db"))
+            registry.upsert("https://example.com/a.git", 0, 10, enabled=False)
+            registry.upsert("https://example.com/b.git", 30, 10)
+            self.assertEqual([r["repo_url"] for r in registry.list()], ["https://example.com/a.git", "https://example.com/b.git"])
+            self.assertEqual(registry.get("https://example.com/a.git")["interval_minutes"], 1)
+            self.assertFalse(registry.get("https://example.com/a.git")["enabled"])
+            self.assertTrue(registry.delete("https://example.com/a.git"))
+            self.assertFalse(registry.delete("https://example.com/a.git"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import sys
+import os
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+server_path = os.path.join(project_root, 'server')
+if server_path not in sys.path:
+    sys.path.insert(0, server_path)
+
+from ci_selection import ImportGraphIndex, select_tests, parse_imports, module_names, git_blob_ids, parse_collected_ids, plan_shards
+
+FILES = {
+    "server/main.py": "import commit_store\nfrom ci_engine import CIJobQueue\n",
+    "server/commit_store.py": "import sqlite3\n",
+    "server/ci_engine.py": "from ci_selection import select_tests\n",
+    "server/ci_selection.py": "import ast\n",
+    "server/pkg/__init__.py": "",
+    "server/pkg/helpers.py": "from . import util\n",
+    "server/pkg/util.py": "",
+    "server_test/test_main.py": "import main\n",
+    "server_test/test_commit_store.py": "from commit_store import CommitLogStore\n",
+    "server_test/test_helpers.py": "from pkg.helpers import x\n",
+}
+
+class TestCISelection(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        for rel, source in FILES.items():
+            path = os.path.join(self.tmp.name, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(source)
+        self.cache_path = os.path.join(self.tmp.name, "imports.json")
+        self.index = ImportGraphIndex(self.tmp.name, self.cache_path).build()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_module_names_and_relative_imports(self):
+        self.assertEqual(module_names("server/pkg/__init__.py"), ["server.pkg", "pkg"])
+        self.assertIn("server.pkg.util", parse_imports("from . import util", "server/pkg/helpers.py"))
+        self.assertIn("server.util", parse_imports("from ..util import f", "server/pkg/helpers.py"))
+
+    def test_transitive_impact(self):
+        # ci_selection <- ci_engine <- main <- test_main
+        self.assertEqual(select_tests(self.index, [("M", "server/ci_selection.py")]), ["server_test/test_main.py"])
+        self.assertEqual(
+            select_tests(self.index, [("M", "server/commit_store.py")]),
+            ["server_test/test_commit_store.py", "server_test/test_main.py"],
+        )
+        self.assertEqual(select_tests(self.index, [("M", "server/pkg/util.py")]), ["server_test/test_helpers.py"])
+        self.assertEqual(select_tests(self.index, [("M", "README.md")]), [])
+
+    def test_unmappable_changes_need_full_suite(self):
+        self.assertIsNone(select_tests(self.index, [("M", "server/requirements.txt")]))
+        self.assertIsNone(select_tests(self.index, [("M", "pytest.ini")]))
+        self.assertIsNone(select_tests(self.index, [("D", "server/commit_store.py")]))
+        self.assertIsNone(select_tests(self.index, [("M", "server/data.json")]))
+
+    def test_index_cache_is_reused(self):
+        self.assertTrue(os.path.exists(self.cache_path))
+        rebuilt = ImportGraphIndex(self.tmp.name, self.cache_path).build()
+        self.assertEqual(rebuilt.files, self.index.files)
+
+    def test_blob_ids_keep_cache_valid_across_checkouts(self):
+        blobs = git_blob_ids("100644 blob 1111\tserver/main.py\n160000 commit 2222\tvendor/lib\n")
+        self.assertEqual(blobs, {"server/main.py": "1111"})
+        ImportGraphIndex(self.tmp.name, self.cache_path).build(blobs)
+        # A fresh checkout has new mtimes, but the same blob is not re-parsed
+        with open(os.path.join(self.tmp.name, "server/main.py"), "w", encoding="utf-8") as f:
+            f.write("import os\n")
+        rebuilt = ImportGraphIndex(self.tmp.name, self.cache_path).build(blobs)
+        self.assertIn("commit_store", rebuilt.files["server/main.py"])
+
+class TestShardPlanning(unittest.TestCase):
+    def test_parse_collected_ids(self):
+        output = "t/test_a.py::test_x\nt/test_a.py::T::test_y[1]\n\n2 tests collected in 0.01s\n"
+        self.assertEqual(parse_collected_ids(output), ["t/test_a.py::test_x", "t/test_a.py::T::test_y[1]"])
+
+    def test_shards_balance_duration_and_put_failures_first(self):
+        history = {
+            "t.py::slow": {"duration_s": 10.0, "outcome": "passed"},
+            "t.py::mid": {"duration_s": 6.0, "outcome": "passed"},
+            "t.py::flaky": {"duration_s": 1.0, "outcome": "failed"},
+            "t.py::quick": {"duration_s": 1.0, "outcome": "passed"},
+        }
+        nodeids = list(history) + ["t.py::new_1", "t.py::new_2"]  # unknown: average cost 4.5s
+        shards = plan_shards(nodeids, history, 2)
+        self.assertEqual(sorted(sum(shards, [])), sorted(nodeids))
+        self.assertEqual(shards[0][0], "t.py::flaky")
+        loads = [sum(history.get(n, {"duration_s": 4.5})["duration_s"] for n in shard) for shard in shards]
+        self.assertLessEqual(abs(loads[0] - loads[1]), 2.0)
+        self.assertEqual(len(plan_shards(["a::b"], {}, 8)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import sys
+import os
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+server_path = os.path.join(project_root, 'server')
+if server_path not in sys.path:
+    sys.path.insert(0, server_path)
+
+from ci_store import CIRunStore, parse_junit_xml
+
+JUNIT_XML = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite name="pytest" tests="3">
+  <testcase classname="server_test.test_main.TestServerMain" file="server_test/test_main.py" line="10" name="test_ok" time="0.010"/>
+  <testcase classname="server_test.test_main.TestServerMain" file="server_test/test_main.py" line="20" name="test_bad" time="0.500">
+    <failure message="AssertionError: 1 != 2">trace</failure>
+  </testcase>
+  <testcase classname="client_test.test_cli" file="client_test/test_cli.py" line="3" name="test_fn[a-b]" time="0.020">
+    <skipped message="not on windows"/>
+  </testcase>
+</testsuite></testsuites>
+"""
+
+def run_row(run_id, sha, status, finished_at):
+    return {
+        "run_id": run_id, "repo_url": "repo", "sha": sha, "trigger": "schedule", "status": status,
+        "selection": "full", "started_at": finished_at - 5, "finished_at": finished_at, "duration_s": 5.0,
+        "exit_code": 0 if status == "Success" else 1, "details": "summary", "output_tail": "x" * 100,
+    }
+
+class TestCIRunStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = CIRunStore(os.path.join(self.tmp.name, "ci_runs.db"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parse_junit_xml_builds_node_ids(self):
+        path = os.path.join(self.tmp.name, "junit.xml")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(JUNIT_XML)
+        tests = parse_junit_xml(path)
+        self.assertEqual([t["nodeid"] for t in tests], [
+            "server_test/test_main.py::TestServerMain::test_ok",
+            "server_test/test_main.py::TestServerMain::test_bad",
+            "client_test/test_cli.py::test_fn[a-b]",
+        ])
+        self.assertEqual([t["outcome"] for t in tests], ["passed", "failed", "skipped"])
+        self.assertEqual(tests[1]["message"], "AssertionError: 1 != 2")
+
+    def test_runs_keyed_by_sha(self):
+        tests = [{"nodeid": f"t.py::test_{i}", "outcome": "passed", "duration_s": 0.1, "message": ""} for i in range(5)]
+        self.store.record_run(run_row("r1", "sha1", "Failed", 100), tests)
+        self.store.record_run(run_row("r2", "sha1", "Timed Out", 200), [])
+        self.store.record_run(run_row("r3", "sha2", "Success", 300), tests)
+
+        self.assertEqual(self.store.find_conclusive_run("repo", "sha1")["run_id"], "r1")
+        self.assertIsNone(self.store.find_conclusive_run("repo", "sha3"))
+        self.assertEqual(self.store.latest_conclusive_run("repo")["sha"], "sha2")
+        self.assertEqual([r["run_id"] for r in self.store.list_runs(sha="sha1")], ["r2", "r1"])
+        self.assertEqual([r["run_id"] for r in self.store.list_runs(before=300, limit=1)], ["r2"])
+
+    def test_summary_is_compact_and_tests_paginate(self):
+        tests = [{"nodeid": f"t.py::test_{i}", "outcome": "passed", "duration_s": 0.1, "message": ""} for i in range(5)]
+        self.store.record_run(run_row("r1", "sha1", "Success", 100), tests)
+        summary = self.store.status_summary()
+        self.assertEqual((summary["status"], summary["tests"]["total"]), ("Success", 5))
+        self.assertNotIn("output_tail", summary)
+        self.assertIn("output_tail", self.store.get_run("r1"))
+
+        page1 = self.store.list_tests("r1", limit=3)
+        page2 = self.store.list_tests("r1", offset=3, limit=3)
+        self.assertEqual(len(page1) + len(page2), 5)
+        self.assertFalse({t["nodeid"] for t in page1} & {t["nodeid"] for t in page2})
+
+    def test_test_history_keeps_latest_outcome(self):
+        first = [{"nodeid": "t.py::a", "outcome": "failed", "duration_s": 1.0, "message": ""},
+                 {"nodeid": "t.py::b", "outcome": "passed", "duration_s": 2.0, "message": ""}]
+        second = [{"nodeid": "t.py::a", "outcome": "passed", "duration_s": 3.0, "message": ""}]
+        self.store.record_run(run_row("r1", "sha1", "Failed", 100), first)
+        self.store.record_run(run_row("r2", "sha2", "Success", 200), second)
+        self.store.record_run(run_row("r3", "sha3", "Timed Out", 300), [])
+        history = self.store.test_history("repo")
+        self.assertEqual(history["t.py::a"], {"duration_s": 3.0, "outcome": "passed"})
+        self.assertEqual(history["t.py::b"]["outcome"], "passed")
+        self.assertEqual(list(self.store.test_history("repo", runs=1)), ["t.py::a"])
+
+    def test_job_mirror_and_abandon(self):
+        self.store.save_job({"job_id": "a", "status": "running"}, 1.0, finished=False)
+        self.store.save_job({"job_id": "b", "status": "success"}, 2.0, finished=True)
+        self.assertEqual([j["job_id"] for j in self.store.list_jobs()], ["b", "a"])
+        self.assertEqual(self.store.abandon_unfinished_jobs("restarted"), 1)
+        self.assertEqual(self.store.get_job("a")["status"], "error")
+        self.assertEqual(self.store.abandon_unfinished_jobs("restarted"), 0)
+
+    def test_command_inbox(self):
+        command_id = self.store.post_command("cancel", {"job_id": "a"})
+        self.assertIsNone(self.store.command_result(command_id))
+        self.assertEqual(self.store.pending_commands(), [{"id": command_id, "kind": "cancel", "payload": {"job_id": "a"}}])
+        self.store.complete_command(command_id, {"error": "not_found"})
+        self.assertEqual(self.store.pending_commands(), [])
+        self.assertEqual(self.store.command_result(command_id), {"error": "not_found"})
+
+if __name__ == '__main__':
+    unittest.main()
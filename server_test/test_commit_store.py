@@ -0,0 +1,276 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import time
+import hashlib
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+server_path = os.path.join(project_root, 'server')
+if server_path not in sys.path:
+    sys.path.insert(0, server_path)
+
+from commit_store import (CommitLogStore, CommitIngestQueue, PendingRollups, format_rollups, decode_cursor,
+                          encode_cursor, legacy_csv_offset, partition_start, unpack_chunk, PARTITION_MS)
+
+def make_record(i, ts=None, developer="alice", repo="repo", risk="Low"):
+    return {
+        "ts": ts if ts is not None else 1_700_000_000_000 + i,
+        "developer_id": developer,
+        "repo_name": repo,
+        "risk_level": risk,
+        "commit_msg": f"msg {i}",
+        "ai_summary": "summary",
+    }
+
+class TestCommitStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = CommitLogStore(os.path.join(self.tmp.name, "commits.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_group_commit_on_size_trigger(self):
+        queue = CommitIngestQueue(self.store, max_batch=10, max_delay=60)
+        queue.start()
+        for i in range(25):
+            queue.submit(make_record(i))
+        deadline = time.time() + 5
+        while queue.flushed_total < 20 and time.time() < deadline:
+            time.sleep(0.01)
+        # Two full batches were committed; the remainder waits for the time trigger
+        self.assertEqual(queue.flushed_total, 20)
+        self.assertEqual(queue.metrics()["queue_depth"], 5)
+        queue.stop()
+        self.assertEqual(self.store.count(), 25)
+        self.assertEqual(queue.metrics()["batches_total"], 3)
+
+    def test_time_trigger_flushes_small_batches(self):
+        queue = CommitIngestQueue(self.store, max_batch=1000, max_delay=0.05)
+        queue.start()
+        queue.submit(make_record(1))
+        deadline = time.time() + 5
+        while queue.flushed_total < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.store.count(), 1)
+        self.assertGreater(queue.metrics()["last_lag_ms"], 0)
+        queue.stop()
+
+    def test_failed_flush_spills_and_replays(self):
+        queue = CommitIngestQueue(self.store, max_batch=10, max_delay=60)
+        queue.submit(make_record(1))
+        queue.submit(make_record(2))
+        with patch.object(self.store, 'append_many', side_effect=OSError("disk full")):
+            queue.stop()
+        self.assertTrue(os.path.exists(queue.spill_path))
+        self.assertEqual(queue.failed_flushes, 1)
+
+        queue.start()
+        queue.stop()
+        self.assertFalse(os.path.exists(queue.spill_path))
+        self.assertEqual(self.store.count(), 2)
+
+    def test_spill_shared_by_workers_is_replayed_once(self):
+        worker_a = CommitIngestQueue(self.store, max_batch=10, max_delay=60)
+        worker_b = CommitIngestQueue(self.store, max_batch=10, max_delay=60)
+        worker_a.submit(make_record(1))
+        worker_b.submit(make_record(2))
+        with patch.object(self.store, 'append_many', side_effect=OSError("disk full")):
+            worker_a.stop()
+            worker_b.stop()
+        worker_a._replay_spill()
+        worker_b._replay_spill()
+        self.assertEqual(self.store.count(), 2)
+        self.assertFalse(os.path.exists(worker_a.spill_path))
+
+    def test_keyset_pagination_walks_all_rows(self):
+        self.store.append_many([make_record(i, ts=1000 + i // 2) for i in range(25)])
+        seen, cursor = [], None
+        while True:
+            items, cursor = self.store.query(cursor=cursor, limit=10)
+            seen.extend(item["id"] for item in items)
+            if cursor is None: break
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        # Newest first, ties on ts broken by id
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_query_filters_and_time_range(self):
+        self.store.append_many([
+            make_record(1, ts=100, developer="alice", risk="High"),
+            make_record(2, ts=200, developer="bob", risk="High"),
+            make_record(3, ts=300, developer="alice", risk="Low"),
+        ])
+        items, _ = self.store.query(developer_id="alice")
+        self.assertEqual([i["commit_msg"] for i in items], ["msg 3", "msg 1"])
+        items, _ = self.store.query(risk_level="High", since_ms=150, until_ms=300)
+        self.assertEqual([i["commit_msg"] for i in items], ["msg 2"])
+
+    def test_filtered_query_uses_index(self):
+        plan = self.store.connect().execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM commits WHERE developer_id = ? AND (ts, id) < (?, ?) "
+            "ORDER BY ts DESC, id DESC LIMIT 10", ("alice", 1, 1)
+        ).fetchall()
+        detail = " ".join(row[-1] for row in plan)
+        self.assertIn("idx_commits_developer", detail)
+        self.assertNotIn("TEMP B-TREE", detail)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
+    def test_sealed_partitions_are_queried_and_pruned(self):
+        week0 = partition_start(1_700_000_000_000)
+        records = [make_record(i, ts=week0 + (i // 10) * PARTITION_MS + i,
+                               developer="alice" if i % 2 else "bob") for i in range(30)]
+        self.store.append_many(records)
+        before, _ = self.store.query(limit=100)
+        rollups = sorted(self.store.rollup_rows("day", 0, 10 ** 15))
+
+        now = week0 + 2 * PARTITION_MS + 1000  # third week still open
+        self.assertEqual(self.store.seal_partitions(now), 20)
+        self.assertEqual(self.store.partition_stats()["sealed_partitions"], 2)
+        self.assertEqual(self.store.count(), 30)
+
+        seen, cursor = [], None
+        while True:
+            items, cursor = self.store.query(cursor=cursor, limit=7)
+            seen.extend(items)
+            if cursor is None: break
+        self.assertEqual([i["id"] for i in seen], [i["id"] for i in before])
+        items, _ = self.store.query(developer_id="bob", since_ms=week0 + PARTITION_MS, until_ms=week0 + 2 * PARTITION_MS)
+        self.assertEqual([i["commit_msg"] for i in items], [f"msg {i}" for i in (18, 16, 14, 12, 10)])
+        self.store.rebuild_rollups()
+        self.assertEqual(sorted(self.store.rollup_rows("day", 0, 10 ** 15)), rollups)
+
+        # A late row for a sealed week is merged into its partition
+        self.store.append_many([make_record(99, ts=week0 + 5)])
+        self.assertEqual(self.store.seal_partitions(now), 1)
+        self.assertEqual(self.store.partition_stats()["sealed_rows"], 21)
+
+        rollups = sorted(self.store.rollup_rows("day", 0, 10 ** 15))
+        self.store.retention_days = 7
+        self.assertEqual(self.store.prune(now), 11)  # only the first week ended before the cutoff
+        self.assertEqual(self.store.count(), 20)
+        self.assertEqual(sorted(self.store.rollup_rows("day", 0, 10 ** 15)), rollups)  # stats outlive raw rows
+
+    def test_rebuild_after_prune_keeps_pruned_rollups(self):
+        week0 = partition_start(1_700_000_000_000)
+        self.store.append_many([make_record(i, ts=week0 + i * 3_600_000) for i in range(10)])
+        self.store.append_many([make_record(i, ts=week0 + PARTITION_MS + i) for i in range(10, 15)])
+        now = week0 + 2 * PARTITION_MS
+        self.store.seal_partitions(now)
+        rollups = sorted(self.store.rollup_rows("day", 0, 10 ** 15))
+
+        self.store.retention_days = 7
+        self.assertEqual(self.store.prune(now), 10)
+        self.assertEqual(self.store.pruned_before(), week0 + PARTITION_MS)
+        self.store.rebuild_rollups()
+        self.assertEqual(sorted(self.store.rollup_rows("day", 0, 10 ** 15)), rollups)
+        # A late row pruned under a shorter window never moves the watermark back
+        self.store.append_many([make_record(99, ts=week0)])
+        self.store.retention_days = 3
+        self.assertEqual(self.store.prune(week0 + PARTITION_MS), 1)
+        self.assertEqual(self.store.pruned_before(), week0 + PARTITION_MS)
+
+    def test_deep_filtered_page_over_sealed_rows_opens_few_chunks(self):
+        self.store.chunk_rows = 100
+        week0 = partition_start(1_700_000_000_000)
+        self.store.append_many([make_record(i, ts=week0 + i, developer="carol" if i % 200 == 0 else "alice")
+                                for i in range(20_000)])
+        self.assertEqual(self.store.seal_partitions(week0 + PARTITION_MS), 20_000)
+        self.assertEqual(self.store.partition_stats()["sealed_chunks"], 200)
+
+        middle, _ = self.store.query(since_ms=week0 + 10_000, until_ms=week0 + 10_001)
+        deep = encode_cursor(middle[0]["ts"], middle[0]["id"])
+        unpacked = []
+        def counting_unpack(data):
+            rows = unpack_chunk(data)
+            unpacked.append(len(rows))
+            return rows
+        with patch('commit_store.unpack_chunk', side_effect=counting_unpack):
+            items, _ = self.store.query(developer_id="carol", cursor=deep, limit=5)
+            self.assertEqual([i["ts"] - week0 for i in items], [9800, 9600, 9400, 9200, 9000])
+            self.assertLessEqual(sum(unpacked), 6 * 100)  # one chunk per matching row, not the week
+            unpacked.clear()
+            items, _ = self.store.query(developer_id="carol", repo_name="repo", risk_level="Low", cursor=deep, limit=5)
+            self.assertEqual(len(items), 5)
+            self.assertLessEqual(sum(unpacked), 6 * 100)
+            unpacked.clear()
+            items, _ = self.store.query(cursor=deep, limit=50)
+            self.assertEqual(items[0]["ts"] - week0, 9999)
+            self.assertLessEqual(sum(unpacked), 2 * 100)
+
+    def test_incremental_rollups_match_rebuild(self):
+        hour = 3_600_000
+        self.store.append_many([make_record(1, ts=0, developer="alice", risk="High")])
+        self.store.append_many([
+            make_record(2, ts=10, developer="bob"),
+            make_record(3, ts=hour + 5, developer="alice"),
+        ])
+        incremental = sorted(self.store.rollup_rows("hour", 0, 10 * hour))
+        self.store.rebuild_rollups()
+        self.assertEqual(sorted(self.store.rollup_rows("hour", 0, 10 * hour)), incremental)
+
+        stats = format_rollups(incremental, "hour")
+        self.assertEqual([b["total"] for b in stats["buckets"]], [2, 1])
+        self.assertEqual(stats["totals"]["by_developer"], {"alice": 2, "bob": 1})
+        self.assertEqual(stats["buckets"][0]["by_risk"], {"High": 1, "Low": 1})
+
+    def test_pending_rollups_settle_after_flush(self):
+        pending = PendingRollups()
+        queue = CommitIngestQueue(self.store, on_flush=pending.settle)
+        record = make_record(1, ts=0)
+        pending.record(record)
+        queue.submit(record)
+        self.assertEqual(format_rollups(pending.rows("day", 0, 86_400_000), "day")["totals"]["total"], 1)
+        queue.flush()
+        self.assertEqual(pending.rows("day", 0, 86_400_000), [])
+        self.assertEqual(format_rollups(self.store.rollup_rows("day", 0, 86_400_000), "day")["totals"]["total"], 1)
+
+    def test_import_legacy_csv_once(self):
+        csv_path = os.path.join(self.tmp.name, "commit_history.csv")
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write("Timestamp,Developer,Repo,Risk,Message,AI Summary\n")
+            f.write("2025-01-01 10:00:00,alice,repo,High,fix,sum\n")
+            f.write("2025-01-01 11:30:00,bob,repo,Low,feat,sum\n")
+        self.assertEqual(self.store.import_legacy_csv(csv_path), 2)
+        self.assertEqual(self.store.import_legacy_csv(csv_path), 0)
+        self.store.rebuild_rollups()
+        rows = self.store.rollup_rows("day", 0, 10 ** 15)
+        self.assertEqual(format_rollups(rows, "day")["totals"]["by_risk"], {"High": 1, "Low": 1})
+
+    def test_import_legacy_csv_picks_up_appended_rows_only(self):
+        csv_path = os.path.join(self.tmp.name, "commit_history.csv")
+        header = "Timestamp,Developer,Repo,Risk,Message,AI Summary\n"
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write(header + "2025-01-01 10:00:00,alice,repo,High,fix,sum\n")
+        self.assertEqual(self.store.import_legacy_csv(csv_path), 1)
+        with open(csv_path, 'a', encoding='utf-8') as f:
+            f.write('2025-01-02 10:00:00,bob,repo,Low,feat,"multi\nline"\n2025-01-03 10:00:00,carol,re')
+        self.assertEqual(self.store.import_legacy_csv(csv_path), 1)  # the partial last line waits
+        with open(csv_path, 'a', encoding='utf-8') as f:
+            f.write('po,Low,docs,sum\n')
+        self.assertEqual(self.store.import_legacy_csv(csv_path), 1)
+        self.assertEqual(self.store.import_legacy_csv(csv_path), 0)
+        items, _ = self.store.query()
+        self.assertEqual([(i["developer_id"], i["ai_summary"]) for i in items],
+                         [("carol", "sum"), ("bob", "multi\nline"), ("alice", "sum")])
+
+        # A rewritten file is not imported again
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write(header + "2025-02-01 10:00:00,dave,repo,Low,x,y\n")
+        self.assertEqual(self.store.import_legacy_csv(csv_path), 0)
+        self.assertEqual(self.store.count(), 3)
+
+    def test_legacy_csv_offset_accepts_whole_file_digest(self):
+        data = b"h\nrow1\nrow2\n"
+        old = hashlib.sha256(data).hexdigest()
+        self.assertEqual(legacy_csv_offset(data + b"row3\n", old), len(data))
+        self.assertIsNone(legacy_csv_offset(b"other\n", old))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import patch, MagicMock
 import sys
 import os
+import tempfile
 
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -51,5 +52,16 @@ class TestIndexer(unittest.TestCase):
         mock_collection.add.assert_called()
         self.assertTrue(MockLoader.from_filesystem.called)
 
+    def test_embedding_cache_survives_reindex(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "embedding_cache.db")
+            compute = MagicMock(side_effect=lambda texts: [[0.5] for _ in texts])
+            indexer_template.EmbeddingCache(path).embed("embedding-3", ["chunk a", "chunk b"], compute)
+            cache = indexer_template.EmbeddingCache(path)  # next run of the indexer
+            vectors = cache.embed("embedding-3", ["chunk a", "chunk b", "chunk c"], compute)
+        self.assertEqual(vectors, [[0.5], [0.5], [0.5]])
+        self.assertEqual(compute.call_args[0][0], ["chunk c"])
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,29 @@
+import unittest
+import sys
+import os
+import tempfile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+server_path = os.path.join(project_root, 'server')
+if server_path not in sys.path:
+    sys.path.insert(0, server_path)
+
+from leader import LeaderLease
+
+class TestLeaderLease(unittest.TestCase):
+    def test_single_leader_and_failover(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "leader.lock")
+            first, second = LeaderLease(path), LeaderLease(path)
+            self.assertTrue(first.try_acquire())
+            self.assertFalse(second.try_acquire())
+            self.assertEqual(first.holder_pid(), os.getpid())
+            first.release()
+            self.assertFalse(first.is_leader)
+            self.assertTrue(second.try_acquire())
+            self.assertTrue(second.is_leader)
+            second.release()
+
+if __name__ == '__main__':
+    unittest.main()
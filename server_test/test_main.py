@@ -3,6 +3,8 @@ from unittest.mock import patch, MagicMock, mock_open
 import sys
 import os
 import json
+import tempfile
+import threading
 from datetime import timezone
 
 # Add server directory to path to import main
@@ -27,8 +29,18 @@ class TestServerMain(unittest.TestCase):
         self.mock_get_localzone.return_value = timezone.utc
         import main
         self.main_module = main
+        main._config_snapshot = None
+        main.script_bundles.clear()
+        self.leader_patcher = patch.object(main, 'leader', MagicMock(is_leader=True))
+        self.leader_patcher.start()
         self.client = TestClient(main.app)
-        
+
+    def tearDown(self):
+        self.tz_patcher.stop()
+        self.leader_patcher.stop()
+        self.main_module._config_snapshot = None
+        self.main_module.script_bundles.clear()
+
     @patch('main.os.path.exists')
     @patch('builtins.open', new_callable=mock_open, read_data='{"template_format": "test"}')
     def test_get_config(self, mock_file, mock_exists):
@@ -37,6 +49,57 @@ class TestServerMain(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()['template_format'], "test")
 
+    def test_get_config_etag_revalidation(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config_path = os.path.join(tmp, "server_config.json")
+            with patch('main.CONFIG_FILE_PATH', config_path):
+                self.main_module.save_config_to_disk({"template_format": "v1", "custom_rules": "r"})
+                first = self.client.get("/api/v1/config")
+                self.assertEqual(first.status_code, 200)
+                etag = first.headers["etag"]
+                self.assertTrue(etag.startswith('"'))
+
+                cached = self.client.get("/api/v1/config", headers={"If-None-Match": etag})
+                self.assertEqual(cached.status_code, 304)
+                self.assertEqual(cached.content, b"")
+
+                # Saving new content invalidates the snapshot and changes the ETag
+                self.main_module.save_config_to_disk({"template_format": "v2", "custom_rules": "r"})
+                changed = self.client.get("/api/v1/config", headers={"If-None-Match": etag})
+                self.assertEqual(changed.status_code, 200)
+                self.assertEqual(changed.json()["template_format"], "v2")
+                self.assertNotEqual(changed.headers["etag"], etag)
+                self.assertEqual(changed.headers["x-config-version"], changed.headers["etag"].strip('"'))
+                self.assertNotEqual(changed.headers["x-config-version"], first.headers["x-config-version"])
+
+                # Another worker (or a restart) reports the same version for the same content
+                self.main_module._config_snapshot = None
+                again = self.client.get("/api/v1/config")
+                self.assertEqual(again.headers["x-config-version"], changed.headers["x-config-version"])
+
+    def test_config_long_poll_returns_on_change(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config_path = os.path.join(tmp, "server_config.json")
+            with patch('main.CONFIG_FILE_PATH', config_path), patch('main.CONFIG_WATCH_POLL_SECONDS', 0.02):
+                self.main_module.save_config_to_disk({"template_format": "v1", "custom_rules": "r"})
+                etag = self.client.get("/api/v1/config").headers["etag"]
+                idle = self.client.get("/api/v1/config", params={"wait": 1}, headers={"If-None-Match": etag})
+                # Written by "another worker" while the request is held
+                timer = threading.Timer(0.2, self.main_module.save_config_to_disk,
+                                        ({"template_format": "v2", "custom_rules": "r"},))
+                timer.start()
+                changed = self.client.get("/api/v1/config", params={"wait": 30}, headers={"If-None-Match": etag})
+                timer.join()
+        self.assertEqual(idle.status_code, 304)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["template_format"], "v2")
+        self.assertEqual(self.main_module._config_watchers, 0)
+
+    def test_etag_matches(self):
+        self.assertTrue(self.main_module.etag_matches('"a", W/"b"', '"b"'))
+        self.assertTrue(self.main_module.etag_matches('*', '"b"'))
+        self.assertFalse(self.main_module.etag_matches(None, '"b"'))
+        self.assertFalse(self.main_module.etag_matches('"c"', '"b"'))
 
     @patch('main.os.path.exists')
     @patch('builtins.open', new_callable=mock_open, read_data='print("hello")')
@@ -47,6 +110,269 @@ class TestServerMain(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()['code'], 'print("hello")')
 
+    def test_track_commit_enqueues_record(self):
+        payload = {"developer_id": "dev", "repo_name": "repo", "commit_msg": "fix",
+                   "risk_level": "Low", "ai_summary": "sum"}
+        with patch.object(self.main_module, 'ingest_queue', MagicMock(depth=0)) as mock_queue:
+            response = self.client.post("/api/v1/track", json=payload)
+        self.assertEqual(response.status_code, 200)
+        record = mock_queue.submit.call_args[0][0]
+        self.assertEqual(record["developer_id"], "dev")
+        self.assertIn("ts", record)
+
+    def test_track_rate_limits_and_sheds_load(self):
+        from rate_limit import TokenBucketLimiter, AdmissionController
+        record = {"developer_id": "loop", "repo_name": "repo", "commit_msg": "fix",
+                  "risk_level": "Low", "ai_summary": "sum"}
+        body = "\n".join(json.dumps(dict(record, commit_msg=f"m{i}")) for i in range(3)) + "\n"
+        queue = MagicMock(depth=0)
+        with patch.object(self.main_module, 'ingest_queue', queue), \
+             patch.object(self.main_module, 'developer_limiter', TokenBucketLimiter(rate=0.1, burst=2)), \
+             patch.object(self.main_module, 'repo_limiter', TokenBucketLimiter(rate=100, burst=100)), \
+             patch.object(self.main_module, 'ingest_admission', AdmissionController(lambda: queue.depth, 10)):
+            batch = self.client.post("/api/v1/track/batch", content=body)
+            limited = self.client.post("/api/v1/track", json=record)
+            other = self.client.post("/api/v1/track", json=dict(record, developer_id="alice"))
+            queue.depth = 10
+            shed = self.client.post("/api/v1/track", json=dict(record, developer_id="bob"))
+        self.assertEqual(batch.status_code, 200)
+        self.assertEqual((batch.json()["accepted"], batch.json()["resume_from_line"]), (2, 3))
+        self.assertEqual(batch.headers["retry-after"], "10")
+        self.assertEqual((limited.status_code, limited.headers["retry-after"]), (429, "10"))
+        self.assertIn("developer 'loop'", limited.json()["detail"])
+        self.assertEqual(other.status_code, 200)
+        self.assertEqual((shed.status_code, shed.headers["retry-after"]), (503, "5"))
+        self.assertEqual(queue.submit.call_count, 3)
+
+    def test_list_commits_paginates(self):
+        from commit_store import CommitLogStore
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CommitLogStore(os.path.join(tmp, "commits.db"))
+            store.append_many([
+                {"ts": 1_700_000_000_000 + i, "developer_id": "dev", "repo_name": "repo",
+                 "risk_level": "Low", "commit_msg": f"m{i}", "ai_summary": ""}
+                for i in range(3)
+            ])
+            with patch.object(self.main_module, 'commit_store', store):
+                first = self.client.get("/api/v1/commits", params={"developer_id": "dev", "limit": 2}).json()
+                second = self.client.get("/api/v1/commits", params={"cursor": first["next_cursor"], "limit": 2}).json()
+                bad = self.client.get("/api/v1/commits", params={"cursor": "???"})
+            store.close()
+        self.assertEqual([i["commit_msg"] for i in first["items"]], ["m2", "m1"])
+        self.assertEqual([i["commit_msg"] for i in second["items"]], ["m0"])
+        self.assertIsNone(second["next_cursor"])
+        self.assertEqual(bad.status_code, 400)
+
+    def test_leader_imports_legacy_csv_history(self):
+        from commit_store import CommitLogStore
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, "commit_history.csv")
+            with open(csv_path, 'w', encoding='utf-8') as f:
+                f.write("Timestamp,Developer,Repo,Risk,Message,AI Summary\n")
+                f.write("2025-01-01 10:00:00,alice,repo,High,fix,sum\n")
+            store = CommitLogStore(os.path.join(tmp, "commits.db"))
+            with patch.object(self.main_module, 'commit_store', store), \
+                 patch.object(self.main_module, 'LOG_FILE_PATH', csv_path):
+                self.main_module.import_legacy_commit_log()
+                self.main_module.import_legacy_commit_log()  # leader restart: not imported twice
+                items = self.client.get("/api/v1/commits").json()["items"]
+            store.close()
+        self.assertEqual([(i["developer_id"], i["commit_msg"]) for i in items], [("alice", "fix")])
+
+    def test_stats_include_unflushed_commits(self):
+        from commit_store import PendingRollups
+        payload = {"developer_id": "dev", "repo_name": "repo", "commit_msg": "fix",
+                   "risk_level": "High", "ai_summary": "sum"}
+        with patch.object(self.main_module, 'ingest_queue', MagicMock(depth=0)), \
+             patch.object(self.main_module, 'pending_rollups', PendingRollups()), \
+             patch.object(self.main_module.commit_store, 'rollup_rows', return_value=[]):
+            self.client.post("/api/v1/track", json=payload)
+            stats = self.client.get("/api/v1/stats", params={"granularity": "day"}).json()
+            bad = self.client.get("/api/v1/stats", params={"granularity": "week"})
+        self.assertEqual(stats["totals"]["total"], 1)
+        self.assertEqual(stats["totals"]["by_risk"], {"High": 1})
+        self.assertEqual(bad.status_code, 422)
+
+    def test_track_batch_reports_per_record_results(self):
+        good = {"developer_id": "dev", "repo_name": "repo", "commit_msg": "fix",
+                "risk_level": "Low", "ai_summary": "sum", "timestamp": "2025-01-01T10:00:00+00:00"}
+        body = json.dumps(good) + "\n\n" + '{"developer_id": "dev"}\n' + "not json\n" + json.dumps(good)
+
+        def chunks():
+            # Split mid-line to exercise incremental parsing
+            data = body.encode()
+            for i in range(0, len(data), 7):
+                yield data[i:i + 7]
+
+        with patch.object(self.main_module, 'ingest_queue', MagicMock(depth=0)) as mock_queue:
+            response = self.client.post("/api/v1/track/batch", content=chunks(),
+                                        headers={"Content-Type": "application/x-ndjson"})
+        result = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((result["accepted"], result["rejected"]), (2, 2))
+        self.assertEqual([r["line"] for r in result["results"]], [1, 3, 4, 5])
+        self.assertEqual([r["status"] for r in result["results"]], ["recorded", "rejected", "rejected", "recorded"])
+        self.assertEqual(mock_queue.submit.call_count, 2)
+        self.assertEqual(mock_queue.submit.call_args[0][0]["ts"], 1735725600000)
+
+    def test_track_batch_rejects_oversized_line(self):
+        body = b"x" * (self.main_module.BATCH_MAX_LINE_BYTES + 10) + b"\n"
+        with patch.object(self.main_module, 'ingest_queue', MagicMock(depth=0)):
+            result = self.client.post("/api/v1/track/batch", content=body).json()
+        self.assertEqual(result["rejected"], 1)
+        self.assertIn("exceeds", result["results"][0]["error"])
+
+    def test_script_manifest_and_immutable_bundle(self):
+        from script_bundles import ScriptBundleRegistry
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "a.py"), "w", encoding="utf-8") as f:
+                f.write("print('v1')\n" * 50)
+            registry = ScriptBundleRegistry(tmp, {"analyzer": "a.py"})
+            with patch.object(self.main_module, 'script_bundles', registry):
+                manifest = self.client.get("/api/v1/scripts/manifest")
+                entry = manifest.json()["scripts"]["analyzer"]
+                not_modified = self.client.get("/api/v1/scripts/manifest",
+                                               headers={"If-None-Match": manifest.headers["etag"]})
+
+                bundle = self.client.get(entry["url"], headers={"Accept-Encoding": "gzip"})
+                missing = self.client.get("/api/v1/scripts/analyzer/deadbeef")
+
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(bundle.status_code, 200)
+        self.assertIn("immutable", bundle.headers["cache-control"])
+        self.assertEqual(bundle.headers["etag"], f'"{entry["sha256"]}"')
+        self.assertEqual(bundle.headers["content-encoding"], "gzip")
+        # httpx transparently decodes the gzip body
+        self.assertEqual(bundle.content, b"print('v1')\n" * 50)
+        self.assertEqual(missing.status_code, 404)
+
+    def test_bundle_encoding_negotiation(self):
+        from script_bundles import ScriptBundle
+        bundle = ScriptBundle("analyzer", b"x" * 100, None)
+        self.assertEqual(bundle.negotiate("gzip;q=0, identity")[0], "identity")
+        self.assertEqual(bundle.negotiate(None)[0], "identity")
+        encoding, body = bundle.negotiate("deflate, gzip")
+        self.assertEqual(encoding, "gzip")
+        self.assertLess(len(body), 100)
+
+    def test_ci_run_enqueues_job(self):
+        from ci_engine import CIJobQueue
+        queue = CIJobQueue("ws", "state", MagicMock(), MagicMock())
+        config = {"github_repo_url": "https://example.com/repo.git", "ci_timeout_minutes": 5}
+        with patch.object(self.main_module, 'ci_queue', queue), \
+             patch.object(self.main_module, 'ci_repos', MagicMock(list=MagicMock(return_value=[]))), \
+             patch.object(self.main_module, 'load_config_from_disk', return_value=config):
+            first = self.client.post("/api/v1/ci/run").json()
+            second = self.client.post("/api/v1/ci/run").json()
+            job = self.client.get(f"/api/v1/ci/jobs/{first['job_id']}").json()
+            cancelled = self.client.post(f"/api/v1/ci/jobs/{first['job_id']}/cancel").json()
+            missing = self.client.get("/api/v1/ci/jobs/nope")
+        self.assertEqual(first["status"], "Triggered")
+        self.assertFalse(first["coalesced"])
+        self.assertEqual(second["job_id"], first["job_id"])
+        self.assertTrue(second["coalesced"])
+        self.assertEqual((job["status"], job["timeout_s"]), ("queued", 300))
+        self.assertEqual(cancelled["status"], "cancelled")
+        self.assertEqual(missing.status_code, 404)
+
+    def test_ci_follower_forwards_commands_to_leader(self):
+        from ci_engine import CIJobQueue
+        from ci_store import CIRunStore
+        config = {"github_repo_url": "https://example.com/repo.git"}
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CIRunStore(os.path.join(tmp, "ci_runs.db"))
+            queue = CIJobQueue("ws", "state", store, MagicMock(), on_update=self.main_module.mirror_ci_job)
+            with patch.object(self.main_module, 'ci_store', store), \
+                 patch.object(self.main_module, 'ci_queue', queue), \
+                 patch.object(self.main_module, 'ci_repos', MagicMock(list=MagicMock(return_value=[]))), \
+                 patch.object(self.main_module, 'load_config_from_disk', return_value=config), \
+                 patch.object(self.main_module, 'CI_COMMAND_WAIT_SECONDS', 0.2):
+                self.main_module.leader.is_leader = False
+                accepted = self.client.post("/api/v1/ci/run").json()
+                self.main_module.process_ci_commands()  # leader's inbox tick
+                result = store.command_result(accepted["command_id"])
+                jobs = self.client.get("/api/v1/ci/jobs").json()["jobs"]
+                job = self.client.get(f"/api/v1/ci/jobs/{result['job_id']}").json()
+                repos = self.client.get("/api/v1/ci/repos").json()
+                scrape = self.client.get("/metrics").text
+        self.assertEqual(accepted["status"], "Accepted")
+        self.assertEqual(result["status"], "Triggered")
+        self.assertEqual([j["job_id"] for j in jobs], [result["job_id"]])
+        self.assertEqual(job["status"], "queued")
+        # Queue state comes from the leader's snapshot, leader-only gauges are omitted
+        self.assertEqual((repos["queued"], repos["running"]), (1, 0))
+        self.assertIsNotNone(repos["state_as_of"])
+        # A follower answering the scrape reports the leader's CI gauges, its own counters by pid
+        self.assertIn("\ngitguard_ci_queue_depth 1\n", scrape)
+        self.assertIn(f'gitguard_leader{{worker="{os.getpid()}"}} 0\n', scrape)
+
+    def test_ci_log_range_download_and_stream(self):
+        from ci_logs import CILogStore
+        with tempfile.TemporaryDirectory() as tmp:
+            logs = CILogStore(tmp, segment_bytes=8, max_segments=2)
+            writer = logs.open("abc123")
+            writer.write(b"line one\nline two\nlast")  # 22 bytes, first segment rotated out
+            writer.close()
+            with patch.object(self.main_module, 'ci_logs', logs):
+                full = self.client.get("/api/v1/ci/runs/abc123/log")
+                part = self.client.get("/api/v1/ci/runs/abc123/log", headers={"Range": "bytes=-4"})
+                bad = self.client.get("/api/v1/ci/runs/abc123/log", headers={"Range": "bytes=0-3"})
+                stream = self.client.get("/api/v1/ci/runs/abc123/log/stream", headers={"Last-Event-ID": "9"})
+                missing = self.client.get("/api/v1/ci/runs/../log")
+        self.assertEqual((full.status_code, full.content), (200, b"\nline two\nlast"))
+        self.assertEqual(full.headers["x-log-start-offset"], "8")
+        self.assertEqual((part.status_code, part.content), (206, b"last"))
+        self.assertEqual(part.headers["content-range"], "bytes 18-21/22")
+        self.assertEqual((bad.status_code, bad.headers["content-range"]), (416, "bytes */22"))
+        self.assertIn("id: 18\ndata: line two\n\n", stream.text)
+        self.assertIn("id: 22\ndata: last\n\nevent: end", stream.text)
+        self.assertEqual(missing.status_code, 404)
+
+    def test_ci_repo_registry_and_backpressure(self):
+        from ci_engine import CIJobQueue
+        from ci_scheduler import CIRepoRegistry, FairCIScheduler
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = CIRepoRegistry(os.path.join(tmp, "ci_runs.db"))
+            queue = CIJobQueue("ws", "state", MagicMock(), MagicMock(), max_queued=1)
+            config = {"github_repo_url": "https://example.com/legacy.git", "ci_interval_minutes": 15}
+            with patch.object(self.main_module, 'ci_repos', registry), \
+                 patch.object(self.main_module, 'ci_queue', queue), \
+                 patch.object(self.main_module, 'ci_scheduler', FairCIScheduler(queue, self.main_module.configured_ci_repos)), \
+                 patch.object(self.main_module, 'load_config_from_disk', return_value=config):
+                added = self.client.put("/api/v1/ci/repos", json={"repo_url": "https://example.com/a.git", "interval_minutes": 5})
+                repos = self.client.get("/api/v1/ci/repos").json()
+                first = self.client.post("/api/v1/ci/run", params={"repo_url": "https://example.com/a.git"})
+                full = self.client.post("/api/v1/ci/run")
+                unknown = self.client.post("/api/v1/ci/run", params={"repo_url": "https://example.com/x.git"}).json()
+                deleted = self.client.delete("/api/v1/ci/repos", params={"repo_url": "https://example.com/a.git"})
+                missing = self.client.delete("/api/v1/ci/repos", params={"repo_url": "https://example.com/a.git"})
+        self.assertEqual(added.json()["interval_minutes"], 5)
+        self.assertEqual({r["repo_url"]: r["interval_minutes"] for r in repos["repos"]},
+                         {"https://example.com/a.git": 5, "https://example.com/legacy.git": 15})
+        self.assertEqual(first.json()["status"], "Triggered")
+        self.assertEqual((full.status_code, full.headers["retry-after"]), (503, "60"))
+        self.assertEqual(unknown["status"], "Error")
+        self.assertEqual((deleted.status_code, missing.status_code), (200, 404))
+
+    def test_metrics_endpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch('main.CONFIG_FILE_PATH', os.path.join(tmp, "server_config.json")):
+                etag = self.client.get("/api/v1/config").headers["etag"]
+                self.client.get("/api/v1/config", headers={"If-None-Match": etag})
+                self.client.get("/api/v1/ci/jobs/missing")
+                response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        text = response.text
+        worker = f'worker="{os.getpid()}"'
+        self.assertIn('gitguard_http_request_duration_seconds_count{method="GET",route="/api/v1/config",status="304",'
+                      + worker + '}', text)
+        self.assertIn('route="/api/v1/ci/jobs/{job_id}",status="404"', text)
+        self.assertIn('gitguard_config_cache_lookups_total{result="hit",' + worker + '}', text)
+        self.assertIn("gitguard_ingest_queue_depth{" + worker + "} ", text)
+        self.assertIn("gitguard_ci_scheduler_overdue_seconds ", text)
+        self.assertNotIn('route="/metrics"', text)
+
     def test_get_script_invalid_name(self):
         response = self.client.get("/api/v1/scripts/hacker_script")
         self.assertEqual(response.status_code, 404)
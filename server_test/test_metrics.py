@@ -0,0 +1,54 @@
+import unittest
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+server_path = os.path.join(project_root, 'server')
+if server_path not in sys.path:
+    sys.path.insert(0, server_path)
+
+from metrics import MetricsRegistry
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_and_callbacks_render(self):
+        hits = self.registry.counter("hits_total", "Hits.", ("result",))
+        hits.inc("hit")
+        hits.inc("hit", amount=2)
+        hits.inc('mi"ss')
+        self.registry.gauge_fn("depth", "Depth.", lambda: 7)
+        self.registry.gauge_fn("broken", "Broken.", lambda: 1 / 0)
+        text = self.registry.render()
+        self.assertIn("# TYPE hits_total counter\n", text)
+        self.assertIn('hits_total{result="hit"} 3\n', text)
+        self.assertIn('hits_total{result="mi\\"ss"} 1\n', text)
+        self.assertIn("depth 7\n", text)
+        self.assertIn("# TYPE broken gauge\n", text)  # a failing callback only drops its samples
+
+    def test_histogram_buckets_are_cumulative(self):
+        latency = self.registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            latency.observe(value, "/a")
+        text = self.registry.render()
+        self.assertIn('latency_seconds_bucket{route="/a",le="0.1"} 2\n', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="1.0"} 3\n', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="+Inf"} 4\n', text)
+        self.assertIn('latency_seconds_sum{route="/a"} 3.65\n', text)
+        self.assertIn('latency_seconds_count{route="/a"} 4\n', text)
+
+    def test_const_labels_skip_shared_metrics(self):
+        registry = MetricsRegistry(const_labels={"worker": "42"})
+        hits = registry.counter("hits_total", "Hits.", ("result",))
+        hits.inc("hit")
+        registry.gauge_fn("depth", "Depth.", lambda: 7)
+        registry.gauge_fn("queued", "Queued.", lambda: 3, shared=True)
+        text = registry.render()
+        self.assertIn('hits_total{result="hit",worker="42"} 1\n', text)
+        self.assertIn('depth{worker="42"} 7\n', text)
+        self.assertIn("queued 3\n", text)
+
+if __name__ == '__main__':
+    unittest.main()
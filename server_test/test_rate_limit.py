@@ -0,0 +1,42 @@
+import unittest
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+server_path = os.path.join(project_root, 'server')
+if server_path not in sys.path:
+    sys.path.insert(0, server_path)
+
+from rate_limit import TokenBucketLimiter, AdmissionController, retry_after_header
+
+class TestRateLimit(unittest.TestCase):
+    def test_bucket_allows_burst_then_refills(self):
+        limiter = TokenBucketLimiter(rate=2, burst=3)
+        self.assertEqual([limiter.acquire("alice", now=0) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(limiter.acquire("alice", now=0), 0.5)
+        self.assertEqual(limiter.acquire("bob", now=0), 0.0)  # buckets are per key
+        self.assertEqual(limiter.acquire("alice", now=0.5), 0.0)
+        limiter.refund("alice")
+        self.assertEqual(limiter.acquire("alice", now=0.5), 0.0)
+
+    def test_least_recently_used_keys_are_evicted(self):
+        limiter = TokenBucketLimiter(rate=1, burst=1, max_keys=2)
+        for key in ("a", "b", "c"):
+            limiter.acquire(key, now=0)
+        self.assertEqual(limiter.acquire("a", now=0), 0.0)  # forgotten, so full again
+        self.assertGreater(limiter.acquire("c", now=0), 0)
+
+    def test_admission_sheds_by_share(self):
+        depth = [40]
+        admission = AdmissionController(lambda: depth[0], max_depth=100)
+        self.assertFalse(admission.overloaded())
+        self.assertFalse(admission.overloaded(0.5))
+        depth[0] = 60
+        self.assertTrue(admission.overloaded(0.5))
+        self.assertFalse(admission.overloaded())
+        self.assertEqual(retry_after_header(0.2), "1")
+        self.assertEqual(retry_after_header(2.1), "3")
+
+if __name__ == '__main__':
+    unittest.main()